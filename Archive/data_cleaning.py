@@ -6,40 +6,16 @@ import calendar
 from wordcloud import WordCloud, STOPWORDS
 import collections
 
-conversation = pd.read_json("conversations.json")
-saver = []
-
-df_map_col = conversation["mapping"]
-length = len(df_map_col)
-
-for i in range(length):
-    data = df_map_col[i]
-
-    for key, value in data.items():
-        if not isinstance(value, dict):
-            continue
-
-        message = value.get("message")
-        if not isinstance(message, dict):
-            continue
-
-        if message["author"]["role"] != "user":
-            continue
-
-        content = message.get("content")
-        if not isinstance(content, dict):
-            continue
-
-        timestamp = message["create_time"]
-
-        parts = content.get("parts")
-        if isinstance(parts, list):
-            for p in parts:
-                if isinstance(p, str) and p.strip():
-                    saver.append((p, timestamp))
-
-print(len(saver))
-df = pd.DataFrame(saver, columns=["Prompt", "Timestamp"])
+# Prompts come from the shared columnar store instead of re-parsing
+# conversations.json; build it once from BE/ with
+#   python -m services.prompt_store <export.zip> --out ../Archive/prompts.arrow
+import sys
+sys.path.insert(0, "../BE")
+from services.prompt_store import read_prompts
+
+df = read_prompts("prompts.arrow", columns=["prompt", "timestamp"]).to_pandas()
+df.columns = ["Prompt", "Timestamp"]
+print(len(df))
 
 # Monthly Data #
 
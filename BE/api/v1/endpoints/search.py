@@ -1,321 +1,116 @@
-from typing import List
-from fastapi import APIRouter, HTTPException, UploadFile, File
-from datetime import datetime
+import asyncio
 import json
-from zipfile import ZipFile, BadZipFile
-import io
-from collections import Counter, defaultdict
+import os
+from typing import Optional, Tuple
+from zipfile import BadZipFile
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-from schemas.search import WrappedResponse, KeywordFrequency, MonthFrequency
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+
+from schemas.search import WrappedResponse, JobStatus
+from core.config import ADMISSION_MAX_WAIT_SECONDS, DEFAULT_TARGET_YEAR, DEFAULT_TIMEZONE
+from services.admission import Ticket, export_cost, get_admission_controller
+from services.jobs import get_job_manager
+from services.pipeline import (
+    analyze_export, check_archive, conversations_bytes, export_digest, is_cached, stored_response,
+)
+from services.text import get_lemma_cache
+from services.uploads import open_export, receive_upload, remove_upload
 
 router = APIRouter()
 
-import pandas as pd
-import numpy as np
-import re
-import nltk
-from sklearn.feature_extraction.text import TfidfVectorizer
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
-from a2t.base import EntailmentClassifier
-from a2t.tasks import TopicClassificationTask, TopicClassificationFeatures
+# How often the event stream checks a job for changes
+JOB_EVENT_POLL_SECONDS = 0.25
 
-nltk.download("stopwords", quiet=True)
-nltk.download("wordnet", quiet=True)
+# Uploads are streamed out of the body by receive_upload instead of an
+# UploadFile parameter, so the form is described for the docs here
+UPLOAD_FORM = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary", "description": "ChatGPT data export ZIP"}},
+                }
+            }
+        },
+    }
+}
 
-# Initialize topic classification model (singleton pattern)
-_topic_classifier = None
-_topic_task = None
+@router.get("/lemma-cache")
+async def lemma_cache_stats():
+    """Hit/miss counters of the process-wide lemma cache, for sizing LEMMA_CACHE_SIZE."""
+    return get_lemma_cache().stats()
 
-def get_topic_classifier():
-    global _topic_classifier, _topic_task
-    if _topic_classifier is None:
-        labels = [
-            "Technology",
-            "Data Analysis",
-            "Natural Language Processing",
-            "Education",
-            "Personal Development",
-            "Literature and Books",
-            "Finance and Economics",
-            "Programming",
-            "Philosophy",
-            "General Knowledge"
-        ]
-        _topic_task = TopicClassificationTask(
-            name="Prompt Topic Classification",
-            labels=labels,
-            hypothesis_template="This prompt is about {label}."
-        )
-        _topic_classifier = EntailmentClassifier(
-            'roberta-large-mnli',
-            use_cuda=False,
-            half=False
-        )
-    return _topic_classifier, _topic_task
+def _validate_timezone(timezone: str):
+    try:
+        ZoneInfo(timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Unknown timezone: {timezone}")
 
-def process_text(df, field):
-    df[field] = df[field].str.lower()
+async def _receive_zip(request: Request) -> str:
+    """Receive the uploaded export to disk; 400 unless it is named like a ZIP."""
+    zip_path, filename = await receive_upload(request)
+    if not filename.endswith('.zip'):
+        remove_upload(zip_path)
+        raise HTTPException(status_code=400, detail="File must be a ZIP archive")
+    return zip_path
 
-    for i in range(len(df)):
-        post_temp = df._get_value(i, field)
-        pattern = re.compile(r'https?://[a-zA-Z0-9./-]*/[a-zA-Z0-9?=_.]*[_0-9.a-zA-Z/-]*')    #to match url links present in the post
-        post_temp= re.sub(pattern, ' ', post_temp)                                            #to replace that url link with space
-        df._set_value(i, field,post_temp)
-    
-    for i in range(len(df)):
-        post_temp=df._get_value(i, field)
-        pattern = re.compile(r'[0-9]')                                    #to match numbers from 0 to 9
-        post_temp= re.sub(pattern, ' ', post_temp)                        #to replace them with space
-        pattern = re.compile('\W+')                                       #to match alphanumeric characters
-        post_temp= re.sub(pattern, ' ', post_temp)                        #to replace them with space
-        pattern = re.compile(r'[_+]')
-        post_temp= re.sub(pattern, ' ', post_temp)
-        df._set_value(i, field,post_temp)
-    
-    for i in range(len(df)):
-        post_temp=df._get_value(i, field)
-        pattern = re.compile('\s+')                                     #to match multiple whitespaces
-        post_temp= re.sub(pattern, ' ', post_temp)                      #to replace them with single whitespace
-        df._set_value(i, field, post_temp)
+def _admit(
+    upload_bytes: int, conversations_bytes: int, max_wait: Optional[float], reserve: bool = False
+) -> Optional[Ticket]:
+    """Queue (or only reserve room for) an analysis by its cost; 429 at once when the queue is full."""
+    controller = get_admission_controller()
+    if controller is None:
+        return None
+    cost = export_cost(upload_bytes, conversations_bytes, controller.capacity)
+    return controller.reserve(cost, max_wait) if reserve else controller.enqueue(cost, max_wait)
 
-    remove_words = stopwords.words("english")
-    for i in range(df.shape[0]):
-        post_temp=df._get_value(i, field)
-        post_temp=" ".join([w for w in post_temp.split(' ') if w not in remove_words])    #to remove stopwords
-        df._set_value(i, field, post_temp)
-    
-    lemmatizer = WordNetLemmatizer()
-    for i in range(df.shape[0]):
-        post_temp=df._get_value(i, field)
-        post_temp=" ".join([lemmatizer.lemmatize(w) for w in post_temp.split(' ')])   #to implement lemmetization i.e. to group together different forms of a word
-        df._set_value(i, field, post_temp)
-    
-    return df
+def _analyze_upload(zip_path: str, year: int, timezone: str):
+    with open_export(zip_path) as zip_file:
+        # Only analyses no cache answers take a place in the queue
+        return analyze_export(
+            zip_file, year, timezone,
+            admit=lambda: _admit(os.path.getsize(zip_path), conversations_bytes(zip_file), ADMISSION_MAX_WAIT_SECONDS),
+        )
 
-@router.post("/search-history", response_model=WrappedResponse)
-async def analyze_chatgpt_history(file: UploadFile = File(...)):
+def _admit_job(zip_path: str, year: int, timezone: str) -> Tuple[str, Optional[Ticket]]:
+    """
+    The export id of a spooled upload and, unless a cache already answers
+    it, room reserved in the analysis queue. The job joins the queue when a
+    job worker picks it up.
+    """
+    with open_export(zip_path) as zip_file:
+        check_archive(zip_file)
+        export_id = export_digest(zip_file)
+        if is_cached(export_id, year, timezone):
+            return export_id, None
+        return export_id, _admit(os.path.getsize(zip_path), conversations_bytes(zip_file), None, reserve=True)
+
+@router.post("/search-history", response_model=WrappedResponse, openapi_extra=UPLOAD_FORM)
+async def analyze_chatgpt_history(
+    request: Request,
+    year: int = Query(DEFAULT_TARGET_YEAR, description="Calendar year to summarize"),
+    timezone: str = Query(DEFAULT_TIMEZONE, description="IANA timezone the year and hours are bucketed in"),
+):
     """
     Upload a ZIP file of ChatGPT data export.
     Parses conversations.json from openai folder and returns comprehensive analytics.
+    Suited to small exports; large ones should go through /search-history/jobs.
     """
-    if not file.filename.endswith('.zip'):
-        raise HTTPException(status_code=400, detail="File must be a ZIP archive")
-    
+    _validate_timezone(timezone)
+
+    # Stream the upload to disk, then run the CPU-bound analysis off the event loop
+    zip_path = await _receive_zip(request)
     try:
-        # Read ZIP file
-        zip_content = await file.read()
-        zip_file = ZipFile(io.BytesIO(zip_content))
-        
-        # Find conversations.json (either in openai folder or root)
-        conversations_data = None
-        for filename in zip_file.namelist():
-            if filename.endswith('conversations.json'):
-                with zip_file.open(filename) as f:
-                    conversations_data = json.load(f)
-                break
-        
-        if not conversations_data:
-            raise HTTPException(status_code=400, detail="No conversations.json found in ZIP")
-        
-        # Extract user prompts using the mapping structure
-        saver = []
-        
-        for conv in conversations_data:
-            # Handle both array and object structures
-            if isinstance(conv, list):
-                # If conversations_data is already an array of messages
-                for item in conv:
-                    if isinstance(item, dict) and item.get("role") == "user":
-                        text = item.get("content", item.get("text", ""))
-                        timestamp = item.get("create_time", item.get("timestamp", 0))
-                        if text and isinstance(text, str) and text.strip() and timestamp:
-                            saver.append((text, float(timestamp)))
-                continue
-            
-            if not isinstance(conv, dict):
-                continue
-                
-            mapping = conv.get("mapping", {})
-            
-            for key, value in mapping.items():
-                if not isinstance(value, dict):
-                    continue
-                
-                message = value.get("message")
-                if not isinstance(message, dict):
-                    continue
-                
-                # Only process user messages
-                if message.get("author", {}).get("role") != "user":
-                    continue
-                
-                content = message.get("content")
-                if not isinstance(content, dict):
-                    continue
-                
-                create_time = message.get("create_time", 0)
-                if not create_time:
-                    continue
-                
-                timestamp = float(create_time)
-                
-                parts = content.get("parts")
-                if isinstance(parts, list):
-                    for p in parts:
-                        if isinstance(p, str) and p.strip():
-                            saver.append((p, timestamp))
-        
-        if not saver:
-            raise HTTPException(status_code=400, detail="No user prompts found in conversations")
-        
-        df = pd.DataFrame(saver, columns=["prompt", "timestamp"])
-        
-        # Convert Unix to Datetime (SGT) - same as data_cleaning.py
-        df['datetime'] = pd.to_datetime(df['timestamp'], unit='s')
-        df['datetime'] = df['datetime'].dt.tz_localize('UTC').dt.tz_convert('Asia/Singapore')
-        
-        # Extract features for filtering - same as data_cleaning.py
-        df['Year'] = df['datetime'].dt.year
-        df['Hour'] = df['datetime'].dt.hour
-        
-        df = process_text(df, "prompt")
-        
-        # Set the year to analyze (last complete year) - same as data_cleaning.py
-        target_year = 2025
-        df_yearly = df[df['Year'] == target_year].copy()
-        total_searches = len(df_yearly)
-        
-        all_words = []
-        for prompt in df_yearly["prompt"]:
-            if isinstance(prompt, str):
-                all_words.extend(prompt.split())
-        
-        # Classify topics using a2t on the same target year prompts
-        classifier, task = get_topic_classifier()
-        original_prompts = [text for text, ts in saver if isinstance(ts, (int, float)) and pd.to_datetime(ts, unit='s').year == target_year]
-        
-        # Get top topic via classification
-        if original_prompts:
-            # Sample up to 100 recent prompts for topic classification
-            sample_prompts = original_prompts[:min(100, len(original_prompts))]
-            truncated_samples = [p[:500] for p in sample_prompts]  # Truncate long prompts
-            
-            topic_features = [TopicClassificationFeatures(context=text, label=None) for text in truncated_samples]
-            results = classifier(
-                task=task,
-                features=topic_features,
-                return_labels=True,
-                return_confidences=True
-            )
-            # Handle different return formats from classifier
-            if isinstance(results, tuple):
-                if len(results) == 2:
-                    topics, confidences = results
-                else:
-                    topics = results[0]
-            else:
-                topics = results
-            
-            # Extract just the labels if topics are tuples
-            if topics and isinstance(topics[0], tuple):
-                topics = [t[0] if isinstance(t, tuple) else t for t in topics]
-            
-            # Get most common topic and calculate percentage
-            topic_counter = Counter(topics)
-            top_topic_tuple = topic_counter.most_common(1)[0] if topic_counter else None
-            top_topic = top_topic_tuple[0] if top_topic_tuple else "General Knowledge"
-            
-            # Calculate percentage of prompts with top topic
-            if top_topic_tuple and len(topics) > 0:
-                top_topic_count = top_topic_tuple[1] if isinstance(top_topic_tuple, tuple) and len(top_topic_tuple) > 1 else topic_counter[top_topic]
-                top_topic_percentage = round((top_topic_count / len(topics)) * 100)
-            else:
-                top_topic_percentage = 0
-        else:
-            top_topic = "General Knowledge"
-            top_topic_percentage = 0
-        
-        # Top 5 searches (original prompts before processing)
-        original_counter = Counter(original_prompts)
-        top_searches = [prompt for prompt, _ in original_counter.most_common(5)]
-        
-        # Top 8 keywords from processed text
-        keyword_counter = Counter(all_words)
-        top_keywords = [
-            KeywordFrequency(keyword=kw, frequency=count)
-            for kw, count in keyword_counter.most_common(8)
-        ]
-        
-        # Unique keywords
-        unique_keywords = len(set(all_words))
-        
-        # Monthly distribution (target year) - same as data_cleaning.py
-        # Group by Month and count searches using month numbers (1-12)
-        monthly_counts = df_yearly.groupby(df_yearly['datetime'].dt.month).size().to_dict()
-        searches_by_month = [
-            MonthFrequency(month_number=m, frequency=monthly_counts.get(m, 0))
-            for m in range(1, 13)
-        ]
-        
-        # Hourly distribution (target year)
-        hourly_counts = df_yearly.groupby(df_yearly['Hour']).size().reindex(range(24), fill_value=0).tolist()
-        
-        # Heatmap data - same as data_cleaning.py
-        # Add DayOfWeek column
-        df_yearly['DayOfWeek'] = df_yearly['datetime'].dt.day_name()
-        
-        # Create pivot table for heatmap
-        heatmap_pivot = df_yearly.pivot_table(
-            index='DayOfWeek', 
-            columns='Hour', 
-            values='timestamp', 
-            aggfunc='count'
-        ).fillna(0)
-        
-        # Ensure all hours 0-23 exist
-        for hour in range(24):
-            if hour not in heatmap_pivot.columns:
-                heatmap_pivot[hour] = 0
-        heatmap_pivot = heatmap_pivot.reindex(columns=range(24), fill_value=0)
-        
-        # Sort days of the week correctly and convert to dict
-        days_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        heatmap_data = {}
-        for day in days_order:
-            if day in heatmap_pivot.index:
-                heatmap_data[day] = [int(x) for x in heatmap_pivot.loc[day].tolist()]
-            else:
-                heatmap_data[day] = [0] * 24
-        
-        # Early Bird vs Night Owl calculation - same as data_cleaning.py
-        # Day Search: 6 AM (inclusive) to 5 PM (inclusive) -> Hours 6 through 17
-        day_mask = (df_yearly['Hour'] >= 6) & (df_yearly['Hour'] <= 17)
-        total_day_searches = df_yearly[day_mask].shape[0]
-        total_night_searches = df_yearly[~day_mask].shape[0]
-        
-        if total_day_searches > total_night_searches:
-            early_bird_night_owl = "Early Bird"
-        else:
-            early_bird_night_owl = "Night Owl"
-        
-        # MBTI inference based on processed keywords
-        mbti = infer_mbti(keyword_counter)
-        
-        return WrappedResponse(
-            total_searches_past_year=total_searches,
-            top_topic=top_topic[:100] if len(top_topic) > 100 else top_topic,  # Truncate if too long
-            top_topic_percentage=top_topic_percentage,
-            top_searches=top_searches,
-            top_keywords=top_keywords,
-            unique_keywords=unique_keywords,
-            searches_by_month=searches_by_month,
-            searches_by_hour=hourly_counts,
-            heatmap_data=heatmap_data,
-            early_bird_night_owl=early_bird_night_owl,
-            mbti=mbti
-        )
-        
+        return await run_in_threadpool(_analyze_upload, zip_path, year, timezone)
+
+    except HTTPException:
+        raise
     except BadZipFile:
         raise HTTPException(status_code=400, detail="Invalid ZIP file")
     except json.JSONDecodeError:
@@ -326,47 +121,96 @@ async def analyze_chatgpt_history(file: UploadFile = File(...)):
     except Exception as e:
         import traceback
         raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}\n{traceback.format_exc()}")
+    finally:
+        remove_upload(zip_path)
 
 
-def infer_mbti(keyword_counter: Counter) -> str:
+@router.get("/search-history/exports/{export_id}", response_model=WrappedResponse)
+async def get_export_year(
+    export_id: str,
+    year: int = Query(DEFAULT_TARGET_YEAR, description="Calendar year to summarize"),
+    timezone: str = Query(DEFAULT_TIMEZONE, description="IANA timezone the year and hours are bucketed in"),
+):
     """
-    Infer MBTI type based on keyword patterns.
-    Simple heuristic based on common word patterns.
+    Wrapped summary of another year of an already analyzed export, served from
+    its stored aggregates, or rebuilt from its stored prompts (in any timezone,
+    and on any worker). 404 if neither is stored; upload the export again then.
     """
-    total = sum(keyword_counter.values())
-    if total == 0:
-        return "INTP"  # Default
-    
-    # E vs I: social/people words vs technical/analysis words
-    e_words = {'people', 'social', 'team', 'communicate', 'party', 'friends', 'share'}
-    i_words = {'analyze', 'think', 'code', 'algorithm', 'study', 'research', 'alone'}
-    
-    e_score = sum(keyword_counter[w] for w in e_words)
-    i_score = sum(keyword_counter[w] for w in i_words)
-    ei = 'E' if e_score > i_score else 'I'
-    
-    # N vs S: abstract/future vs concrete/present
-    n_words = {'future', 'innovation', 'theory', 'concept', 'imagine', 'possibility', 'idea'}
-    s_words = {'practical', 'detail', 'fact', 'current', 'real', 'specific', 'actual'}
-    
-    n_score = sum(keyword_counter[w] for w in n_words)
-    s_score = sum(keyword_counter[w] for w in s_words)
-    ns = 'N' if n_score > s_score else 'S'
-    
-    # T vs F: logic/analysis vs emotion/values
-    t_words = {'logic', 'analyze', 'reason', 'objective', 'efficient', 'system', 'solve'}
-    f_words = {'feel', 'value', 'empathy', 'harmony', 'personal', 'care', 'emotion'}
-    
-    t_score = sum(keyword_counter[w] for w in t_words)
-    f_score = sum(keyword_counter[w] for w in f_words)
-    tf = 'T' if t_score > f_score else 'F'
-    
-    # J vs P: structured/planned vs flexible/spontaneous
-    j_words = {'plan', 'schedule', 'organize', 'structure', 'deadline', 'complete', 'finish'}
-    p_words = {'explore', 'flexible', 'spontaneous', 'adapt', 'open', 'option', 'discover'}
-    
-    j_score = sum(keyword_counter[w] for w in j_words)
-    p_score = sum(keyword_counter[w] for w in p_words)
-    jp = 'J' if j_score > p_score else 'P'
-    
-    return f"{ei}{ns}{tf}{jp}"
+    _validate_timezone(timezone)
+    response = await run_in_threadpool(
+        stored_response, export_id, year, timezone, lambda size: _admit(size, size, ADMISSION_MAX_WAIT_SECONDS)
+    )
+    if response is None:
+        raise HTTPException(status_code=404, detail="Export not found; upload it again")
+    return response
+
+
+@router.post("/search-history/jobs", response_model=JobStatus, status_code=202, openapi_extra=UPLOAD_FORM)
+async def create_analysis_job(
+    request: Request,
+    year: int = Query(DEFAULT_TARGET_YEAR, description="Calendar year to summarize"),
+    timezone: str = Query(DEFAULT_TIMEZONE, description="IANA timezone the year and hours are bucketed in"),
+):
+    """
+    Upload a ZIP file of ChatGPT data export and analyze it in the background.
+    Returns a job id immediately; poll /search-history/jobs/{job_id} or stream
+    /search-history/jobs/{job_id}/events for progress and the result.
+    """
+    _validate_timezone(timezone)
+
+    zip_path = await _receive_zip(request)
+    # Jobs wait in the queue as long as it takes, but are refused when it is
+    # full; that is decided here, so exports a cache answers are never refused
+    try:
+        export_id, admission = await run_in_threadpool(_admit_job, zip_path, year, timezone)
+    except BadZipFile:
+        remove_upload(zip_path)
+        raise HTTPException(status_code=400, detail="Invalid ZIP file")
+    except BaseException:
+        remove_upload(zip_path)
+        raise
+    job = get_job_manager().submit(zip_path, year, timezone, admission, export_id)
+    return job.snapshot()
+
+
+def _get_job_or_404(job_id: str):
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/search-history/jobs/{job_id}", response_model=JobStatus)
+async def get_analysis_job(job_id: str):
+    """Status, per-stage progress and, once done, the WrappedResponse of a job."""
+    # A job another worker runs is read from the job store
+    job = await run_in_threadpool(_get_job_or_404, job_id)
+    return job.snapshot()
+
+
+@router.get("/search-history/jobs/{job_id}/events")
+async def stream_analysis_job(job_id: str):
+    """Server-Sent Events stream of job status updates, closed once the job finishes."""
+    job = await run_in_threadpool(_get_job_or_404, job_id)
+
+    async def events():
+        nonlocal job
+        last_version = -1
+        while True:
+            if job.stored:
+                # Run by another worker: follow its row in the job store
+                job = await run_in_threadpool(get_job_manager().get, job_id) or job
+            version = job.version
+            if version != last_version:
+                last_version = version
+                status = JobStatus(**job.snapshot())
+                yield f"event: {status.status}\ndata: {status.model_dump_json()}\n\n"
+                if status.status in ("done", "failed"):
+                    return
+            await asyncio.sleep(JOB_EVENT_POLL_SECONDS)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
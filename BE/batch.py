@@ -0,0 +1,186 @@
+"""
+Offline batch analysis of a directory of exports.
+
+Runs the same pipeline as POST /search-history over every *.zip under a
+directory, fanned out over a process pool. Each worker loads the models once
+and then analyzes exports one after another. Every export gets its
+WrappedResponse in <out>/<name>.json (or the error in <out>/<name>.error.json),
+and the run is summarized in <out>/summary.json. Exports that already have a
+result are skipped, so an interrupted run resumes where it stopped, and its
+summary keeps the rows of the runs before it.
+
+    python batch.py exports/ --out results/ --jobs 4 --year 2025 --timezone Asia/Singapore
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# Add BE directory to Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+SUMMARY_NAME = "summary.json"
+
+
+def _write_json(path: Path, text: str):
+    # Write-then-rename, so an interrupted run never leaves a partial result
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _previous_results(summary_path: Path, exports: list) -> dict:
+    """Rows of the last summary in `summary_path` for exports still in `exports`, by export."""
+    try:
+        with open(summary_path) as f:
+            results = json.load(f).get("results", [])
+    except (OSError, ValueError, AttributeError):
+        return {}
+    current = {str(zip_path) for zip_path in exports}
+    return {row["export"]: row for row in results if isinstance(row, dict) and row.get("export") in current}
+
+
+def _init_worker():
+    from services import warmup
+
+    warmup.warm_up()
+
+
+def _analyze_one(zip_path: str, result_path: str, error_path: str, year: int, timezone: str) -> dict:
+    from zipfile import BadZipFile
+
+    from fastapi import HTTPException
+
+    from services.pipeline import analyze_export
+    from services.uploads import open_export
+
+    start = time.perf_counter()
+    row = {"export": zip_path}
+    try:
+        with open_export(zip_path) as zip_file:
+            response = analyze_export(zip_file, year, timezone)
+    except HTTPException as e:
+        row.update(status="failed", error=str(e.detail))
+    except BadZipFile:
+        row.update(status="failed", error="Invalid ZIP file")
+    except Exception as e:
+        row.update(status="failed", error=f"{type(e).__name__}: {e}")
+    else:
+        _write_json(Path(result_path), response.model_dump_json(indent=2))
+        if os.path.exists(error_path):
+            os.remove(error_path)
+        row.update(status="ok", export_id=response.export_id, prompts=response.total_searches_past_year)
+    row["seconds"] = round(time.perf_counter() - start, 3)
+    if row["status"] == "failed":
+        _write_json(Path(error_path), json.dumps(row, indent=2))
+    return row
+
+
+def run(input_dir: Path, out_dir: Path, jobs: int, year: int, timezone: str) -> dict:
+    exports = sorted(input_dir.rglob("*.zip"))
+    pending = []
+    skipped = 0
+    for zip_path in exports:
+        relative = zip_path.relative_to(input_dir).with_suffix("")
+        result_path = out_dir / relative.with_suffix(".json")
+        error_path = out_dir / relative.with_suffix(".error.json")
+        if result_path.exists():
+            skipped += 1
+            continue
+        pending.append((str(zip_path), str(result_path), str(error_path)))
+
+    print(f"{len(exports)} exports, {skipped} already done, {len(pending)} to analyze with {jobs} jobs")
+    rows = []
+    start = time.perf_counter()
+    if pending:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as pool:
+            futures = [pool.submit(_analyze_one, *paths, year, timezone) for paths in pending]
+            try:
+                for done, future in enumerate(as_completed(futures), 1):
+                    row = future.result()
+                    rows.append(row)
+                    rate = done / (time.perf_counter() - start) * 60
+                    print(f"[{done}/{len(pending)}] {row['export']} {row['status']} in {row['seconds']:.1f}s ({rate:.1f} exports/min)")
+            except KeyboardInterrupt:
+                # Finished results are already on disk; the next run resumes from them
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+
+    elapsed = time.perf_counter() - start
+    # A resumed run's summary covers the runs before it; this run's rows replace theirs
+    results = _previous_results(out_dir / SUMMARY_NAME, exports)
+    results.update((row["export"], row) for row in rows)
+    summary = {
+        "input": str(input_dir),
+        "year": year,
+        "timezone": timezone,
+        "jobs": jobs,
+        "exports": len(exports),
+        "skipped": skipped,
+        "analyzed": len(rows),
+        "ok": sum(row["status"] == "ok" for row in results.values()),
+        "failed": sum(row["status"] == "failed" for row in results.values()),
+        # Time and rate of this run only
+        "seconds": round(elapsed, 2),
+        "exports_per_minute": round(len(rows) / elapsed * 60, 2) if rows and elapsed else None,
+        "results": sorted(results.values(), key=lambda row: row["export"]),
+    }
+    _write_json(out_dir / SUMMARY_NAME, json.dumps(summary, indent=2))
+    return summary
+
+
+def _validate_timezone(parser: argparse.ArgumentParser, timezone: str):
+    # Checked once here rather than failing every export in the workers
+    try:
+        ZoneInfo(timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        parser.error(f"Unknown timezone: {timezone}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="Directory searched recursively for export ZIPs")
+    parser.add_argument("--out", required=True, help="Directory for the per-export results and summary.json")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Worker processes (default: one per core)")
+    parser.add_argument("--year", type=int, default=None, help="Calendar year to summarize (default: DEFAULT_TARGET_YEAR)")
+    parser.add_argument("--timezone", default=None, help="IANA timezone (default: DEFAULT_TIMEZONE)")
+    args = parser.parse_args()
+
+    jobs = max(1, args.jobs)
+    # Split the cores between workers instead of every worker's model using all
+    # of them; set before the config is imported so the workers inherit it
+    os.environ.setdefault("TOPIC_NUM_THREADS", str(max(1, (os.cpu_count() or 1) // jobs)))
+    # The exports are already spread over the cores; a split export is parsed
+    # in its worker's own process rather than in another pool per worker
+    os.environ.setdefault("PARSE_WORKERS", "1")
+    # Each export is analyzed once, so there is nothing to gain from keeping
+    # many exports' aggregates in each worker
+    os.environ.setdefault("AGGREGATE_STORE_SIZE", "1")
+
+    from core.config import DEFAULT_TARGET_YEAR, DEFAULT_TIMEZONE
+
+    timezone = args.timezone or DEFAULT_TIMEZONE
+    _validate_timezone(parser, timezone)
+    summary = run(
+        Path(args.input),
+        Path(args.out),
+        jobs,
+        args.year if args.year is not None else DEFAULT_TARGET_YEAR,
+        timezone,
+    )
+    print(json.dumps({key: value for key, value in summary.items() if key != "results"}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Latency of the model-based MBTI stage (feature build + batched predict_proba)
+against the keyword heuristic it replaces, plus the one-off bundle load.
+
+Run from BE/:
+    python -m benchmarks.bench_mbti --vocab-sizes 500 5000 20000 --batch-sizes 1 4 8
+"""
+import argparse
+import json
+import random
+import time
+from collections import Counter
+
+from core.config import MBTI_MODEL_PATH
+from services.models import MBTI_MODEL, ModelBundle
+from services.pipeline import infer_mbti
+
+
+def synthetic_counter(vocab_size: int, rng: random.Random) -> Counter:
+    """Zipf-ish keyword counts over `vocab_size` distinct tokens."""
+    return Counter({f"term{i}": max(1, int(1000 / (i + 1) + rng.random() * 3)) for i in range(vocab_size)})
+
+
+def median_latency(fn, repeats):
+    fn()  # warm up
+    runs = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    runs.sort()
+    return runs[len(runs) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bundle", default=MBTI_MODEL_PATH)
+    parser.add_argument("--vocab-sizes", type=int, nargs="+", default=[500, 5000, 20000])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    bundle = ModelBundle(MBTI_MODEL, args.bundle)
+    load_seconds = time.perf_counter() - start
+    if not bundle.has_features:
+        parser.error(f"{args.bundle} has no vectorizer or vocabulary to build its features from")
+
+    rng = random.Random(0)
+    results = []
+    for vocab_size in args.vocab_sizes:
+        counters = [synthetic_counter(vocab_size, rng) for _ in range(max(args.batch_sizes))]
+        heuristic = median_latency(lambda: infer_mbti(counters[0]), args.repeats)
+        features = median_latency(lambda: bundle.features(counters[0]), args.repeats)
+        for batch_size in args.batch_sizes:
+            batch = counters[:batch_size]
+            latency = median_latency(lambda: bundle.predict(batch), args.repeats)
+            results.append({
+                "vocab_size": vocab_size,
+                "batch_size": batch_size,
+                "model_latency_ms": round(latency * 1000, 3),
+                "model_latency_per_doc_ms": round(latency * 1000 / batch_size, 3),
+                "features_ms": round(features * 1000, 3),
+                "heuristic_ms": round(heuristic * 1000, 3),
+            })
+
+    print(json.dumps({"bundle_version": bundle.version, "load_s": round(load_seconds, 3)}))
+    for row in results:
+        print(json.dumps(row))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"bundle_version": bundle.version, "load_s": round(load_seconds, 3), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Stage-level benchmark of the upload pipeline on synthetic exports.
+
+For each size, generates (or reuses) a synthetic export and runs the stages
+of a /search-history request one by one in a fresh interpreter, recording
+wall time and peak RSS per stage:
+
+    unzip_parse, local_times, process_text, aggregate, classify,
+    mbti_model, infer_mbti, response
+
+Classification uses a deterministic stub by default, so the numbers measure
+the pipeline rather than the transformer; pass --model real to run the
+configured topic model. The topic cache is disabled unless --topic-cache.
+Results are JSON tagged with the git commit; --baseline prints per-stage
+ratios against an earlier results file.
+
+Run from BE/:
+    python -m benchmarks.bench_pipeline --sizes 1k 10k 100k --json pipeline.json
+    python -m benchmarks.bench_pipeline --sizes 10k --baseline pipeline.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import zlib
+from pathlib import Path
+
+from benchmarks.synthetic_export import parse_size, write_export
+
+BE_DIR = Path(__file__).resolve().parent.parent
+
+
+class PeakRss:
+    """Peak resident set size per stage, via the kernel's resettable high-water mark."""
+
+    def __init__(self):
+        self.resettable = self._reset()
+
+    @staticmethod
+    def _reset() -> bool:
+        try:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+            return True
+        except OSError:
+            return False
+
+    def start(self):
+        if self.resettable:
+            self._reset()
+
+    def peak_mb(self) -> float:
+        if self.resettable:
+            with open("/proc/self/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return round(int(line.split()[1]) / 1024, 1)
+        # Lifetime peak only: stages after the largest one report the same value
+        return lifetime_peak_mb()
+
+
+def lifetime_peak_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def stub_classify(texts):
+    """Deterministic stand-in for the topic model: a label from a CRC of the text."""
+    from services.topics import TOPIC_LABELS
+
+    return [TOPIC_LABELS[zlib.crc32(text.encode("utf-8")) % len(TOPIC_LABELS)] for text in texts]
+
+
+def run_stages(zip_path: str, model: str, year: int, tz: str) -> dict:
+    """Run every stage on one export in this process and time it."""
+    import pandas as pd
+
+    from services.aggregation import to_local_times
+    from services.sampling import row_clusters
+    from services.pipeline import (
+        parse_export,
+        process_text,
+        count_years,
+        classify_years,
+        predict_year_mbti,
+        wrapped_response,
+        infer_mbti,
+    )
+    from services.text import get_stopwords, get_lemma_cache
+    from services.uploads import open_export
+    from services import warmup
+
+    # Model and corpus loading is a startup cost, not a per-request one
+    if model == "real":
+        warmup.warm_up()
+    else:
+        get_stopwords()
+        get_lemma_cache().get("warmup")
+
+    rss = PeakRss()
+    stages = {}
+    state = {}
+
+    def stage(name, fn):
+        rss.start()
+        start = time.perf_counter()
+        fn()
+        stages[name] = {"seconds": round(time.perf_counter() - start, 4), "peak_rss_mb": rss.peak_mb()}
+
+    def parse():
+        with open_export(zip_path) as zip_file:
+            state["parsed"] = parse_export(zip_file)
+
+    def local_times():
+        state["df"] = pd.DataFrame({"prompt": state["parsed"].texts})
+        state["times"] = to_local_times(state["parsed"].timestamps, tz)
+
+    def normalize():
+        state["df"] = process_text(state["df"], "prompt")
+
+    def aggregate():
+        parsed = state["parsed"]
+        clusters = row_clusters(parsed.conversation_ids, parsed.conversation_sizes)
+        state["aggregates"] = count_years(
+            parsed.export_id, parsed.texts, state["df"]["prompt"], state["times"], tz, clusters
+        )
+
+    def classify():
+        if model == "real":
+            classify_years(state["aggregates"], state["parsed"].texts)
+        else:
+            classify_years(state["aggregates"], state["parsed"].texts, classify=stub_classify)
+
+    def mbti_heuristic():
+        for agg in state["aggregates"].years.values():
+            infer_mbti(agg.keyword_counter)
+
+    stage("unzip_parse", parse)
+    stage("local_times", local_times)
+    stage("process_text", normalize)
+    stage("aggregate", aggregate)
+    stage("classify", classify)
+    stage("mbti_model", lambda: predict_year_mbti(state["aggregates"]))
+    stage("infer_mbti", mbti_heuristic)
+    stage("response", lambda: wrapped_response(state["aggregates"], year))
+
+    return {
+        "prompts": len(state["parsed"].texts),
+        "years": sorted(state["aggregates"].years),
+        "mbti_model_version": state["aggregates"].mbti_model_version,
+        "stages": stages,
+        "total_s": round(sum(s["seconds"] for s in stages.values()), 4),
+        "peak_rss_mb": lifetime_peak_mb(),
+    }
+
+
+def git_commit() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=BE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=BE_DIR, capture_output=True, text=True
+        ).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def run_isolated(zip_path: str, args) -> dict:
+    """Run the stages in a fresh interpreter so peak RSS and caches are per size."""
+    cmd = [
+        sys.executable, "-m", "benchmarks.bench_pipeline", "--run-one", zip_path,
+        "--model", args.model, "--year", str(args.year), "--timezone", args.timezone,
+    ]
+    if args.topic_cache:
+        cmd.append("--topic-cache")
+    out = subprocess.run(cmd, cwd=BE_DIR, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def compare(results: dict, baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = {run["size"]: run for run in json.load(f)["runs"]}
+    for run in results["runs"]:
+        old = baseline.get(run["size"])
+        if old is None:
+            continue
+        for name, stage in run["stages"].items():
+            before = old["stages"].get(name, {}).get("seconds")
+            if before:
+                print(f"{run['size']:>6} {name:<13} {before:>9.4f}s -> {stage['seconds']:>9.4f}s  x{stage['seconds'] / before:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=["1k", "10k", "100k"], help="1k, 10k, 100k, 1m or prompt counts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--export-dir", default=str(BE_DIR / "cache" / "synthetic"), help="Where generated exports are kept")
+    parser.add_argument("--model", choices=["stub", "real"], default="stub", help="Topic classifier to run")
+    parser.add_argument("--year", type=int, default=2025)
+    parser.add_argument("--timezone", default="Asia/Singapore")
+    parser.add_argument("--topic-cache", action="store_true", help="Keep the persistent topic cache enabled")
+    parser.add_argument("--in-process", action="store_true", help="Run every size in this interpreter")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Earlier results file to compare stage times against")
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if not args.topic_cache:
+        os.environ["TOPIC_CACHE_PATH"] = ""
+
+    if args.run_one:
+        print(json.dumps(run_stages(args.run_one, args.model, args.year, args.timezone)))
+        return
+
+    os.makedirs(args.export_dir, exist_ok=True)
+    results = {
+        **git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "model": args.model,
+        "seed": args.seed,
+        "timezone": args.timezone,
+        "runs": [],
+    }
+    for size in args.sizes:
+        n_prompts = parse_size(size)
+        zip_path = os.path.join(args.export_dir, f"export_{n_prompts}_{args.seed}.zip")
+        if not os.path.exists(zip_path):
+            write_export(zip_path + ".tmp", n_prompts, args.seed)
+            os.replace(zip_path + ".tmp", zip_path)
+        if args.in_process:
+            run = run_stages(zip_path, args.model, args.year, args.timezone)
+        else:
+            run = run_isolated(zip_path, args)
+        run = {"size": size, "zip_bytes": os.path.getsize(zip_path), **run}
+        results["runs"].append(run)
+        print(json.dumps(run))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Cold-start cost: time to import the API, and time spent in each warmup step.
+Each measurement runs in a fresh interpreter so module caches do not leak between them.
+
+Run from BE/:
+    python -m benchmarks.bench_startup --repeats 3 --json startup.json
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BE_DIR = Path(__file__).resolve().parent.parent
+
+IMPORT_SNIPPET = """
+import json, time
+start = time.perf_counter()
+import main
+print(json.dumps({"import_s": time.perf_counter() - start}))
+"""
+
+WARMUP_SNIPPET = """
+import json, time
+import main
+from services import warmup
+start = time.perf_counter()
+steps = warmup.warm_up()
+print(json.dumps({"warmup_s": time.perf_counter() - start, "steps": steps}))
+"""
+
+
+def run_snippet(snippet):
+    out = subprocess.run(
+        [sys.executable, "-c", snippet], cwd=BE_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    # main.py prints its CORS configuration; the measurement is the last line
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--skip-warmup", action="store_true", help="Only measure the import path")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    imports = [run_snippet(IMPORT_SNIPPET)["import_s"] for _ in range(args.repeats)]
+    results = {"import_s": {"median": round(statistics.median(imports), 4), "runs": [round(t, 4) for t in imports]}}
+
+    if not args.skip_warmup:
+        warmups = [run_snippet(WARMUP_SNIPPET) for _ in range(args.repeats)]
+        results["warmup_s"] = {
+            "median": round(statistics.median(w["warmup_s"] for w in warmups), 4),
+            "steps": warmups[-1]["steps"],
+        }
+
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Latency and label agreement of the batched topic engine against the a2t path.
+
+Run from BE/:
+    python -m benchmarks.bench_topic_inference --n 100 --batch-sizes 8 32 --threads 4 --quantize
+"""
+import argparse
+import json
+import time
+
+from services import topics
+from services.topics import TopicInferenceEngine, classify_with_a2t, get_topic_classifier
+
+SAMPLE_PROMPTS = [
+    "yes",
+    "give me the full code",
+    "sure",
+    "how do I merge two pandas dataframes on a date column",
+    "explain the difference between a list and a tuple in python",
+    "what is the time complexity of quicksort",
+    "summarise the main themes of pride and prejudice",
+    "help me write a cover letter for a data analyst internship",
+    "what does the federal reserve do when inflation is high",
+    "is free will compatible with determinism",
+    "fix this error: TypeError: 'NoneType' object is not subscriptable",
+    "how do transformers use attention for language modelling",
+    "recommend a study plan for learning linear algebra",
+    "convert 250 SGD to USD",
+    "write a SQL query to get the top 5 customers by revenue",
+    "how can I be more productive in the mornings",
+    "what is the capital of australia",
+    "tokenize this sentence and remove stopwords",
+    "plot a histogram of ages with matplotlib",
+    "what are good books on stoicism",
+]
+
+
+def load_prompts(path, n):
+    if path:
+        with open(path, encoding="utf-8") as f:
+            base = [line.rstrip("\n") for line in f if line.strip()]
+    else:
+        base = SAMPLE_PROMPTS
+    prompts = [base[i % len(base)] for i in range(n)]
+    return [p[:500] for p in prompts]
+
+
+def timed(fn, prompts, repeats):
+    fn(prompts[:2])  # warm up kernels and lazy allocations
+    runs = []
+    labels = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        labels, _ = fn(prompts)
+        runs.append(time.perf_counter() - start)
+    runs.sort()
+    return labels, runs[len(runs) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prompts", help="Text file with one prompt per line (defaults to built-in samples)")
+    parser.add_argument("--n", type=int, default=100, help="Number of prompts to classify")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--model", default=topics.TOPIC_MODEL)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 32, 64])
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--quantize", action="store_true", help="Also benchmark dynamic int8 quantization")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    prompts = load_prompts(args.prompts, args.n)
+
+    get_topic_classifier()
+    reference, reference_latency = timed(classify_with_a2t, prompts, args.repeats)
+    results = [{"engine": "a2t", "latency_s": round(reference_latency, 4), "agreement": 1.0}]
+
+    variants = [(bs, False) for bs in args.batch_sizes]
+    if args.quantize:
+        variants += [(bs, True) for bs in args.batch_sizes]
+
+    engines = {}
+    for batch_size, quantize in variants:
+        if quantize not in engines:
+            engines[quantize] = TopicInferenceEngine(
+                model_name=args.model, num_threads=args.threads, quantize=quantize
+            )
+        engine = engines[quantize]
+        engine.batch_size = batch_size
+        labels, latency = timed(engine.classify, prompts, args.repeats)
+        agreement = sum(a == b for a, b in zip(labels, reference)) / len(reference)
+        results.append({
+            "engine": "batched",
+            "model": args.model,
+            "batch_size": batch_size,
+            "quantized": quantize,
+            "threads": args.threads,
+            "latency_s": round(latency, 4),
+            "speedup": round(reference_latency / latency, 2),
+            "agreement": round(agreement, 4),
+        })
+
+    for row in results:
+        print(json.dumps(row))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"n_prompts": len(prompts), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Resident memory per worker of the prefork server (serve.py).
+
+Starts serve.py with each requested worker count, waits for /ready, then reads
+/proc/<pid>/smaps_rollup of the parent and every worker. PSS splits shared
+pages evenly between the processes mapping them, so total PSS is what the box
+actually pays; with copy-on-write sharing it should grow far slower than
+workers x RSS. Linux only.
+
+Run from BE/:
+    python -m benchmarks.bench_workers --workers 1 2 4 --json workers.json
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+BE_DIR = Path(__file__).resolve().parent.parent
+FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def memory_mb(pid):
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if name in FIELDS:
+                values[name.lower()] = round(int(rest.split()[0]) / 1024, 1)
+    return values
+
+
+def children_of(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(p) for p in f.read().split()]
+
+
+def wait_ready(port, proc, expected_children, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"serve.py exited with {proc.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=2) as r:
+                if r.status == 200 and len(children_of(proc.pid)) >= expected_children:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError("server did not become ready")
+
+
+def measure(workers, timeout):
+    port = free_port()
+    env = dict(os.environ, WEB_WORKERS=str(workers), PORT=str(port))
+    proc = subprocess.Popen(
+        [sys.executable, "serve.py"], cwd=BE_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        # A single worker runs in-process, so there are no children to wait for
+        wait_ready(port, proc, workers if workers > 1 else 0, timeout)
+        pids = children_of(proc.pid) if workers > 1 else [proc.pid]
+        parent = memory_mb(proc.pid)
+        per_worker = [memory_mb(pid) for pid in pids]
+        total_pss = parent["pss"] + sum(w["pss"] for w in per_worker) if workers > 1 else parent["pss"]
+        return {
+            "workers": workers,
+            "parent": parent if workers > 1 else None,
+            "per_worker": per_worker,
+            "total_pss_mb": round(total_pss, 1),
+        }
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds to wait for model preload")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    results = [measure(n, args.timeout) for n in args.workers]
+    for row in results:
+        print(json.dumps(row))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Overload test of the upload endpoint and its admission control.
+
+Sends --requests uploads of distinct synthetic exports from --concurrency
+client threads at once, so the server sees more analyses than it has capacity
+for, and reports how many were analyzed or refused with 429, p50/p99/max
+latency of each, and the Retry-After values returned. With admission control
+the analyzed requests' latency stays bounded by the queue (capacity plus queue
+capacity worth of analyses), and the rest are refused in milliseconds; with
+--compare the same load is replayed with ADMISSION_CAPACITY=0, where every
+request is admitted and latency grows with the offered load.
+
+Without --url, serve.py is started on a free port with the result cache,
+prompt store and per-user state disabled, so every upload is analyzed in full.
+
+Run from BE/:
+    python -m benchmarks.load_test --size 10k --requests 40 --concurrency 16 --compare --json load.json
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from benchmarks.bench_workers import free_port, wait_ready
+from benchmarks.synthetic_export import parse_size, write_export
+
+BE_DIR = Path(__file__).resolve().parent.parent
+UPLOAD_PATH = "/api/v1/search/search-history"
+# Every upload is analyzed in full, never answered from a cache
+UNCACHED_ENV = {"RESULT_CACHE_PATH": "", "PROMPT_STORE_DIR": "", "USER_STATE_DIR": ""}
+
+
+def multipart_body(path: str):
+    boundary = uuid.uuid4().hex
+    with open(path, "rb") as f:
+        data = f.read()
+    head = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{Path(path).name}\"\r\n"
+        "Content-Type: application/zip\r\n\r\n"
+    ).encode()
+    return head + data + f"\r\n--{boundary}--\r\n".encode(), f"multipart/form-data; boundary={boundary}"
+
+
+def upload(url: str, body: bytes, content_type: str, timeout: float) -> dict:
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": content_type}, method="POST")
+    start = time.perf_counter()
+    retry_after = None
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as r:
+            r.read()
+            status = r.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+        retry_after = e.headers.get("Retry-After")
+    except OSError:
+        status = None  # connection error or client timeout
+    return {"status": status, "seconds": time.perf_counter() - start, "retry_after": retry_after}
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+
+def latency(rows):
+    seconds = [row["seconds"] for row in rows]
+    return {
+        "count": len(rows),
+        "p50": percentile(seconds, 0.5),
+        "p99": percentile(seconds, 0.99),
+        "max": round(max(seconds), 3) if seconds else None,
+    }
+
+
+def run_load(base_url: str, bodies, n_requests: int, concurrency: int, timeout: float) -> dict:
+    url = base_url.rstrip("/") + UPLOAD_PATH
+    # Start every client at once so the server is overloaded from the first request
+    barrier = threading.Barrier(min(concurrency, n_requests))
+
+    def client(i):
+        if i < barrier.parties:
+            barrier.wait()
+        body, content_type = bodies[i % len(bodies)]
+        return upload(url, body, content_type, timeout)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        rows = list(pool.map(client, range(n_requests)))
+    elapsed = time.perf_counter() - start
+
+    ok = [row for row in rows if row["status"] == 200]
+    rejected = [row for row in rows if row["status"] == 429]
+    retry_after = [int(row["retry_after"]) for row in rejected if row["retry_after"]]
+    return {
+        "requests": n_requests,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 2),
+        "analyzed_per_minute": round(len(ok) / elapsed * 60, 1),
+        "ok": latency(ok),
+        "rejected": latency(rejected),
+        "failed": {str(status): sum(1 for row in rows if row["status"] == status)
+                   for status in sorted({row["status"] for row in rows} - {200, 429}, key=str)},
+        "retry_after": {"min": min(retry_after), "max": max(retry_after)} if retry_after else None,
+    }
+
+
+def with_server(env: dict, timeout: float, fn):
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "serve.py"], cwd=BE_DIR, env=dict(os.environ, **UNCACHED_ENV, **env, PORT=str(port)),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready(port, proc, 0, timeout)
+        return fn(f"http://127.0.0.1:{port}")
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Base URL of a running server; by default serve.py is started")
+    parser.add_argument("--size", default="10k", help="Prompts per synthetic export (1k, 10k, 100k or a count)")
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--exports", type=int, default=None, help="Distinct exports to upload (default: one per request)")
+    parser.add_argument("--compare", action="store_true", help="Also run the load with admission control disabled")
+    parser.add_argument("--timeout", type=float, default=600, help="Client timeout and server startup timeout (s)")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    n_prompts = parse_size(args.size)
+    with tempfile.TemporaryDirectory() as tmp:
+        bodies = []
+        for seed in range(args.exports or args.requests):
+            path = os.path.join(tmp, f"export_{seed}.zip")
+            write_export(path, n_prompts, seed)
+            bodies.append(multipart_body(path))
+
+        def load(base_url):
+            return run_load(base_url, bodies, args.requests, args.concurrency, args.timeout)
+
+        results = {"size": args.size}
+        if args.url:
+            results["admission"] = load(args.url)
+        else:
+            results["admission"] = with_server({}, args.timeout, load)
+            if args.compare:
+                results["unbounded"] = with_server({"ADMISSION_CAPACITY": "0"}, args.timeout, load)
+
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
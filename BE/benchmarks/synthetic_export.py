@@ -0,0 +1,249 @@
+"""
+Deterministic synthetic ChatGPT data exports for benchmarking.
+
+Writes a ZIP with conversations.json (and user.json) laid out like a real
+export: every conversation is a `mapping` tree rooted at a null system node,
+with user/assistant turns, occasional tool calls and edited prompts that fork
+the tree. Prompt lengths are log-normal, words follow a Zipf law over a few
+topic vocabularies mixed with short follow-ups, code, URLs and numbers, and
+timestamps follow daily and weekly rhythms over 2023-2026. The same seed and
+size always produce byte-identical files.
+
+Run from BE/:
+    python -m benchmarks.synthetic_export --size 100k --out /tmp/export_100k.zip
+"""
+import argparse
+import bisect
+import json
+import math
+import random
+import time
+import uuid
+import zipfile
+from datetime import datetime, timezone
+from itertools import accumulate
+from typing import Tuple
+
+# Named sizes, in user prompts
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+TOPIC_WORDS = {
+    "coding": "python function error code list dict loop class import return string array bug debug fix test api json "
+              "variable module package install version async request response server database query index type",
+    "data": "pandas dataframe column row merge groupby plot chart mean median regression model feature dataset "
+            "csv excel filter sort aggregate correlation distribution sample train accuracy",
+    "writing": "essay email letter rewrite paragraph summary tone formal draft cover story outline title edit "
+               "grammar sentence professional short concise introduction conclusion",
+    "study": "explain concept theory example exam question answer lecture chapter formula proof definition "
+             "difference history biology physics chemistry calculus probability",
+    "finance": "budget invest stock market inflation interest rate loan saving tax salary portfolio dividend "
+               "crypto price retirement insurance expense",
+    "health": "sleep workout diet protein calorie exercise stress meditation routine habit running weight "
+              "muscle doctor symptom vitamin",
+    "travel": "trip itinerary flight hotel visa japan singapore europe budget weekend beach museum food "
+              "train day plan city",
+    "cooking": "recipe chicken rice pasta sauce bake oven minute ingredient vegetarian dinner breakfast "
+               "spicy garlic soup dessert",
+    "career": "interview resume job internship skill manager team salary offer linkedin promotion feedback "
+              "project meeting presentation",
+    "philosophy": "meaning life free will ethic moral stoic existential argument consciousness truth belief "
+                  "happiness purpose mind",
+}
+FILLER = "how what why can you please give me the a an of to in for with and is are my i do does should best way write make"
+FOLLOW_UPS = [
+    "yes", "continue", "thanks", "give me the full code", "make it shorter", "explain again", "sure", "more",
+    "why?", "can you elaborate", "ok", "go on", "try again", "perfect",
+]
+CODE_SNIPPETS = [
+    "TypeError: 'NoneType' object is not subscriptable",
+    "df.groupby('user_id')['amount'].sum()",
+    "for i in range(10): print(i ** 2)",
+    "SELECT name, COUNT(*) FROM orders GROUP BY name HAVING COUNT(*) > 5;",
+    "KeyError: 'timestamp' on line 42",
+    "const [state, setState] = useState(0);",
+]
+URLS = ["https://docs.python.org/3/library/json.html", "https://example.com/article?id=1234", "www.github.com/user/repo"]
+EXTRAS = ["🙂", "café", "naïve", "résumé", "日本語", "2024", "3.14", "v2.0", "user_name", "#1"]
+
+# Relative activity by local hour (0-23) and weekday (Monday first)
+HOUR_WEIGHTS = [2, 1, 1, 0.5, 0.5, 0.5, 1, 2, 4, 6, 7, 7, 6, 6, 7, 7, 6, 5, 5, 6, 7, 7, 6, 4]
+WEEKDAY_WEIGHTS = [1.1, 1.1, 1.1, 1.0, 0.9, 0.7, 0.8]
+UTC_OFFSET_HOURS = 8
+START = datetime(2023, 1, 1, tzinfo=timezone.utc).timestamp()
+END = datetime(2026, 7, 1, tzinfo=timezone.utc).timestamp()
+
+
+def _zipf_cum_weights(n: int, s: float = 1.1):
+    return list(accumulate(1 / (rank + 1) ** s for rank in range(n)))
+
+
+class ExportGenerator:
+    """Yields conversations until exactly `n_prompts` user prompts have been produced."""
+
+    def __init__(self, n_prompts: int, seed: int = 0):
+        self.n_prompts = n_prompts
+        self.rng = random.Random(seed)
+        self.topics = list(TOPIC_WORDS)
+        self.vocab = {topic: words.split() for topic, words in TOPIC_WORDS.items()}
+        self.cum = {topic: _zipf_cum_weights(len(words)) for topic, words in self.vocab.items()}
+        self.topic_cum = _zipf_cum_weights(len(self.topics), 0.8)
+        self.filler = FILLER.split()
+        self.days = int((END - START) // 86400)
+        # Usage grows over time: later days are more likely
+        self.day_cum = list(accumulate(1 + 2 * day / self.days for day in range(self.days)))
+        self.hour_cum = list(accumulate(HOUR_WEIGHTS))
+        # Assistant replies are drawn from a fixed pool; their text is never analyzed
+        self.replies = [self._words("coding", self._length(60)) for _ in range(500)]
+
+    def _uuid(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def _length(self, median: float) -> int:
+        return max(1, min(400, int(self.rng.lognormvariate(math.log(median), 0.8))))
+
+    def _words(self, topic: str, n: int) -> str:
+        words = self.rng.choices(self.vocab[topic], cum_weights=self.cum[topic], k=n)
+        for i in range(0, n, 3):
+            words[i] = self.rng.choice(self.filler)
+        return " ".join(words)
+
+    def prompt(self, topic: str) -> str:
+        roll = self.rng.random()
+        if roll < 0.15:
+            return self.rng.choice(FOLLOW_UPS)
+        text = self._words(topic, self._length(12))
+        if roll < 0.22:
+            text += "\n" + self.rng.choice(CODE_SNIPPETS)
+        elif roll < 0.25:
+            text += " " + self.rng.choice(URLS)
+        elif roll < 0.30:
+            text += " " + self.rng.choice(EXTRAS)
+        return text
+
+    def conversation_start(self) -> float:
+        while True:
+            day = bisect.bisect(self.day_cum, self.rng.random() * self.day_cum[-1])
+            weekday = datetime.fromtimestamp(START + day * 86400, timezone.utc).weekday()
+            if self.rng.random() * max(WEEKDAY_WEIGHTS) <= WEEKDAY_WEIGHTS[weekday]:
+                break
+        hour = bisect.bisect(self.hour_cum, self.rng.random() * self.hour_cum[-1])
+        return START + day * 86400 + (hour - UTC_OFFSET_HOURS) * 3600 + self.rng.random() * 3600
+
+    def _message(self, role: str, text: str, t: float, content_type: str = "text") -> dict:
+        return {
+            "id": self._uuid(),
+            "author": {"role": role, "name": None, "metadata": {}},
+            "create_time": t,
+            "update_time": None,
+            "content": {"content_type": content_type, "parts": [text]},
+            "status": "finished_successfully",
+            "end_turn": role == "assistant" or None,
+            "weight": 1.0,
+            "metadata": {},
+            "recipient": "all",
+        }
+
+    def conversation(self, max_prompts: int) -> Tuple[dict, int]:
+        rng = self.rng
+        topic = self.topics[bisect.bisect(self.topic_cum, rng.random() * self.topic_cum[-1])]
+        turns = min(max_prompts, 1 + int(rng.expovariate(1 / 3)) if rng.random() > 0.02 else rng.randint(20, 60))
+        t = self.conversation_start()
+        create_time = t
+
+        mapping = {}
+        root = self._uuid()
+        mapping[root] = {"id": root, "message": None, "parent": None, "children": []}
+        system = self._uuid()
+        mapping[system] = {
+            "id": system, "message": self._message("system", "", t), "parent": root, "children": [],
+        }
+        mapping[root]["children"].append(system)
+        parent = system
+
+        def add(message):
+            node_id = message["id"]
+            mapping[node_id] = {"id": node_id, "message": message, "parent": parent, "children": []}
+            mapping[parent]["children"].append(node_id)
+            return node_id
+
+        prompts = 0
+        while prompts < turns:
+            user = add(self._message("user", self.prompt(topic), t))
+            prompts += 1
+            # An edited prompt forks a sibling branch under the same parent
+            if prompts < turns and rng.random() < 0.08:
+                t += rng.uniform(10, 120)
+                user = add(self._message("user", self.prompt(topic), t))
+                prompts += 1
+            parent = user
+            if rng.random() < 0.05:
+                t += rng.uniform(1, 5)
+                parent = add(self._message("tool", "search results", t, "tether_browsing_display"))
+            t += rng.uniform(3, 40)
+            parent = add(self._message("assistant", rng.choice(self.replies), t))
+            t += rng.uniform(20, 1200) if rng.random() < 0.9 else rng.uniform(3600, 86400 * 3)
+
+        conv_id = self._uuid()
+        return {
+            "title": self._words(topic, 4).title(),
+            "create_time": create_time,
+            "update_time": t,
+            "mapping": mapping,
+            "moderation_results": [],
+            "current_node": parent,
+            "conversation_id": conv_id,
+            "id": conv_id,
+        }, prompts
+
+    def __iter__(self):
+        remaining = self.n_prompts
+        while remaining > 0:
+            conv, prompts = self.conversation(remaining)
+            remaining -= prompts
+            yield conv
+
+
+def _zip_info(name: str) -> zipfile.ZipInfo:
+    # Fixed timestamps keep the archive byte-identical across runs
+    info = zipfile.ZipInfo(name, date_time=(2025, 1, 1, 0, 0, 0))
+    info.compress_type = zipfile.ZIP_DEFLATED
+    return info
+
+
+def write_export(path: str, n_prompts: int, seed: int = 0) -> dict:
+    """Write a synthetic export to `path`; returns its prompt and conversation counts."""
+    generator = ExportGenerator(n_prompts, seed)
+    conversations = 0
+    with zipfile.ZipFile(path, "w") as zf:
+        with zf.open(_zip_info("conversations.json"), "w", force_zip64=True) as member:
+            member.write(b"[")
+            for conv in generator:
+                if conversations:
+                    member.write(b", ")
+                member.write(json.dumps(conv).encode("utf-8"))
+                conversations += 1
+            member.write(b"]")
+        user = {"id": f"user-{seed:08x}", "email": "synthetic@example.com", "chatgpt_plus_user": False}
+        zf.writestr(_zip_info("user.json"), json.dumps(user))
+    return {"prompts": n_prompts, "conversations": conversations, "seed": seed}
+
+
+def parse_size(value: str) -> int:
+    return SIZES[value.lower()] if value.lower() in SIZES else int(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", default="10k", help=f"One of {', '.join(SIZES)} or a prompt count")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", required=True, help="Path of the ZIP to write")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    stats = write_export(args.out, parse_size(args.size), args.seed)
+    stats["seconds"] = round(time.perf_counter() - start, 2)
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    main()
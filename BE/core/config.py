@@ -0,0 +1,154 @@
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+ENV_FILE = os.getenv("ENV_FILE", ".env.local")
+
+env_path = Path(__file__).resolve().parent.parent / ENV_FILE
+if env_path.exists():
+    load_dotenv(dotenv_path=env_path)
+
+CLIENT_URL = os.getenv("VITE_CLIENT_URL")
+
+# Process-wide lemma memo: max number of LRU entries, and an optional
+# frequency list (one token per line, most frequent first) to pre-warm from
+LEMMA_CACHE_SIZE = int(os.getenv("LEMMA_CACHE_SIZE", "100000"))
+LEMMA_CACHE_WARMUP_FILE = os.getenv("LEMMA_CACHE_WARMUP_FILE")
+
+# Topic classification. TOPIC_ENGINE selects one of the zero-shot teachers:
+# the batched CPU engine ("batched") or the original a2t EntailmentClassifier
+# path ("a2t"), or the distilled linear student ("distilled", which labels
+# every prompt). No student bundle ships with the repo: train one with
+# services.distill first. Without it, "distilled" logs an error and falls
+# back to "batched".
+TOPIC_ENGINE = os.getenv("TOPIC_ENGINE", "batched")
+TOPIC_MODEL = os.getenv("TOPIC_MODEL", "roberta-large-mnli")
+TOPIC_BATCH_SIZE = int(os.getenv("TOPIC_BATCH_SIZE", "32"))
+TOPIC_NUM_THREADS = int(os.getenv("TOPIC_NUM_THREADS", "0"))  # 0 keeps torch's default
+TOPIC_QUANTIZE = os.getenv("TOPIC_QUANTIZE", "0") == "1"
+TOPIC_MAX_LENGTH = int(os.getenv("TOPIC_MAX_LENGTH", "512"))
+
+# Persistent per-prompt topic cache (SQLite). Set TOPIC_CACHE_PATH to "" to disable.
+TOPIC_CACHE_PATH = os.getenv(
+    "TOPIC_CACHE_PATH", str(Path(__file__).resolve().parent.parent / "cache" / "topic_cache.sqlite3")
+)
+TOPIC_CACHE_MAX_ENTRIES = int(os.getenv("TOPIC_CACHE_MAX_ENTRIES", "200000"))
+
+# Background analysis jobs: worker threads and how long finished jobs are kept
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+# Shared SQLite record of every job's status, so any worker process can answer
+# for a job another one runs. Set JOB_STORE_PATH to "" to keep jobs in memory
+# only; with WEB_WORKERS > 1 polling then needs sticky routing to one worker.
+JOB_STORE_PATH = os.getenv(
+    "JOB_STORE_PATH", str(Path(__file__).resolve().parent.parent / "cache" / "jobs.sqlite3")
+)
+
+# Load models and corpora when the server starts instead of on the first request
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"
+
+# Processes that parse exports split across several conversations files,
+# one member each. 1 parses every export in the request's own process.
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(min(os.cpu_count() or 1, 8))))
+
+# Worker processes for serve.py. Above 1, models are preloaded in the parent
+# and shared copy-on-write with the forked workers.
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+
+# Defaults for the analyzed calendar year and the timezone it is bucketed in
+DEFAULT_TARGET_YEAR = int(os.getenv("DEFAULT_TARGET_YEAR", "2025"))
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "Asia/Singapore")
+# Exports whose per-year aggregates are kept in memory for other-year requests.
+# Each worker process has its own; misses are rebuilt from the prompt store.
+AGGREGATE_STORE_SIZE = int(os.getenv("AGGREGATE_STORE_SIZE", "64"))
+
+# Per-user incremental state: one file per user holding the parsed prompts
+# and topic labels of every conversation, for any timezone. Files unread for
+# USER_STATE_TTL_SECONDS are removed, and past USER_STATE_MAX_ENTRIES the
+# least recently used are. Set USER_STATE_DIR to "" to disable.
+USER_STATE_DIR = os.getenv(
+    "USER_STATE_DIR", str(Path(__file__).resolve().parent.parent / "cache" / "user_state")
+)
+USER_STATE_MAX_ENTRIES = int(os.getenv("USER_STATE_MAX_ENTRIES", "256"))
+USER_STATE_TTL_SECONDS = int(os.getenv("USER_STATE_TTL_SECONDS", str(30 * 24 * 3600)))
+
+# Bundled MBTI classifier ({"model", "classes"} joblib file, plus the fitted
+# "vectorizer" or training "vocabulary" its features need; without them the
+# bundle makes no predictions). Set to "" to always use the keyword heuristic.
+MBTI_MODEL_PATH = os.getenv(
+    "MBTI_MODEL_PATH", str(Path(__file__).resolve().parent.parent.parent / "Model" / "xgb_bundle.pkl")
+)
+
+# Distilled topic student ({"model", "classes", "vectorizer"} joblib file
+# written by `python -m services.distill`)
+TOPIC_STUDENT_PATH = os.getenv(
+    "TOPIC_STUDENT_PATH", str(Path(__file__).resolve().parent.parent.parent / "Model" / "topic_student.pkl")
+)
+
+# Document frequencies of normalized tokens over a reference corpus (Arrow
+# file written by `python -m services.keyword_index`), used to rank each year's
+# distinctive keywords. Needs pyarrow; set KEYWORD_INDEX_PATH to "" to disable.
+KEYWORD_INDEX_PATH = os.getenv(
+    "KEYWORD_INDEX_PATH", str(Path(__file__).resolve().parent.parent.parent / "Model" / "keyword_index.arrow")
+)
+
+# Log level of the app's own loggers; DEBUG adds one line per HTTP request
+# with its origin and timing
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# Uploads are copied to a temporary file (in UPLOAD_SPOOL_DIR, or the system
+# temp dir) in UPLOAD_CHUNK_SIZE chunks and rejected beyond MAX_UPLOAD_BYTES.
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(512 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None
+# ZIP bomb guard for the members the pipeline decompresses
+MAX_UNCOMPRESSED_BYTES = int(os.getenv("MAX_UNCOMPRESSED_BYTES", str(4 * 1024 * 1024 * 1024)))
+MAX_COMPRESSION_RATIO = float(os.getenv("MAX_COMPRESSION_RATIO", "100"))
+
+# Admission control: analyses run while their total cost (archive or
+# uncompressed conversations size, in ADMISSION_COST_UNIT_BYTES units, at least
+# 1) fits in ADMISSION_CAPACITY; the rest wait in a queue of at most
+# ADMISSION_QUEUE_CAPACITY units, uploads for at most
+# ADMISSION_MAX_WAIT_SECONDS. Beyond either, requests get 429 with Retry-After.
+# Set ADMISSION_CAPACITY to 0 to disable.
+ADMISSION_CAPACITY = float(os.getenv("ADMISSION_CAPACITY", "4"))
+ADMISSION_QUEUE_CAPACITY = float(os.getenv("ADMISSION_QUEUE_CAPACITY", "16"))
+ADMISSION_COST_UNIT_BYTES = int(os.getenv("ADMISSION_COST_UNIT_BYTES", str(64 * 1024 * 1024)))
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "60"))
+
+# Top searches and keywords of a year with at most TOP_EXACT_MAX_ROWS prompts
+# are counted exactly. Larger years use Space-Saving summaries holding at most
+# this many distinct prompts / tokens, and report guaranteed counts; 0 counts
+# everything exactly.
+TOP_EXACT_MAX_ROWS = int(os.getenv("TOP_EXACT_MAX_ROWS", "500000"))
+TOP_PROMPTS_CAPACITY = int(os.getenv("TOP_PROMPTS_CAPACITY", "2000"))
+TOP_KEYWORDS_CAPACITY = int(os.getenv("TOP_KEYWORDS_CAPACITY", "50000"))
+
+# Content-addressed cache of finished responses (SQLite), keyed by the hash of
+# conversations.json and the analysis parameters. Set RESULT_CACHE_PATH to ""
+# to disable.
+RESULT_CACHE_PATH = os.getenv(
+    "RESULT_CACHE_PATH", str(Path(__file__).resolve().parent.parent / "cache" / "result_cache.sqlite3")
+)
+RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "10000"))
+
+# Topic sampling: each year's prompts are labelled in rounds, stratified by
+# month and drawn TOPIC_SAMPLE_PER_CONVERSATION at a time from randomly
+# ordered conversations, until the 95% interval on the top topic's share is
+# within ±TOPIC_CI_HALF_WIDTH or TOPIC_SAMPLE_MAX prompts are labelled.
+# Sampling that runs past TOPIC_SAMPLE_BUDGET_SECONDS stops and is reported
+# as incomplete.
+TOPIC_SAMPLE_MIN = int(os.getenv("TOPIC_SAMPLE_MIN", "40"))
+TOPIC_SAMPLE_ROUND = int(os.getenv("TOPIC_SAMPLE_ROUND", "40"))
+TOPIC_SAMPLE_MAX = int(os.getenv("TOPIC_SAMPLE_MAX", "300"))
+TOPIC_SAMPLE_PER_CONVERSATION = int(os.getenv("TOPIC_SAMPLE_PER_CONVERSATION", "2"))
+TOPIC_CI_HALF_WIDTH = float(os.getenv("TOPIC_CI_HALF_WIDTH", "0.1"))
+TOPIC_SAMPLE_BUDGET_SECONDS = float(os.getenv("TOPIC_SAMPLE_BUDGET_SECONDS", "120"))
+
+# Columnar (Arrow) files of parsed and normalized prompts, one per export, so
+# re-analysis (e.g. in another timezone) skips parsing and normalization.
+# Needs pyarrow; set PROMPT_STORE_DIR to "" to disable.
+PROMPT_STORE_DIR = os.getenv("PROMPT_STORE_DIR", str(Path(__file__).resolve().parent.parent / "cache" / "prompts"))
+PROMPT_STORE_MAX_ENTRIES = int(os.getenv("PROMPT_STORE_MAX_ENTRIES", "64"))
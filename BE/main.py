@@ -1,24 +1,25 @@
 import sys
 import os
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 # Add BE directory to Python path
 sys.path.insert(0, str(Path(__file__).parent))
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from core.config import CLIENT_URL, WARMUP_ON_STARTUP, LOG_LEVEL, MAX_UPLOAD_BYTES
 from api.v1.endpoints import SearchRouter
-import os
-from dotenv import load_dotenv
-from pathlib import Path
-
-ENV_FILE = os.getenv("ENV_FILE", ".env.local")
+from services import metrics, warmup
 
-env_path = Path(__file__).resolve().parent / ENV_FILE
-if env_path.exists():
-    load_dotenv(dotenv_path=env_path)
-
-CLIENT_URL = os.getenv("VITE_CLIENT_URL")
+# LOG_LEVEL applies to this app's loggers ("wrapped.*"); libraries stay at INFO
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("wrapped")
+logger.setLevel(LOG_LEVEL)
 
 # Remove trailing slash from CLIENT_URL if it exists
 if CLIENT_URL and CLIENT_URL.endswith('/'):
@@ -32,25 +33,99 @@ else:
         "http://127.0.0.1:5173",
     ]
 
-print(f"CORS allowed origins: {allowed_origins}")
-
-app = FastAPI()
-
-# Debug middleware to see what's happening
-@app.middleware("http") 
-async def debug_cors(request, call_next):
-    origin = request.headers.get("origin")
-    print(f"Request origin: {origin}")
-    print(f"Allowed origins: {allowed_origins}")
-    print(f"Origin matches: {origin in allowed_origins}")
-    
-    response = await call_next(request)
-    
-    cors_header = response.headers.get("access-control-allow-origin")
-    print(f"CORS header set: {cors_header}")
-    print("---")
-    
-    return response
+logger.info("CORS allowed origins: %s", allowed_origins)
+
+async def _warm_up_in_background():
+    try:
+        timings = await asyncio.get_running_loop().run_in_executor(None, warmup.warm_up)
+        logger.info("Warmup complete: %s", timings)
+    except Exception as e:
+        logger.error("Warmup failed: %s", e)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load models and corpora in the background; /ready reports 503 until done
+    task = None
+    if warmup.is_ready():
+        # Preloaded by serve.py before it forked this worker
+        logger.info("Models preloaded before fork; skipping warmup")
+    elif WARMUP_ON_STARTUP:
+        task = asyncio.create_task(_warm_up_in_background())
+    else:
+        warmup.mark_ready()
+    yield
+    if task is not None and not task.done():
+        task.cancel()
+
+app = FastAPI(lifespan=lifespan)
+
+# Room for the multipart boundaries and headers around the uploaded file
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+
+class LimitRequestBody:
+    """
+    Refuse request bodies over `max_bytes` with 413: at once when the
+    Content-Length says so, otherwise as soon as more than that has been
+    received, so chunked bodies without a length are cut off too. The second
+    case raises HTTPException from `receive`, which the app turns into the
+    response of whichever handler is reading the body.
+    """
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    def _too_large(self) -> HTTPException:
+        return HTTPException(status_code=413, detail=f"Upload exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MiB limit")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > self.max_bytes:
+            response = JSONResponse({"detail": self._too_large().detail}, status_code=413)
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise self._too_large()
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+app.add_middleware(LimitRequestBody, max_bytes=MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD)
+
+# Request metrics, plus a per-request log line at DEBUG level
+@app.middleware("http")
+async def instrument_requests(request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        with metrics.HTTP_IN_FLIGHT.track_in_progress():
+            response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        # Label by route template so ids in paths do not explode the series count
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        metrics.HTTP_REQUESTS.inc(method=request.method, route=path, status=status)
+        metrics.HTTP_LATENCY.observe(elapsed, method=request.method, route=path)
+        if logger.isEnabledFor(logging.DEBUG):
+            origin = request.headers.get("origin")
+            logger.debug(
+                "%s %s -> %s in %.1f ms (origin=%s, allowed=%s)",
+                request.method, request.url.path, status, elapsed * 1000, origin, origin in allowed_origins,
+            )
 
 app.add_middleware(
     CORSMiddleware,
@@ -68,6 +143,15 @@ app.include_router(SearchRouter, prefix="/api/v1/search")
 async def root():
     return {"message": "Hello World"}
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/ready")
+async def ready():
+    state = warmup.readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8000))
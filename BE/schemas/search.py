@@ -1,4 +1,4 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
 from pydantic import BaseModel, Field
 
 
@@ -7,6 +7,12 @@ class KeywordFrequency(BaseModel):
     frequency: int
 
 
+class DistinctiveKeyword(BaseModel):
+    keyword: str
+    frequency: int
+    score: float  # tf-idf against the global keyword index
+
+
 class MonthFrequency(BaseModel):
     month_number: int = Field(..., ge=1, le=12)
     frequency: int
@@ -16,11 +22,30 @@ class WrappedResponse(BaseModel):
     total_searches_past_year: int
     top_topic: str
     top_topic_percentage: int  # Percentage of prompts classified as top topic
+    top_topic_percentage_low: Optional[int] = None  # 95% interval of the sampled estimate
+    top_topic_percentage_high: Optional[int] = None
+    topic_sample_size: Optional[int] = None  # Prompts labelled to estimate the topic split
+    topic_sample_complete: Optional[bool] = None  # False when the time budget cut the sample short
     top_searches: List[str] = Field(..., max_length=5)
     top_keywords: List[KeywordFrequency] = Field(..., max_length=8)
+    distinctive_keywords: List[DistinctiveKeyword] = Field([], max_length=8)  # Empty without a keyword index
     unique_keywords: int
     searches_by_month: List[MonthFrequency]
     searches_by_hour: List[int] = Field(..., min_length=24, max_length=24)
     heatmap_data: Dict[str, List[int]]  # Day of week -> 24 hourly counts
     early_bird_night_owl: str  # "Early Bird" or "Night Owl"
     mbti: str
+    mbti_confidence: Optional[float] = None  # Model probability; None when the keyword heuristic answered
+    mbti_model_version: Optional[str] = None
+    export_id: Optional[str] = None  # Pass back to fetch other years without re-uploading
+    year: Optional[int] = None
+    timezone: Optional[str] = None
+    available_years: List[int] = []
+
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: str  # "queued", "running", "done" or "failed"
+    stages: Dict[str, float]  # Stage name -> progress between 0 and 1
+    result: Optional[WrappedResponse] = None
+    error: Optional[str] = None
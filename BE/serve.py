@@ -0,0 +1,120 @@
+"""
+Production entry point.
+
+With WEB_WORKERS=1 this is a plain uvicorn run. With more workers the models
+are loaded once in this parent process, which then forks the workers so they
+share the weight pages copy-on-write instead of each loading its own copy.
+"""
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from pathlib import Path
+
+# Add BE directory to Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import uvicorn
+
+from core.config import JOB_STORE_PATH, PROMPT_STORE_DIR, WEB_WORKERS
+from main import app
+from services import warmup
+from services.prompt_store import pyarrow_available
+
+HOST = "0.0.0.0"
+PORT = int(os.environ.get("PORT", 8000))
+
+logger = logging.getLogger("wrapped.serve")
+
+_children = {}
+_shutting_down = False
+
+
+def _bind_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((HOST, PORT))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(sock: socket.socket):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    config = uvicorn.Config(app, host=HOST, port=PORT)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def _spawn(sock: socket.socket, slot: int):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            _run_worker(sock)
+        finally:
+            os._exit(0)
+    _children[pid] = slot
+    logger.info("Started worker %d (pid %d)", slot, pid)
+
+
+def _shutdown(signum, frame):
+    global _shutting_down
+    _shutting_down = True
+    for pid in list(_children):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+
+def serve_prefork(workers: int):
+    # Load everything before forking so the workers inherit the loaded pages;
+    # the workers find warmup done and skip it in their lifespan
+    start = time.perf_counter()
+    timings = warmup.warm_up(before_fork=True)
+    logger.info("Preloaded models in %.1fs: %s", time.perf_counter() - start, timings)
+    # Stored aggregates are per worker; only the prompt store lets any worker
+    # answer for an export another one analyzed
+    if not (PROMPT_STORE_DIR and pyarrow_available()):
+        logger.warning(
+            "No prompt store (PROMPT_STORE_DIR is empty or pyarrow is missing): "
+            "other years of an export are only served by the worker that analyzed it"
+        )
+    if not JOB_STORE_PATH:
+        logger.warning(
+            "No job store (JOB_STORE_PATH is empty): jobs can only be polled on the worker that runs them, "
+            "so the load balancer needs sticky routing"
+        )
+
+    # Move every object allocated so far out of the GC's reach; otherwise the
+    # first collection in each worker writes to them and un-shares their pages
+    gc.freeze()
+
+    sock = _bind_socket()
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+
+    for slot in range(workers):
+        _spawn(sock, slot)
+
+    while _children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        slot = _children.pop(pid, None)
+        if slot is not None and not _shutting_down:
+            logger.warning("Worker %d (pid %d) exited with status %d, restarting", slot, pid, status)
+            _spawn(sock, slot)
+
+
+if __name__ == "__main__":
+    if WEB_WORKERS > 1:
+        serve_prefork(WEB_WORKERS)
+    else:
+        uvicorn.run(app, host=HOST, port=PORT)
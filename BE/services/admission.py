@@ -0,0 +1,231 @@
+"""
+Admission control for export analyses.
+
+Every upload and job is weighed before it runs: its cost is the larger of the
+archive size and the uncompressed size of its conversations, which tracks the
+prompt count and the memory its analysis needs, in ADMISSION_COST_UNIT_BYTES
+units (at least 1, at most the whole capacity). Analyses run while their
+total cost fits in ADMISSION_CAPACITY; the rest wait in a FIFO queue bounded
+by ADMISSION_QUEUE_CAPACITY cost units. A request that does not fit in the
+queue, or waits longer than its limit, is refused at once with 429 and a
+Retry-After estimated from how fast recent analyses drained.
+
+Background jobs only reserve their place when they are submitted: the
+reservation counts against the queue, but the job joins the queue when its
+worker thread is about to analyze, so a granted ticket is always running.
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from fastapi import HTTPException
+
+from core.config import (
+    ADMISSION_CAPACITY,
+    ADMISSION_QUEUE_CAPACITY,
+    ADMISSION_COST_UNIT_BYTES,
+)
+from services.metrics import ADMISSION_REJECTED, ADMISSION_WAIT_SECONDS, REGISTRY
+
+# Retry-After before any analysis has finished, and its upper bound
+DEFAULT_RETRY_AFTER_SECONDS = 5
+MAX_RETRY_AFTER_SECONDS = 300
+# Weight of the latest analysis in the seconds-per-unit average
+PACE_SMOOTHING = 0.2
+
+
+def export_cost(upload_bytes: int, conversations_bytes: int, capacity: float = ADMISSION_CAPACITY) -> float:
+    """Cost units of an analysis, from its archive and uncompressed conversations sizes."""
+    units = max(upload_bytes, conversations_bytes) / ADMISSION_COST_UNIT_BYTES
+    return min(max(units, 1.0), capacity)
+
+
+class Ticket:
+    """One analysis's place in the queue. The holder must call release() when done."""
+
+    def __init__(self, controller: "AdmissionController", cost: float, max_wait: Optional[float]):
+        self.cost = cost
+        self.max_wait = max_wait
+        self.enqueued_at = time.perf_counter()
+        self.joined = True  # False while only reserved
+        self.granted_at: Optional[float] = None
+        self.waited = False
+        self.released = False
+        self._controller = controller
+
+    def wait(self):
+        """
+        Block until the analysis may run; 429 once `max_wait` has passed. A
+        reserved ticket joins the back of the queue first.
+        """
+        self._controller._wait(self)
+
+    def release(self):
+        """Free the capacity, or leave the queue if not yet admitted. Idempotent."""
+        self._controller._release(self)
+
+
+class AdmissionController:
+    """Cost-weighted concurrency limit with a bounded FIFO queue. Thread-safe."""
+
+    def __init__(self, capacity: float = ADMISSION_CAPACITY, queue_capacity: float = ADMISSION_QUEUE_CAPACITY):
+        self.capacity = capacity
+        self.queue_capacity = queue_capacity
+        self._running = 0.0
+        self._queue = deque()
+        self._queued = 0.0
+        self._reserved = 0.0
+        self._seconds_per_unit: Optional[float] = None
+        self._condition = threading.Condition()
+
+    def enqueue(self, cost: float, max_wait: Optional[float] = None) -> Ticket:
+        """Take a place in the queue, or raise 429 right away if the queue is full."""
+        cost = min(cost, self.capacity)
+        with self._condition:
+            self._check_room(cost)
+            ticket = Ticket(self, cost, max_wait)
+            self._join(ticket)
+            return ticket
+
+    def reserve(self, cost: float, max_wait: Optional[float] = None) -> Ticket:
+        """
+        Hold room in the queue for an analysis that will start later, or raise
+        429 right away if the queue is full. The ticket only joins the queue
+        when it is waited on.
+        """
+        cost = min(cost, self.capacity)
+        with self._condition:
+            self._check_room(cost)
+            ticket = Ticket(self, cost, max_wait)
+            ticket.joined = False
+            self._reserved += cost
+            return ticket
+
+    def _check_room(self, cost: float):
+        # Reserved analyses are about to join, so they count as queued ahead
+        waiting = self._queued + self._reserved
+        runs_now = not waiting and self._running + cost <= self.capacity
+        if not runs_now and waiting + cost > self.queue_capacity:
+            ADMISSION_REJECTED.inc(reason="queue_full")
+            raise self._too_busy("Too many analyses in progress; try again later")
+
+    def _join(self, ticket: Ticket):
+        if not ticket.joined:
+            self._reserved -= ticket.cost
+            ticket.joined = True
+            ticket.enqueued_at = time.perf_counter()
+        self._queue.append(ticket)
+        self._queued += ticket.cost
+        self._grant()
+
+    def _grant(self):
+        # Strictly in order, so large analyses are not starved by small ones
+        while self._queue and self._running + self._queue[0].cost <= self.capacity:
+            ticket = self._queue.popleft()
+            self._queued -= ticket.cost
+            self._running += ticket.cost
+            ticket.granted_at = time.perf_counter()
+            ADMISSION_WAIT_SECONDS.observe(ticket.granted_at - ticket.enqueued_at)
+        self._condition.notify_all()
+
+    def _wait(self, ticket: Ticket):
+        with self._condition:
+            if not ticket.joined:
+                self._join(ticket)
+            ticket.waited = True
+            deadline = None if ticket.max_wait is None else ticket.enqueued_at + ticket.max_wait
+            while ticket.granted_at is None:
+                remaining = None if deadline is None else deadline - time.perf_counter()
+                if remaining is not None and remaining <= 0:
+                    self._queue.remove(ticket)
+                    self._queued -= ticket.cost
+                    ticket.released = True
+                    self._grant()
+                    ADMISSION_REJECTED.inc(reason="timeout")
+                    raise self._too_busy("Timed out waiting for an analysis slot; try again later")
+                self._condition.wait(remaining)
+
+    def _release(self, ticket: Ticket):
+        with self._condition:
+            if ticket.released:
+                return
+            ticket.released = True
+            if not ticket.joined:
+                self._reserved -= ticket.cost
+            elif ticket.granted_at is None:
+                self._queue.remove(ticket)
+                self._queued -= ticket.cost
+            else:
+                self._running -= ticket.cost
+                # Only analyses that ran (not cache hits) say how fast the queue drains
+                if ticket.waited:
+                    pace = (time.perf_counter() - ticket.granted_at) / ticket.cost
+                    self._seconds_per_unit = pace if self._seconds_per_unit is None else (
+                        PACE_SMOOTHING * pace + (1 - PACE_SMOOTHING) * self._seconds_per_unit
+                    )
+            self._grant()
+
+    def _retry_after(self) -> int:
+        # Seconds until the running and queued work should have drained at the recent pace
+        if self._seconds_per_unit is None:
+            return DEFAULT_RETRY_AFTER_SECONDS
+        backlog = (self._running + self._queued + self._reserved) * self._seconds_per_unit / self.capacity
+        return max(1, min(math.ceil(backlog), MAX_RETRY_AFTER_SECONDS))
+
+    def _too_busy(self, detail: str) -> HTTPException:
+        return HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(self._retry_after())})
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "queued": len(self._queue),
+                "queued_cost": self._queued,
+                "reserved_cost": self._reserved,
+                "running_cost": self._running,
+                "capacity": self.capacity,
+                "queue_capacity": self.queue_capacity,
+            }
+
+
+_admission_controller = None
+_admission_controller_lock = threading.Lock()
+
+def get_admission_controller() -> Optional[AdmissionController]:
+    """Process-wide controller, or None when ADMISSION_CAPACITY is 0 (no limit)."""
+    global _admission_controller
+    if _admission_controller is None and ADMISSION_CAPACITY > 0:
+        with _admission_controller_lock:
+            if _admission_controller is None:
+                _admission_controller = AdmissionController()
+    return _admission_controller
+
+
+def _reset_admission_controller():
+    # Each worker process admits its own analyses; a lock held at fork time would never be released
+    global _admission_controller
+    _admission_controller = None
+
+
+os.register_at_fork(after_in_child=_reset_admission_controller)
+
+
+def _admission_samples():
+    if _admission_controller is None:
+        return
+    stats = _admission_controller.stats()
+    yield ("wrapped_admission_queue_depth", "gauge", "Analyses waiting for admission.", [({}, stats["queued"])])
+    yield (
+        "wrapped_admission_cost", "gauge", "Cost units of analyses by state, and the limits they are held to.",
+        [
+            ({"state": "queued"}, stats["queued_cost"]),
+            ({"state": "running"}, stats["running_cost"]),
+            ({"state": "capacity"}, stats["capacity"]),
+            ({"state": "queue_capacity"}, stats["queue_capacity"]),
+        ],
+    )
+
+
+REGISTRY.register_collector(_admission_samples)
@@ -0,0 +1,192 @@
+import itertools
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, Hashable, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from core.config import AGGREGATE_STORE_SIZE
+from services.heavy_hitters import keyword_counter, prompt_counter
+from services.metrics import CACHE_LOOKUPS
+from services.sampling import TopicEstimate, TopicSampler, sample_digest
+
+DAYS_ORDER = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+# Day Search: 6 AM (inclusive) to 5 PM (inclusive) -> Hours 6 through 17
+DAY_HOURS = slice(6, 18)
+# Prompts reported as a year's top searches
+TOP_SEARCHES = 5
+
+
+class LocalTimes(NamedTuple):
+    """Calendar fields of every timestamp, as parallel integer arrays."""
+    year: np.ndarray
+    month: np.ndarray    # 1-12
+    hour: np.ndarray     # 0-23
+    weekday: np.ndarray  # 0 = Monday
+
+
+class YearlyHistograms(NamedTuple):
+    years: np.ndarray    # (Y,) distinct local years, ascending
+    month: np.ndarray    # (Y, 12) counts for months 1-12
+    heatmap: np.ndarray  # (Y, 7, 24) weekday x hour, Monday first
+
+
+def to_local_times(timestamps: np.ndarray, tz: str) -> LocalTimes:
+    """Convert Unix seconds to local calendar fields in one vectorized step."""
+    import pandas as pd
+
+    local = pd.DatetimeIndex(pd.to_datetime(timestamps, unit='s')).tz_localize('UTC').tz_convert(tz)
+    return LocalTimes(
+        year=local.year.to_numpy(np.int32),
+        month=local.month.to_numpy(np.int32),
+        hour=local.hour.to_numpy(np.int32),
+        weekday=local.dayofweek.to_numpy(np.int32),
+    )
+
+
+def yearly_histograms(times: LocalTimes, counts: Optional[np.ndarray] = None) -> YearlyHistograms:
+    """
+    Month histogram and weekday x hour heatmap of every year from two integer
+    bincounts over all rows, each row standing for `counts` prompts if given.
+    Hourly counts are the heatmap's column sums.
+    """
+    years, year_idx = np.unique(times.year, return_inverse=True)
+    year_idx = year_idx.reshape(-1)
+    n_years = len(years)
+    heatmap = np.bincount(
+        (year_idx * 7 + times.weekday) * 24 + times.hour, weights=counts, minlength=n_years * 7 * 24
+    ).reshape(n_years, 7, 24)
+    month = np.bincount(year_idx * 12 + times.month - 1, weights=counts, minlength=n_years * 12).reshape(n_years, 12)
+    if counts is not None:
+        heatmap, month = heatmap.astype(np.int64), month.astype(np.int64)
+    return YearlyHistograms(years=years, month=month, heatmap=heatmap)
+
+
+def heatmap_by_day(heatmap: np.ndarray) -> Dict[str, List[int]]:
+    return {day: heatmap[i].tolist() for i, day in enumerate(DAYS_ORDER)}
+
+
+def classify_early_bird(hour_counts: np.ndarray) -> str:
+    total_day_searches = int(hour_counts[DAY_HOURS].sum())
+    total_night_searches = int(hour_counts.sum()) - total_day_searches
+    if total_day_searches > total_night_searches:
+        return "Early Bird"
+    return "Night Owl"
+
+
+class YearAggregate:
+    """Everything the wrapped response for one calendar year is computed from."""
+
+    def __init__(self, year: int, rows: int = 0):
+        self.year = year
+        self.total = 0
+        # Exact for a year of up to TOP_EXACT_MAX_ROWS `rows`, a heavy-hitter summary above
+        self.keyword_counter = keyword_counter(rows)  # normalized tokens
+        self.top_prompts: List[Tuple[str, int]] = []  # (original prompt, count) of the top searches
+        self.month = np.zeros(12, dtype=np.int64)
+        self.heatmap = np.zeros((7, 24), dtype=np.int64)
+        self.topic_sampler = TopicSampler()  # sampling frame, dropped once topics are labelled
+        self.topic_counts: Counter = Counter()  # sampled prompts labelled with each topic
+        self.topic_estimate: Optional[TopicEstimate] = None  # top topic's share and interval
+        self.mbti = None                   # (label, confidence) from the MBTI model, if one ran
+
+    @property
+    def hour(self) -> np.ndarray:
+        return self.heatmap.sum(axis=0)
+
+
+def count_rows(
+    texts: Iterable[str],
+    normalized: Iterable[str],
+    times: LocalTimes,
+    clusters: Iterable[Hashable],
+    sources: Optional[Iterable[Hashable]] = None,
+) -> Dict[int, YearAggregate]:
+    """
+    Counts, keyword and prompt counters, time histograms and the topic
+    sampling frame of every year, in one pass over row-aligned prompts in
+    file order. Each prompt is offered to the sampler with its row number,
+    the sampling cluster of its conversation and its `sources` entry.
+    """
+    years = {}
+    prompt_counters = {}
+    histograms = yearly_histograms(times)
+    for i, year in enumerate(histograms.years.tolist()):
+        rows = int(histograms.month[i].sum())
+        agg = years[year] = YearAggregate(year, rows)
+        agg.month = histograms.month[i]
+        agg.heatmap = histograms.heatmap[i]
+        prompt_counters[year] = prompt_counter(rows)
+
+    if sources is None:
+        sources = itertools.repeat(None)
+    rows = zip(texts, normalized, times.year.tolist(), times.month.tolist(), clusters, sources)
+    for row, (text, tokens, year, month, cluster, source) in enumerate(rows):
+        agg = years[year]
+        agg.total += 1
+        agg.keyword_counter.update(tokens.split())
+        prompt_counters[year].add(text)
+        agg.topic_sampler.add(sample_digest(text), month, row, cluster, source)
+    for year, counter in prompt_counters.items():
+        years[year].top_prompts = counter.most_common(TOP_SEARCHES)
+    return years
+
+
+class ExportAggregates:
+    """Per-year aggregates of one export, bucketed in one timezone."""
+
+    def __init__(self, export_id: str, timezone: str, years: Dict[int, YearAggregate]):
+        self.export_id = export_id
+        self.timezone = timezone
+        self.years = years
+        self.mbti_model_version: Optional[str] = None
+
+    def year(self, year: int) -> YearAggregate:
+        return self.years.get(year) or YearAggregate(year)
+
+    @property
+    def topics_complete(self) -> bool:
+        """False if the time budget cut any year's topic sample short."""
+        return all(agg.topic_estimate is None or agg.topic_estimate.complete for agg in self.years.values())
+
+
+class AggregateStore:
+    """Bounded in-process LRU of ExportAggregates keyed by (export id, timezone)."""
+
+    def __init__(self, max_entries: int = AGGREGATE_STORE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], ExportAggregates]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, export_id: str, timezone: str) -> Optional[ExportAggregates]:
+        with self._lock:
+            aggregates = self._entries.get((export_id, timezone))
+            if aggregates is not None:
+                self._entries.move_to_end((export_id, timezone))
+        CACHE_LOOKUPS.inc(cache="aggregate_store", result="miss" if aggregates is None else "hit")
+        return aggregates
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        """Whether (export id, timezone) is stored, without counting the lookup or refreshing it."""
+        with self._lock:
+            return key in self._entries
+
+    def put(self, aggregates: ExportAggregates):
+        with self._lock:
+            key = (aggregates.export_id, aggregates.timezone)
+            self._entries[key] = aggregates
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_aggregate_store = None
+_aggregate_store_lock = threading.Lock()
+
+def get_aggregate_store() -> AggregateStore:
+    global _aggregate_store
+    if _aggregate_store is None:
+        with _aggregate_store_lock:
+            if _aggregate_store is None:
+                _aggregate_store = AggregateStore()
+    return _aggregate_store
@@ -0,0 +1,211 @@
+"""
+Distill the zero-shot topic model into a sparse linear student.
+
+The teacher labels a corpus of prompts. By default it is a2t's
+EntailmentClassifier with the TopicClassificationTask of
+Model/topic_model.ipynb; `--teacher batched` uses the batched engine instead.
+A hashed TF-IDF (word unigrams and bigrams) with a logistic regression,
+trained by SGD, is then fitted to those labels and saved as a versioned bundle,
+which the API loads when TOPIC_ENGINE is "distilled". The student labels a
+prompt with one sparse dot product, so the API can classify every prompt
+instead of a sample.
+
+Agreement with the teacher is measured on a held-out split, printed, and
+stored in the bundle (it shows up under /ready). The final student is then
+refitted on the whole corpus. Teacher labels go through the topic cache, so
+retraining on a grown corpus only labels the new prompts.
+
+Build the corpus from exports or prompt store files, then train (run from BE/):
+    python -m services.distill ~/exports/*.zip ../Model/prompts.arrow --out ../Model/topic_student.pkl
+"""
+import hashlib
+import json
+import random
+import sys
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import TOPIC_CACHE_PATH
+from services.sampling import sample_key
+from services.topic_cache import TopicCache, cache_namespace
+from services.topics import HYPOTHESIS_TEMPLATE, TOPIC_LABELS, run_teacher, teacher_model_id
+
+# Prompts sent to the teacher per call, between progress lines
+TEACHER_CHUNK_SIZE = 256
+STUDENT_FEATURES = 2 ** 20
+STUDENT_ALPHA = 1e-5  # L2 regularization strength
+
+
+def load_corpus(paths: Iterable[str], max_chars: int) -> List[str]:
+    """Distinct, non-trivial prompts of export ZIPs and prompts files, truncated as the API truncates them."""
+    from zipfile import ZipFile
+
+    from services.pipeline import parse_export
+    from services.prompt_store import read_prompts
+
+    corpus: Dict[str, str] = {}
+    for path in paths:
+        if path.endswith(".arrow"):
+            texts = read_prompts(path, ["prompt"]).column("prompt").to_pylist()
+        else:
+            with ZipFile(path) as zip_file:
+                texts = parse_export(zip_file).texts
+        for text in texts:
+            key = sample_key(text)
+            if key is not None:
+                corpus.setdefault(key, text[:max_chars])
+    return list(corpus.values())
+
+
+def teacher_labels(texts: List[str], teacher: str) -> List[str]:
+    """Teacher label of every text, read from and written to the topic cache."""
+    cache = None
+    if TOPIC_CACHE_PATH:
+        cache = TopicCache(TOPIC_CACHE_PATH, cache_namespace(TOPIC_LABELS, HYPOTHESIS_TEMPLATE, teacher_model_id(teacher)))
+    known = cache.get_many(texts) if cache is not None else {}
+    misses = [text for text in texts if text not in known]
+    print(f"{len(texts) - len(misses)} prompts labelled from the cache, {len(misses)} to label", file=sys.stderr)
+
+    start = time.perf_counter()
+    for offset in range(0, len(misses), TEACHER_CHUNK_SIZE):
+        chunk = misses[offset:offset + TEACHER_CHUNK_SIZE]
+        labels, confidences = run_teacher(chunk, teacher)
+        fresh = list(zip(chunk, labels, confidences))
+        if cache is not None:
+            cache.put_many(fresh)
+        known.update((text, (label, confidence)) for text, label, confidence in fresh)
+        done = offset + len(chunk)
+        rate = done / (time.perf_counter() - start)
+        print(f"teacher: {done}/{len(misses)} ({rate:.1f} prompts/s)", file=sys.stderr)
+    return [known[text][0] for text in texts]
+
+
+def fit_student(
+    texts: List[str], labels: List[str], n_features: int = STUDENT_FEATURES, alpha: float = STUDENT_ALPHA, seed: int = 0
+):
+    """Fitted (vectorizer, model) pair; the vectorizer maps raw texts to sparse rows."""
+    from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+    from sklearn.linear_model import SGDClassifier
+    from sklearn.pipeline import make_pipeline
+
+    vectorizer = make_pipeline(
+        HashingVectorizer(n_features=n_features, ngram_range=(1, 2), alternate_sign=False, norm=None),
+        TfidfTransformer(sublinear_tf=True),
+    )
+    matrix = vectorizer.fit_transform(texts)
+    # SGD fits a million hashed features in seconds, where lbfgs takes minutes
+    model = SGDClassifier(loss="log_loss", alpha=alpha, max_iter=50, tol=1e-4, random_state=seed)
+    model.fit(matrix, labels)
+    return vectorizer, model
+
+
+def agreement(teacher: List[str], student: List[str]) -> dict:
+    """Share of prompts the student labels as the teacher does, overall and by teacher label."""
+    teacher, student = np.asarray(teacher), np.asarray(student)
+    matches = teacher == student
+    return {
+        "overall": round(float(matches.mean()), 4),
+        "by_label": {
+            label: round(float(matches[teacher == label].mean()), 4)
+            for label in sorted(set(teacher.tolist()))
+        },
+        "prompts": int(len(teacher)),
+    }
+
+
+def student_version(texts: List[str], labels: List[str], teacher_id: str, n_features: int, alpha: float, seed: int) -> str:
+    """Hash of the training data and settings, so a retrained student gets a new version."""
+    digest = hashlib.sha256(json.dumps([teacher_id, n_features, alpha, seed]).encode("utf-8"))
+    for text, label in zip(texts, labels):
+        digest.update(f"{text}\0{label}\0".encode("utf-8", "surrogatepass"))
+    return digest.hexdigest()[:12]
+
+
+def distill(
+    texts: List[str],
+    labels: List[str],
+    teacher_id: str,
+    holdout: float = 0.2,
+    seed: int = 0,
+    n_features: int = STUDENT_FEATURES,
+    alpha: float = STUDENT_ALPHA,
+) -> Tuple[dict, Optional[dict]]:
+    """The student bundle, and its agreement with the teacher on a held-out split (None without one)."""
+    order = list(range(len(texts)))
+    random.Random(seed).shuffle(order)
+    n_holdout = int(len(texts) * holdout)
+    measured = None
+    if n_holdout and len(set(labels)) > 1:
+        held, train = order[:n_holdout], order[n_holdout:]
+        vectorizer, model = fit_student([texts[i] for i in train], [labels[i] for i in train], n_features, alpha, seed)
+        predicted = model.predict(vectorizer.transform([texts[i] for i in held])).tolist()
+        measured = agreement([labels[i] for i in held], predicted)
+
+    vectorizer, model = fit_student(texts, labels, n_features, alpha, seed)
+    bundle = {
+        "model": model,
+        "classes": model.classes_,
+        "vectorizer": vectorizer,
+        "version": student_version(texts, labels, teacher_id, n_features, alpha, seed),
+        "teacher": teacher_id,
+        "hypothesis_template": HYPOTHESIS_TEMPLATE,
+        "agreement": measured,
+        "trained_prompts": len(texts),
+    }
+    return bundle, measured
+
+
+def main():
+    import argparse
+
+    import joblib
+
+    from services.pipeline import TOPIC_PROMPT_CHARS
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", nargs="+", help="Export ZIPs and/or .arrow prompts files")
+    parser.add_argument("--out", required=True, help="Path of the student bundle to write")
+    parser.add_argument("--teacher", choices=["a2t", "batched"], default="a2t")
+    parser.add_argument("--max-prompts", type=int, default=None, help="Train on a random subset of this size")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Share of prompts held out to measure agreement")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--features", type=int, default=STUDENT_FEATURES, help="Hashed feature dimensions")
+    parser.add_argument("--alpha", type=float, default=STUDENT_ALPHA, help="L2 regularization strength")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    texts = load_corpus(args.corpus, TOPIC_PROMPT_CHARS)
+    if args.max_prompts is not None and len(texts) > args.max_prompts:
+        texts = random.Random(args.seed).sample(texts, args.max_prompts)
+    if not texts:
+        parser.error("the corpus has no prompts to train on")
+    labels = teacher_labels(texts, args.teacher)
+
+    teacher_id = teacher_model_id(args.teacher)
+    bundle, measured = distill(texts, labels, teacher_id, args.holdout, args.seed, args.features, args.alpha)
+    joblib.dump(bundle, args.out)
+
+    # Per-prompt cost of the student on the same texts the API would send it
+    vectorizer, model = bundle["vectorizer"], bundle["model"]
+    sample = texts[:10000]
+    timed = time.perf_counter()
+    model.predict_proba(vectorizer.transform(sample))
+    student_ms = (time.perf_counter() - timed) * 1000
+
+    print(json.dumps({
+        "out": args.out,
+        "version": bundle["version"],
+        "teacher": teacher_id,
+        "prompts": len(texts),
+        "labels": dict(Counter(labels).most_common()),
+        "agreement": measured,
+        "student_ms_per_1000_prompts": round(student_ms / len(sample) * 1000, 2),
+        "seconds": round(time.perf_counter() - start, 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Bounded-memory counting of the most frequent items in a stream.
+
+SpaceSaving keeps at most `capacity` counters (Metwally et al., "Efficient
+computation of frequent and top-k elements in data streams", 2005). Until more
+than `capacity` distinct items have been seen it is an exact counter. After
+that, an unseen item takes over the counter of the current minimum, inheriting
+its count as error. Over a stream of total weight N:
+
+- every reported count over-estimates: count - error <= true count <= count
+- error <= N / capacity, and never more than the smallest monitored count
+- every item whose true count exceeds N / capacity is monitored
+
+So the top-k is exact whenever the k-th count exceeds the (k+1)-th by more
+than `max_error`. most_common ranks by the guaranteed count, count - error,
+and reports it, so a summary never inflates a frequency; ties go to the
+smaller key, so the ranking depends only on the counts, not the stream order.
+
+A year's prompt count is known before its rows are counted, so years of at
+most TOP_EXACT_MAX_ROWS prompts get exact counters and only larger ones a
+summary.
+"""
+import hashlib
+import heapq
+from collections import Counter
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple, Union
+
+from core.config import TOP_EXACT_MAX_ROWS, TOP_PROMPTS_CAPACITY, TOP_KEYWORDS_CAPACITY
+
+
+def prompt_key(text: str) -> bytes:
+    """64-bit digest of a prompt, so counters are keyed by fixed-size hashes."""
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=8).digest()
+
+
+class SpaceSaving:
+    """
+    Counter-like heavy-hitter summary. Supports the parts of the Counter API the
+    pipeline uses: update, add, most_common, items, values, elements, lookups
+    and len. `capacity=None` never evicts and counts exactly.
+    `key` maps an item to the hashable it is counted under (the item itself by
+    default); the item is kept as the label reported for that key.
+    """
+
+    def __init__(self, capacity: Optional[int] = None, key: Optional[Callable[[str], Hashable]] = None):
+        self.capacity = capacity or None
+        self._key = key
+        self._counts: Counter = Counter()
+        self._errors: Dict[Hashable, int] = {}  # non-zero errors only
+        self._labels: Dict[Hashable, str] = {}
+        # (count when pushed, insertion order, key): one entry per monitored key,
+        # built at the first eviction. Counts only grow, so a stale entry is
+        # re-pushed when it surfaces.
+        self._heap: Optional[List[Tuple[int, int, Hashable]]] = None
+        self._pushes = 0
+        self.total = 0
+        self.evictions = 0
+
+    def add(self, item: str, count: int = 1):
+        key = self._key(item) if self._key else item
+        self.total += count
+        counts = self._counts
+        if key in counts:
+            counts[key] += count
+            return
+        error = 0
+        if self.capacity is not None and len(counts) >= self.capacity:
+            evicted, error = self._pop_min()
+            del counts[evicted]
+            self._errors.pop(evicted, None)
+            self._labels.pop(evicted, None)
+            self.evictions += 1
+            self._errors[key] = error
+        counts[key] = error + count
+        if self._key:
+            self._labels[key] = item
+        if self._heap is not None:
+            self._pushes += 1
+            heapq.heappush(self._heap, (counts[key], self._pushes, key))
+
+    def _pop_min(self) -> Tuple[Hashable, int]:
+        if self._heap is None:
+            self._heap = [(count, order, key) for order, (key, count) in enumerate(self._counts.items())]
+            heapq.heapify(self._heap)
+            self._pushes = len(self._heap)
+        heap = self._heap
+        while True:
+            count, order, key = heap[0]
+            current = self._counts[key]
+            if current == count:
+                heapq.heappop(heap)
+                return key, count
+            heapq.heapreplace(heap, (current, order, key))
+
+    def update(self, items: Union[Iterable[str], Dict[str, int]]):
+        """Count each item of an iterable, or add the counts of a mapping."""
+        if not isinstance(items, dict):
+            items = items if isinstance(items, list) else list(items)
+        # While nothing can be evicted, count with Counter's C loop
+        if self._key is None and (self.capacity is None or len(self._counts) + len(items) <= self.capacity):
+            self._counts.update(items)
+            self.total += sum(items.values()) if isinstance(items, dict) else len(items)
+        elif isinstance(items, dict):
+            for item, count in items.items():
+                self.add(item, count)
+        else:
+            for item in items:
+                self.add(item)
+
+    @property
+    def exact(self) -> bool:
+        return self.evictions == 0
+
+    @property
+    def max_error(self) -> int:
+        """Largest possible over-count of any reported item (0 while exact)."""
+        if self.exact:
+            return 0
+        return min(self._counts.values())
+
+    def error(self, item: str) -> int:
+        return self._errors.get(self._key(item) if self._key else item, 0)
+
+    def _label(self, key: Hashable) -> str:
+        return self._labels[key] if self._key else key
+
+    def items(self) -> Iterator[Tuple[str, int]]:
+        for key, count in self._counts.items():
+            yield self._label(key), count
+
+    def values(self):
+        return self._counts.values()
+
+    def elements(self) -> Iterator[str]:
+        for label, count in self.items():
+            for _ in range(count):
+                yield label
+
+    def most_common(self, n: Optional[int] = None) -> List[Tuple[str, int]]:
+        """(item, guaranteed count) by decreasing guaranteed count, ties by key."""
+        errors = self._errors
+        guaranteed = ((key, count - errors.get(key, 0)) for key, count in self._counts.items())
+        rank = lambda kv: (-kv[1], kv[0])  # noqa: E731
+        ranked = sorted(guaranteed, key=rank) if n is None else heapq.nsmallest(n, guaranteed, key=rank)
+        return [(self._label(key), count) for key, count in ranked]
+
+    def __getitem__(self, item: str) -> int:
+        return self._counts.get(self._key(item) if self._key else item, 0)
+
+    def __contains__(self, item: str) -> bool:
+        return (self._key(item) if self._key else item) in self._counts
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def __iter__(self) -> Iterator[str]:
+        for key in self._counts:
+            yield self._label(key)
+
+
+def prompt_counter(rows: int = 0) -> SpaceSaving:
+    """Counter of original prompts, keyed by hash, for `rows` prompts; exact up to TOP_EXACT_MAX_ROWS."""
+    return SpaceSaving(TOP_PROMPTS_CAPACITY if rows > TOP_EXACT_MAX_ROWS else None, key=prompt_key)
+
+
+def keyword_counter(rows: int = 0) -> SpaceSaving:
+    """Counter of normalized tokens of `rows` prompts; exact up to TOP_EXACT_MAX_ROWS."""
+    return SpaceSaving(TOP_KEYWORDS_CAPACITY if rows > TOP_EXACT_MAX_ROWS else None)
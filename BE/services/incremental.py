@@ -0,0 +1,376 @@
+"""
+Incremental analysis of a user's successive exports.
+
+A user's state keeps, for every conversation of their last export, a partial
+aggregate of its prompts: keyword and prompt counts, a histogram of 15-minute
+UTC quarters, its topic sampling candidates and the topic labels drawn for
+them. No prompt text is kept. The state also keeps the totals of all its
+partials, updated by subtracting the conversations an export drops or
+changes and adding the ones it brings, so an upload only counts the rows of
+changed conversations.
+
+Nothing here depends on the timezone. Every timezone's offset from UTC is a
+multiple of 15 minutes and changes on a quarter boundary, so all prompts of a
+quarter share a local year, month, weekday and hour. Prompts more than 15
+hours from a UTC new year are in the same year in every timezone; their
+counts are kept per UTC year, and those of the few prompts nearer a new year
+per quarter. The aggregates of any timezone are reduced from these totals.
+
+Texts are still needed transiently: an upload is parsed in full to find its
+conversations and their update times, newly sampled prompts are classified
+from the export's rows, and top searches are resolved from prompt digests to
+their text by rehashing the rows of the conversations that hold them.
+"""
+import hashlib
+import heapq
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.config import USER_STATE_DIR, USER_STATE_MAX_ENTRIES, USER_STATE_TTL_SECONDS
+from services.aggregation import TOP_SEARCHES, ExportAggregates, YearAggregate, to_local_times, yearly_histograms
+from services.heavy_hitters import prompt_key
+from services.sampling import sample_digest, sample_topics
+
+# Bump when the pickled layout below changes; older files are then ignored
+STATE_VERSION = 6
+
+QUARTER_SECONDS = 15 * 60
+# Further than this from a UTC new year, a prompt is in the same year in every
+# timezone (offsets run from -12 to +14 hours)
+NEW_YEAR_MARGIN_SECONDS = 15 * 3600
+
+
+def quarters_of(timestamps: np.ndarray) -> np.ndarray:
+    """15-minute UTC quarter of every Unix timestamp."""
+    return np.floor(np.asarray(timestamps, dtype=np.float64) / QUARTER_SECONDS).astype(np.int64)
+
+
+def segments_of(quarters: np.ndarray) -> np.ndarray:
+    """
+    Segment every quarter's counts are kept under: its UTC year, or -1 - the
+    quarter for quarters within NEW_YEAR_MARGIN_SECONDS of a UTC new year.
+    """
+    start = quarters * QUARTER_SECONDS
+    year = start.astype("datetime64[s]").astype("datetime64[Y]")
+    since = start - year.astype("datetime64[s]").astype(np.int64)
+    until = (year + 1).astype("datetime64[s]").astype(np.int64) - (start + QUARTER_SECONDS)
+    near = (since < NEW_YEAR_MARGIN_SECONDS) | (until < NEW_YEAR_MARGIN_SECONDS)
+    return np.where(near, -1 - quarters, year.astype(np.int64) + 1970)
+
+
+class ConversationPartial:
+    """
+    Mergeable aggregates of one conversation's prompts, with the topic labels
+    drawn for them.
+    """
+
+    def __init__(self, update_time: Optional[float], size: int):
+        self.update_time = update_time
+        self.size = size  # prompts in the conversation
+        # Plain dicts, which pickle much faster than Counters
+        self.quarters: Dict[int, int] = {}                # quarter -> prompts
+        self.keywords: Dict[int, Dict[str, int]] = {}     # segment -> normalized token counts
+        self.prompts: Dict[int, Dict[bytes, int]] = {}    # segment -> prompt_key counts
+        # (sample_digest, quarter, position in the conversation) of the first
+        # occurrence of each non-trivial prompt in each segment, in order
+        self.candidates: List[Tuple[bytes, int, int]] = []
+        # sample_digest -> topic label, for the prompts a topic sample has drawn
+        self.topic_labels: Dict[bytes, str] = {}
+
+
+def _add_counts(totals: Dict[Hashable, int], counts: Dict[Hashable, int], sign: int):
+    for key, count in counts.items():
+        total = totals.get(key, 0) + sign * count
+        if total:
+            totals[key] = total
+        else:
+            del totals[key]
+
+
+class UserState:
+    """
+    Partials of every conversation in a user's last export, keyed by
+    conversation id, and their totals.
+    """
+
+    def __init__(self, user_key: str, topic_model: str):
+        self.version = STATE_VERSION
+        self.user_key = user_key
+        self.topic_model = topic_model  # model the partials' topic labels came from
+        self.export_id: Optional[str] = None  # the last export, whose prompts file may still be stored
+        self.conversations: Dict[str, ConversationPartial] = {}
+        # Totals of every partial, as ConversationPartial keeps them
+        self.quarters: Dict[int, int] = {}
+        self.keywords: Dict[int, Dict[str, int]] = {}
+        self.prompts: Dict[int, Dict[bytes, int]] = {}
+
+    def use_topic_model(self, topic_model: str):
+        """Drop topic labels of a different model, keeping everything else."""
+        if topic_model != self.topic_model:
+            for partial in self.conversations.values():
+                partial.topic_labels.clear()
+            self.topic_model = topic_model
+
+    def reusable(self, conv_id: Optional[str], update_time: Optional[float]) -> Optional[ConversationPartial]:
+        """The stored partial of a conversation, if it has not changed since."""
+        if conv_id is None:
+            return None
+        partial = self.conversations.get(conv_id)
+        if partial is not None and partial.update_time == update_time:
+            return partial
+        return None
+
+    def add(self, partial: ConversationPartial, sign: int = 1):
+        """Add a partial to the totals, or with `sign` -1 take it out again."""
+        _add_counts(self.quarters, partial.quarters, sign)
+        for totals, counts in ((self.keywords, partial.keywords), (self.prompts, partial.prompts)):
+            for segment, counter in counts.items():
+                total = totals.setdefault(segment, {})
+                _add_counts(total, counter, sign)
+                if not total:
+                    del totals[segment]
+
+    def replace_conversations(self, partials: List[Tuple[Optional[str], ConversationPartial]]):
+        """
+        Make the partials of an export's conversations with an id the state's,
+        taking the ones it no longer has or has changed out of the totals and
+        adding the new ones.
+        """
+        conversations = {conv_id: partial for conv_id, partial in partials if conv_id is not None}
+        for conv_id, partial in self.conversations.items():
+            if conversations.get(conv_id) is not partial:
+                self.add(partial, -1)
+        for conv_id, partial in conversations.items():
+            if self.conversations.get(conv_id) is not partial:
+                self.add(partial)
+        self.conversations = conversations
+
+
+def build_partials(
+    texts: List[str],
+    timestamps: np.ndarray,
+    normalized: List[str],
+    conversation_sizes: Sequence[int],
+    update_times: List[Optional[float]],
+) -> List[ConversationPartial]:
+    """
+    Partials of several conversations at once, from the row-aligned columns of
+    their prompts concatenated in order and the prompt count of each.
+    """
+    quarters = quarters_of(timestamps)
+    segments = segments_of(quarters).tolist()
+    quarters = quarters.tolist()
+    partials = []
+    row = 0
+    for size, update_time in zip(conversation_sizes, update_times):
+        partial = ConversationPartial(update_time, size)
+        quarter_counts = Counter()
+        keywords: Dict[int, Counter] = {}
+        prompts: Dict[int, Counter] = {}
+        seen = set()
+        for position in range(size):
+            text, quarter, segment = texts[row], quarters[row], segments[row]
+            quarter_counts[quarter] += 1
+            if segment not in keywords:
+                keywords[segment] = Counter()
+                prompts[segment] = Counter()
+            keywords[segment].update(normalized[row].split())
+            prompts[segment][prompt_key(text)] += 1
+            digest = sample_digest(text)
+            if digest is not None and (digest, segment) not in seen:
+                seen.add((digest, segment))
+                partial.candidates.append((digest, quarter, position))
+            row += 1
+        partial.quarters = dict(quarter_counts)
+        partial.keywords = {segment: dict(counts) for segment, counts in keywords.items()}
+        partial.prompts = {segment: dict(counts) for segment, counts in prompts.items()}
+        partials.append(partial)
+    return partials
+
+
+def _top_prompts(
+    counts: Dict[bytes, int],
+    partials: List[ConversationPartial],
+    starts: Sequence[int],
+    texts: Sequence[str],
+    resolved: Dict[bytes, str],
+) -> List[Tuple[str, int]]:
+    """Top searches of prompt_key `counts`, ranked as SpaceSaving.most_common ranks them."""
+    top = heapq.nsmallest(TOP_SEARCHES, counts.items(), key=lambda kv: (-kv[1], kv[0]))
+    missing = {key for key, _ in top if key not in resolved}
+    if missing:
+        for partial, start in zip(partials, starts):
+            if any(key in counter for counter in partial.prompts.values() for key in missing):
+                for text in texts[start:start + partial.size]:
+                    resolved.setdefault(prompt_key(text), text)
+                missing.difference_update(resolved)
+                if not missing:
+                    break
+    return [(resolved[key], count) for key, count in top]
+
+
+def merge_partials(
+    export_id: str,
+    timezone: str,
+    state: UserState,
+    partials: List[ConversationPartial],
+    clusters: Sequence[Hashable],
+    texts: Sequence[str],
+    classify: Callable[[List[str]], List[str]],
+    exhaustive: bool = False,
+) -> ExportAggregates:
+    """
+    Per-year aggregates in `timezone` of an export whose conversation partials
+    (in file order, with the sampling cluster of each) have `texts` as rows.
+    The state's totals must hold every partial. Candidates are sampled in row
+    order, as by a full pass; prompts a partial already has a label for are
+    not classified again, and new labels are written back into their partial
+    for the next merge. An `exhaustive` merge labels every prompt afresh and
+    stores no labels, as the model is then cheaper to run than the labels are
+    to keep.
+    """
+    quarters = np.fromiter(state.quarters.keys(), np.int64, len(state.quarters))
+    counts = np.fromiter(state.quarters.values(), np.int64, len(state.quarters))
+    times = to_local_times(quarters * QUARTER_SECONDS, timezone)
+    local = dict(zip(quarters.tolist(), zip(times.year.tolist(), times.month.tolist())))
+
+    years = {}
+    histograms = yearly_histograms(times, counts)
+    for i, year in enumerate(histograms.years.tolist()):
+        agg = years[year] = YearAggregate(year)
+        agg.month = histograms.month[i]
+        agg.heatmap = histograms.heatmap[i]
+        agg.total = int(agg.month.sum())
+
+    def year_of(segment: int) -> int:
+        return segment if segment >= 0 else local[-1 - segment][0]
+
+    for segment, counter in state.keywords.items():
+        years[year_of(segment)].keyword_counter.update(counter)
+    prompt_counts = {year: Counter() for year in years}
+    for segment, counter in state.prompts.items():
+        prompt_counts[year_of(segment)].update(counter)
+    starts = np.cumsum([0] + [partial.size for partial in partials]).tolist()
+    resolved: Dict[bytes, str] = {}
+    for year, counter in prompt_counts.items():
+        years[year].top_prompts = _top_prompts(counter, partials, starts, texts, resolved)
+
+    for partial, start, cluster in zip(partials, starts, clusters):
+        for digest, quarter, position in partial.candidates:
+            year, month = local[quarter]
+            years[year].topic_sampler.add(digest, month, start + position, cluster, partial)
+
+    def remember(digest: bytes, partial: ConversationPartial, label: str):
+        partial.topic_labels[digest] = label
+
+    sampled = sample_topics(
+        {year: agg.topic_sampler for year, agg in years.items()},
+        texts.__getitem__,
+        classify,
+        known=None if exhaustive else lambda digest, partial: partial.topic_labels.get(digest),
+        on_label=None if exhaustive else remember,
+        exhaustive=exhaustive,
+    )
+    for year, agg in years.items():
+        agg.topic_counts, agg.topic_estimate = sampled[year]
+        agg.topic_sampler = None
+
+    return ExportAggregates(export_id, timezone, years)
+
+
+class UserStateStore:
+    """
+    One pickle file per user under `directory`. File names are hashes, so
+    account ids never appear on disk; writes are atomic renames. Reads refresh
+    a file's mtime; files unread for `ttl_seconds` are dropped, and past
+    `max_entries` files the least recently used are removed.
+    """
+
+    def __init__(
+        self, directory: str, max_entries: int = USER_STATE_MAX_ENTRIES, ttl_seconds: float = USER_STATE_TTL_SECONDS
+    ):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, user_key: str) -> str:
+        name = hashlib.sha256(user_key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{name}.pkl")
+
+    def get(self, user_key: str) -> Optional[UserState]:
+        path = self._path(user_key)
+        try:
+            if time.time() - os.stat(path).st_mtime > self.ttl_seconds:
+                os.remove(path)
+                return None
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+            os.utime(path)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+        if getattr(state, "version", None) != STATE_VERSION or state.user_key != user_key:
+            return None
+        return state
+
+    def put(self, state: UserState):
+        path = self._path(state.user_key)
+        with self._lock:
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+            self._evict()
+
+    def _evict(self):
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".pkl"):
+                continue
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                continue
+        entries.sort()
+        excess = len(entries) - self.max_entries
+        for i, (mtime, path) in enumerate(entries):
+            if i < excess or now - mtime > self.ttl_seconds:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+_user_state_store = None
+_user_state_store_lock = threading.Lock()
+
+def get_user_state_store() -> Optional[UserStateStore]:
+    """Process-wide store, or None when USER_STATE_DIR is empty."""
+    global _user_state_store
+    if _user_state_store is None and USER_STATE_DIR:
+        with _user_state_store_lock:
+            if _user_state_store is None:
+                _user_state_store = UserStateStore(USER_STATE_DIR)
+    return _user_state_store
+
+
+def _reset_user_state_store():
+    # A lock another thread held at fork time would never be released in the worker
+    global _user_state_store
+    _user_state_store = None
+
+
+os.register_at_fork(after_in_child=_reset_user_state_store)
@@ -0,0 +1,277 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+from zipfile import BadZipFile
+
+from fastapi import HTTPException
+
+from core.config import JOB_STORE_PATH, JOB_WORKERS, JOB_TTL_SECONDS
+from schemas.search import JobStatus
+from services.admission import Ticket
+from services.metrics import REGISTRY
+from services.pipeline import STAGES, analyze_export
+from services.uploads import open_export, remove_upload
+
+logger = logging.getLogger("wrapped.jobs")
+
+# Progress within a stage reaches the job store at most this often
+JOB_PUBLISH_SECONDS = 0.25
+
+
+class Job:
+    """
+    State of one background analysis. Mutated by the worker, read by the API.
+    Changes are passed to `on_change`. A job run by another worker process is
+    rebuilt from the job store with `stored` set, and never changes.
+    """
+
+    def __init__(self, job_id: str, on_change: Optional[Callable[["Job"], None]] = None):
+        self.id = job_id
+        self.status = "queued"  # queued -> running -> done | failed
+        self.stages: Dict[str, float] = {stage: 0.0 for stage in STAGES}
+        self.result = None
+        self.error: Optional[str] = None
+        self.status_code: Optional[int] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        # Bumped on every change so event streams can tell when to push
+        self.version = 0
+        self.stored = False
+        self._on_change = on_change
+        self._published_at = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, **fields):
+        with self._lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.updated_at = time.time()
+            self.version += 1
+        self._publish(force=True)
+
+    def set_progress(self, stage: str, fraction: float):
+        with self._lock:
+            self.stages[stage] = round(fraction, 3)
+            self.updated_at = time.time()
+            self.version += 1
+        # A stage's start and end are always published
+        self._publish(force=fraction in (0.0, 1.0))
+
+    def _publish(self, force: bool = False):
+        if self._on_change is None:
+            return
+        now = time.monotonic()
+        if force or now - self._published_at >= JOB_PUBLISH_SECONDS:
+            self._published_at = now
+            self._on_change(self)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return self._snapshot()
+
+    def _snapshot(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stages": dict(self.stages),
+            "result": self.result,
+            "error": self.error,
+        }
+
+    def record(self) -> Tuple[str, int, float]:
+        """The snapshot as JSON, with the version and time of the change it reflects."""
+        with self._lock:
+            snapshot, version, updated_at = self._snapshot(), self.version, self.updated_at
+        return JobStatus(**snapshot).model_dump_json(), version, updated_at
+
+
+class JobStore:
+    """
+    Snapshots of jobs in a SQLite file shared by the worker processes, so any
+    of them can answer for a job another one runs. A job's row only moves
+    forward in version; finished jobs expire `ttl` seconds after their last
+    change.
+    """
+
+    def __init__(self, path: str, ttl: int = JOB_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, snapshot TEXT NOT NULL, version INTEGER NOT NULL, "
+                "finished INTEGER NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def put(self, job: Job):
+        snapshot, version, updated_at = job.record()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, snapshot, version, finished, updated) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET snapshot = excluded.snapshot, version = excluded.version, "
+                "finished = excluded.finished, updated = excluded.updated WHERE excluded.version > jobs.version",
+                (job.id, snapshot, version, int(job.finished), updated_at),
+            )
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT snapshot, version, updated FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        snapshot = json.loads(row[0])
+        job = Job(job_id)
+        job.status, job.stages, job.result, job.error = (
+            snapshot["status"], snapshot["stages"], snapshot["result"], snapshot["error"]
+        )
+        job.version, job.updated_at, job.stored = row[1], row[2], True
+        return job
+
+    def purge(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM jobs WHERE finished AND updated < ?", (time.time() - self.ttl,))
+
+
+class JobManager:
+    """
+    Job registry backed by a small worker pool. Jobs run in this process are
+    held in memory and, with a `store`, published to it for the other
+    worker processes.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, ttl: int = JOB_TTL_SECONDS, store: Optional[JobStore] = None):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="wrapped-job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self.ttl = ttl
+        self.store = store
+
+    def submit(
+        self,
+        zip_path: str,
+        year: int,
+        timezone: str,
+        admission: Optional[Ticket] = None,
+        export_id: Optional[str] = None,
+    ) -> Job:
+        """
+        Queue the analysis of a spooled upload, of `export_id` if already
+        hashed. A reserved `admission` ticket is waited on only once a worker
+        thread is about to analyze; the job removes the file, and releases
+        the ticket, when it finishes.
+        """
+        self._purge_expired()
+        job = Job(uuid.uuid4().hex, self._publish if self.store is not None else None)
+        with self._lock:
+            self._jobs[job.id] = job
+        if self.store is not None:
+            self._publish(job)
+        self._executor.submit(self._run, job, zip_path, year, timezone, admission, export_id)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """A job of this process, or as last published by the worker process running it."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            job = self.store.get(job_id)
+        return job
+
+    def _publish(self, job: Job):
+        # Other workers only lose sight of the job's latest progress
+        try:
+            self.store.put(job)
+        except sqlite3.Error as e:
+            logger.warning("Could not publish job %s: %s", job.id, e)
+
+    def _run(
+        self, job: Job, zip_path: str, year: int, timezone: str, admission: Optional[Ticket], export_id: Optional[str]
+    ):
+        job.update(status="running")
+        try:
+            with open_export(zip_path) as zip_file:
+                result = analyze_export(zip_file, year, timezone, job.set_progress, lambda: admission, export_id)
+            job.update(status="done", result=result)
+        except BadZipFile:
+            job.update(status="failed", status_code=400, error="Invalid ZIP file")
+        except json.JSONDecodeError:
+            job.update(status="failed", status_code=400, error="Invalid JSON in conversations.json")
+        except HTTPException as e:
+            job.update(status="failed", status_code=e.status_code, error=str(e.detail))
+        except Exception as e:
+            job.update(status="failed", status_code=500, error=f"Processing error: {str(e)}\n{traceback.format_exc()}")
+        finally:
+            if admission is not None:
+                admission.release()
+            remove_upload(zip_path)
+
+    def status_counts(self) -> Dict[str, int]:
+        counts = {status: 0 for status in ("queued", "running", "done", "failed")}
+        with self._lock:
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        return counts
+
+    def _purge_expired(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.updated_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+        if self.store is not None:
+            try:
+                self.store.purge()
+            except sqlite3.Error as e:
+                logger.warning("Could not purge the job store: %s", e)
+
+
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+def get_job_manager() -> JobManager:
+    global _job_manager
+    if _job_manager is None:
+        with _job_manager_lock:
+            if _job_manager is None:
+                _job_manager = JobManager(store=JobStore(JOB_STORE_PATH) if JOB_STORE_PATH else None)
+    return _job_manager
+
+
+def _reset_job_manager():
+    # Neither the pool's threads nor the store's SQLite connection survive a fork
+    global _job_manager
+    _job_manager = None
+
+
+os.register_at_fork(after_in_child=_reset_job_manager)
+
+
+def _job_samples():
+    if _job_manager is None:
+        return
+    yield (
+        "wrapped_jobs", "gauge", "Background analysis jobs held in memory, by status.",
+        [({"status": status}, count) for status, count in _job_manager.status_counts().items()],
+    )
+
+
+REGISTRY.register_collector(_job_samples)
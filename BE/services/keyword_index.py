@@ -0,0 +1,261 @@
+"""
+Global document frequencies of normalized tokens, so a year's keywords can be
+ranked by how distinctive they are instead of how frequent.
+
+The index holds, for each of INDEX_FEATURES hashed token buckets, the number
+of prompts of a reference corpus containing a token of that bucket. It is one
+uncompressed Arrow IPC file (a "df" column, with the document count, the
+counted sources and a version in its metadata) that the API memory-maps, so
+loading is zero-copy and only the buckets a user's tokens fall in are paged
+in. Building it again over more exports or prompts files adds their counts to
+the existing ones; sources already counted are skipped, by export id, so an
+export and the prompts file written from it are counted once.
+
+A year's keywords are scored as a sparse tf-idf vector over the same buckets:
+each distinct token is hashed once and weighted (1 + ln tf) * idf, with the
+smoothed idf ln((1 + N) / (1 + df)) + 1 of its bucket. That is linear in the
+number of distinct tokens and independent of the index size. Tokens used
+fewer than DISTINCTIVE_MIN_COUNT times are never distinctive (typos and
+one-offs have the highest idf of all).
+
+Build or update the index from exports or prompts files (run from BE/):
+    python -m services.keyword_index ~/exports/*.zip cache/prompts/*.arrow --out ../Model/keyword_index.arrow
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.config import KEYWORD_INDEX_PATH
+
+logger = logging.getLogger("wrapped.keyword_index")
+
+INDEX_FEATURES = 2 ** 20
+# Bump when the hashing or the columns change; files of another format are rebuilt
+INDEX_FORMAT = b"1"
+DISTINCTIVE_MIN_COUNT = 2
+
+
+def token_buckets(tokens: Sequence[str], n_features: int) -> np.ndarray:
+    """Hashed bucket of every token."""
+    from sklearn.utils import murmurhash3_32
+
+    return np.fromiter(
+        (murmurhash3_32(token, positive=True) % n_features for token in tokens), dtype=np.int64, count=len(tokens)
+    )
+
+
+def document_frequencies(texts: Iterable[str], n_features: int = INDEX_FEATURES) -> Tuple[np.ndarray, int]:
+    """Per-bucket counts of the normalized texts containing a token of the bucket, and the text count."""
+    from sklearn.utils import murmurhash3_32
+
+    # Corpora repeat the same few thousand tokens, so each is hashed once
+    buckets: Dict[str, int] = {}
+    hits: List[int] = []
+    documents = 0
+    for text in texts:
+        tokens = text.split()
+        if not tokens:
+            continue
+        documents += 1
+        seen = set()
+        for token in tokens:
+            bucket = buckets.get(token)
+            if bucket is None:
+                bucket = buckets[token] = murmurhash3_32(token, positive=True) % n_features
+            seen.add(bucket)
+        hits.extend(seen)
+    return np.bincount(np.asarray(hits, dtype=np.int64), minlength=n_features), documents
+
+
+class KeywordIndex:
+    """A memory-mapped index file. Read-only and safe to share between threads."""
+
+    def __init__(self, path: str):
+        import pyarrow as pa
+
+        table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+        metadata = table.schema.metadata or {}
+        if metadata.get(b"format") != INDEX_FORMAT:
+            raise ValueError(f"{path} is not a keyword index of format {INDEX_FORMAT.decode()}")
+        self.path = path
+        # One chunk, viewed in place
+        self.df = table.column("df").chunk(0).to_numpy(zero_copy_only=True)
+        self.n_features = len(self.df)
+        self.documents = int(metadata[b"documents"])
+        self.sources = json.loads(metadata[b"sources"])
+        self.version = metadata[b"version"].decode()
+
+    def idf(self, buckets: np.ndarray) -> np.ndarray:
+        return np.log((1 + self.documents) / (1 + self.df[buckets])) + 1
+
+    def distinctive(
+        self, counts: Iterable[Tuple[str, int]], n: int = 8, min_count: int = DISTINCTIVE_MIN_COUNT
+    ) -> List[Tuple[str, int, float]]:
+        """The `n` highest tf-idf (token, count, score) of a year's token counts, best first."""
+        terms = [(token, count) for token, count in counts if count >= min_count]
+        if not terms:
+            return []
+        tokens = [token for token, _ in terms]
+        tf = np.fromiter((count for _, count in terms), dtype=np.float64, count=len(terms))
+        scores = (1 + np.log(tf)) * self.idf(token_buckets(tokens, self.n_features))
+        best = np.argpartition(-scores, n)[:n] if len(scores) > n else np.arange(len(scores))
+        ranked = sorted(best.tolist(), key=lambda i: (-scores[i], tokens[i]))
+        return [(tokens[i], terms[i][1], round(float(scores[i]), 3)) for i in ranked]
+
+    def info(self) -> dict:
+        return {"version": self.version, "path": self.path, "documents": self.documents, "sources": len(self.sources)}
+
+
+def index_version(sources: Iterable[str], n_features: int) -> str:
+    digest = hashlib.sha256(json.dumps([n_features, sorted(sources)]).encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+def write_index(path: str, df: np.ndarray, documents: int, sources: List[str]):
+    """Write an index file atomically; readers keep the file they mapped."""
+    import pyarrow as pa
+
+    table = pa.table({"df": pa.array(np.asarray(df, dtype=np.int64))}).replace_schema_metadata({
+        "format": INDEX_FORMAT,
+        "documents": str(documents),
+        "sources": json.dumps(sources),
+        "version": index_version(sources, len(df)),
+    })
+    directory = os.path.dirname(path) or "."
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    os.close(fd)
+    try:
+        with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def source_id(path: str) -> str:
+    """
+    Id of a corpus file: the export id of a ZIP or of the export a prompts file
+    records, else (older prompts files) the SHA-256 of the file.
+    """
+    if path.endswith(".arrow"):
+        from services.prompt_store import prompts_export_id
+
+        export_id = prompts_export_id(path)
+        if export_id is not None:
+            return export_id
+    elif path.endswith(".zip"):
+        from zipfile import ZipFile
+
+        from services.pipeline import export_digest
+
+        with ZipFile(path) as zip_file:
+            return export_digest(zip_file)
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def normalized_texts(path: str) -> List[str]:
+    """Normalized prompts of an export ZIP, or the "normalized" column of a prompts file."""
+    if path.endswith(".arrow"):
+        from services.prompt_store import read_prompts
+
+        return read_prompts(path, ["normalized"]).column("normalized").to_pylist()
+
+    from zipfile import ZipFile
+
+    from services.pipeline import normalize_texts, parse_export
+
+    with ZipFile(path) as zip_file:
+        return normalize_texts(parse_export(zip_file).texts)
+
+
+# Loaded before serve.py forks and deliberately kept across the fork: the
+# read-only memory map is shared by every worker
+_keyword_index = None
+_keyword_index_lock = threading.Lock()
+
+def get_keyword_index() -> Optional[KeywordIndex]:
+    """Process-wide index, or None when KEYWORD_INDEX_PATH is empty, missing or unreadable."""
+    global _keyword_index
+    if _keyword_index is None and KEYWORD_INDEX_PATH:
+        with _keyword_index_lock:
+            if _keyword_index is None:
+                from services.prompt_store import pyarrow_available
+
+                if not pyarrow_available():
+                    logger.info("pyarrow is not installed; distinctive keywords are disabled")
+                    _keyword_index = False
+                    return None
+                try:
+                    _keyword_index = KeywordIndex(KEYWORD_INDEX_PATH)
+                except FileNotFoundError:
+                    logger.info("No keyword index at %s; distinctive keywords are disabled", KEYWORD_INDEX_PATH)
+                    _keyword_index = False
+                except Exception as e:
+                    logger.warning("Ignoring unreadable keyword index %s: %s", KEYWORD_INDEX_PATH, e)
+                    _keyword_index = False
+    return _keyword_index or None
+
+
+def keyword_index_info() -> Optional[dict]:
+    """The loaded index's version and size, for diagnostics."""
+    return _keyword_index.info() if _keyword_index else None
+
+
+def main():
+    import argparse
+    import sys
+    import time
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", nargs="+", help="Export ZIPs and/or .arrow prompts files")
+    parser.add_argument("--out", required=True, help="Index file to create, or to update if it exists")
+    parser.add_argument("--features", type=int, default=INDEX_FEATURES, help="Hashed buckets of a new index")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if os.path.exists(args.out):
+        index = KeywordIndex(args.out)
+        df, documents, sources = np.array(index.df), index.documents, list(index.sources)
+    else:
+        df, documents, sources = np.zeros(args.features, dtype=np.int64), 0, []
+
+    counted = set(sources)
+    added = 0
+    for path in args.corpus:
+        source = source_id(path)
+        if source in counted:
+            print(f"{path}: already counted", file=sys.stderr)
+            continue
+        frequencies, n = document_frequencies(normalized_texts(path), len(df))
+        df += frequencies
+        documents += n
+        added += n
+        counted.add(source)
+        sources.append(source)
+        print(f"{path}: {n} prompts", file=sys.stderr)
+
+    write_index(args.out, df, documents, sources)
+    print(json.dumps({
+        "out": args.out,
+        "version": index_version(sources, len(df)),
+        "documents": documents,
+        "documents_added": added,
+        "sources": len(sources),
+        "bytes": os.path.getsize(args.out),
+        "seconds": round(time.perf_counter() - start, 2),
+    }))
+
+
+if __name__ == "__main__":
+    main()
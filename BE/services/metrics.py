@@ -0,0 +1,243 @@
+"""
+Process-local metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms with labels, plus collectors that read
+existing stats (lemma cache, jobs) at scrape time. With WEB_WORKERS > 1 each
+worker keeps its own values; /metrics reports the worker that served it.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+LabelValues = Tuple[str, ...]
+
+# Seconds, for request and pipeline stage latencies
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Uploaded ZIP sizes, 64 KiB to 1 GiB
+SIZE_BUCKETS = tuple(float(1 << shift) for shift in range(16, 31, 2))
+# Prompts per export
+COUNT_BUCKETS = (100, 300, 1_000, 3_000, 10_000, 30_000, 100_000, 300_000, 1_000_000)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class _ValueMetric(_Metric):
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        if not values and not self.label_names:
+            values[()] = 0
+        return self.header() + [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Counter(_ValueMetric):
+    kind = "counter"
+
+
+class Gauge(_ValueMetric):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    @contextmanager
+    def track_in_progress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> [per-bucket counts..., sum, count]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = {key: list(state) for key, state in self._values.items()}
+        lines = self.header()
+        bucket_labels = self.label_names + ("le",)
+        for key, state in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(bucket_labels, key + (_format_value(bound),))} {cumulative}"
+                )
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {state[-1]}")
+        return lines
+
+
+Sample = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]  # name, kind, help, [(labels, value)]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Duplicate metric {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[Sample]]):
+        """`collector()` is called on every scrape and returns samples to report."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            for name, kind, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels, labels.values())} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labels: Tuple[str, ...] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labels))
+
+
+def gauge(name: str, documentation: str, labels: Tuple[str, ...] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labels))
+
+
+def histogram(name: str, documentation: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labels, buckets))
+
+
+# HTTP
+HTTP_REQUESTS = counter("wrapped_http_requests_total", "HTTP requests by method, route and status.", ("method", "route", "status"))
+HTTP_LATENCY = histogram("wrapped_http_request_seconds", "HTTP request latency by method and route.", ("method", "route"))
+HTTP_IN_FLIGHT = gauge("wrapped_http_requests_in_flight", "HTTP requests currently being served.")
+
+# Pipeline
+STAGE_SECONDS = histogram("wrapped_stage_seconds", "Time spent in each analysis pipeline stage.", ("stage",))
+ANALYSES_IN_FLIGHT = gauge("wrapped_analyses_in_flight", "Export analyses currently running.")
+ANALYSES = counter("wrapped_analyses_total", "Finished export analyses by outcome.", ("outcome",))
+UPLOAD_BYTES = histogram("wrapped_upload_bytes", "Size of uploaded export archives.", buckets=SIZE_BUCKETS)
+EXPORT_PROMPTS = histogram("wrapped_export_prompts", "User prompts per analyzed export.", buckets=COUNT_BUCKETS)
+PROMPTS_PARSED = counter("wrapped_prompts_parsed_total", "User prompts extracted from uploaded exports.")
+PROMPTS_CLASSIFIED = counter("wrapped_prompts_classified_total", "Prompts sent to the topic model.")
+TOPIC_SAMPLES_TRUNCATED = counter("wrapped_topic_samples_truncated_total", "Year topic samples cut short by the time budget.")
+CACHE_LOOKUPS = counter("wrapped_cache_lookups_total", "Cache lookups by cache and result.", ("cache", "result"))
+
+# Admission control (queue depth and cost are reported by services.admission)
+ADMISSION_WAIT_SECONDS = histogram("wrapped_admission_wait_seconds", "Time analyses waited in the admission queue.")
+ADMISSION_REJECTED = counter("wrapped_admission_rejected_total", "Analyses refused with 429 by reason.", ("reason",))
+
+
+def _lemma_cache_samples():
+    from services.text import lemma_cache_stats
+
+    # Reported once a request has created the cache; scraping never loads WordNet
+    stats = lemma_cache_stats()
+    if stats is None:
+        return
+    yield (
+        "wrapped_lemma_cache_lookups_total", "counter", "Lemma cache lookups by result.",
+        [({"result": "hit"}, stats["hits"]), ({"result": "miss"}, stats["misses"])],
+    )
+    yield ("wrapped_lemma_cache_entries", "gauge", "Entries in the lemma cache.", [({}, stats["size"])])
+
+
+REGISTRY.register_collector(_lemma_cache_samples)
+
+
+def render() -> str:
+    return REGISTRY.render()
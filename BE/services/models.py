@@ -0,0 +1,174 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from core.config import MBTI_MODEL_PATH, TOPIC_STUDENT_PATH
+
+MBTI_MODEL = "mbti"
+TOPIC_STUDENT_MODEL = "topic_student"
+
+logger = logging.getLogger("wrapped.models")
+
+
+class Prediction(NamedTuple):
+    label: str
+    confidence: float
+
+
+class ModelBundle:
+    """
+    A trained classifier loaded from a `{"model": ..., "classes": ...}` bundle.
+
+    The version is the bundle's own "version" entry if it has one, otherwise a
+    prefix of the file's SHA-256, so a retrained file is never mistaken for
+    the old one. Features come from the bundle's fitted "vectorizer", or from
+    its training "vocabulary" (terms in column order, or a term -> column
+    dict like a vectorizer's `vocabulary_`) and optional "idf" weights,
+    applied to the user's keyword counts as a single l2-normalized TF-IDF
+    document. A bundle with neither cannot build the columns it was trained
+    on, so it makes no predictions and callers fall back to their heuristic.
+    Bundles may record how well they agree with the model they were distilled
+    from under "agreement". Predictions are read-only on the model and safe
+    to run from several threads.
+    """
+
+    def __init__(self, name: str, path: str):
+        import joblib
+
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        bundle = joblib.load(path)
+
+        self.name = name
+        self.path = path
+        self.model = bundle["model"]
+        self.classes = np.asarray(bundle["classes"])
+        self.vectorizer = bundle.get("vectorizer")
+        vocabulary = bundle.get("vocabulary")
+        if vocabulary is not None and not isinstance(vocabulary, dict):
+            vocabulary = {term: column for column, term in enumerate(vocabulary)}
+        self.vocabulary: Optional[Dict[str, int]] = vocabulary
+        self.idf = np.asarray(bundle["idf"], dtype=np.float64) if bundle.get("idf") is not None else None
+        self.agreement = bundle.get("agreement")
+        self.version = str(bundle.get("version") or digest[:12])
+        self.n_features = int(getattr(self.model, "n_features_in_", 5000))
+        self.loaded_at = time.time()
+        if not self.has_features:
+            logger.warning("%s bundle at %s has no vectorizer or vocabulary; its predictions are disabled", name, path)
+
+    @property
+    def has_features(self) -> bool:
+        """Whether the bundle can build the feature columns its model was trained on."""
+        return self.vectorizer is not None or self.vocabulary is not None
+
+    def features(self, keyword_counter: Counter) -> np.ndarray:
+        """Feature vector of one document, given the counts of its normalized tokens."""
+        if self.vectorizer is not None:
+            return self.vectorizer.transform([" ".join(keyword_counter.elements())]).toarray()[0]
+        if self.vocabulary is None:
+            raise ValueError(f"{self.name} bundle has no vectorizer or vocabulary")
+
+        vector = np.zeros(self.n_features, dtype=np.float64)
+        for term, count in keyword_counter.items():
+            column = self.vocabulary.get(term)
+            if column is not None and count > 0:
+                vector[column] = count
+        if self.idf is not None:
+            vector[:len(self.idf)] *= self.idf
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector.astype(np.float32)
+
+    def predict(self, keyword_counters: List[Counter]) -> List[Prediction]:
+        """Label and probability of several documents with one predict_proba call."""
+        if not keyword_counters:
+            return []
+        matrix = np.vstack([self.features(counter) for counter in keyword_counters])
+        probabilities = self.model.predict_proba(matrix)
+        best = probabilities.argmax(axis=1)
+        return [
+            Prediction(str(self.classes[i]), round(float(row[i]), 4))
+            for i, row in zip(best.tolist(), probabilities)
+        ]
+
+    def predict_texts(self, texts: List[str]) -> Tuple[List[str], List[float]]:
+        """Label and probability of raw texts, through the bundle's vectorizer."""
+        if not texts:
+            return [], []
+        # Sparse rows straight into the linear model; never densified
+        probabilities = self.model.predict_proba(self.vectorizer.transform(texts))
+        best = probabilities.argmax(axis=1)
+        return self.classes[best].tolist(), probabilities[np.arange(len(texts)), best].tolist()
+
+    def info(self) -> dict:
+        info = {
+            "version": self.version, "path": self.path, "n_features": self.n_features, "loaded_at": self.loaded_at,
+            "features": "vectorizer" if self.vectorizer is not None else "vocabulary" if self.vocabulary is not None else None,
+        }
+        if self.agreement is not None:
+            info["agreement"] = self.agreement
+        return info
+
+
+class ModelRegistry:
+    """
+    Process-wide bundles by name. Each is loaded at most once; a bundle that
+    fails to load is remembered as missing so callers fall back instead of
+    retrying the load on every request.
+    """
+
+    def __init__(self, paths: Dict[str, str]):
+        self._paths = paths
+        self._bundles: Dict[str, Optional[ModelBundle]] = {}
+        self._errors: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Optional[ModelBundle]:
+        if name in self._bundles:
+            return self._bundles[name]
+        with self._lock:
+            if name not in self._bundles:
+                self._bundles[name] = self._load(name)
+            return self._bundles[name]
+
+    def _load(self, name: str) -> Optional[ModelBundle]:
+        path = self._paths.get(name)
+        if not path:
+            return None
+        if not os.path.exists(path):
+            self._errors[name] = f"No model bundle at {path}"
+            logger.warning("%s model unavailable: %s", name, self._errors[name])
+            return None
+        try:
+            return ModelBundle(name, path)
+        except Exception as e:
+            self._errors[name] = f"{type(e).__name__}: {e}"
+            logger.exception("Failed to load %s model from %s", name, path)
+            return None
+
+    def versions(self) -> Dict[str, dict]:
+        """Loaded bundles and their versions, plus load errors, for diagnostics."""
+        with self._lock:
+            loaded = {name: bundle.info() for name, bundle in self._bundles.items() if bundle is not None}
+            loaded.update({name: {"error": error} for name, error in self._errors.items()})
+            return loaded
+
+
+_model_registry = None
+_model_registry_lock = threading.Lock()
+
+def get_model_registry() -> ModelRegistry:
+    global _model_registry
+    if _model_registry is None:
+        with _model_registry_lock:
+            if _model_registry is None:
+                _model_registry = ModelRegistry({MBTI_MODEL: MBTI_MODEL_PATH, TOPIC_STUDENT_MODEL: TOPIC_STUDENT_PATH})
+    return _model_registry
+
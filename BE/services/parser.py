@@ -0,0 +1,269 @@
+import hashlib
+import io
+import json
+from array import array
+from itertools import chain
+from typing import IO, Any, Callable, Iterator, List, NamedTuple, Optional, Tuple
+from zipfile import ZipFile
+
+import numpy as np
+
+# Characters read from the ZIP member per refill of the decode buffer
+READ_CHUNK_SIZE = 1 << 16
+
+_WHITESPACE = " \t\n\r"
+_decoder = json.JSONDecoder()
+
+
+class _StreamBuffer:
+    """
+    Sliding text window over a binary stream.
+    Consumed text is dropped so the window only ever holds the value being decoded.
+    """
+
+    def __init__(self, stream: IO[bytes], chunk_size: int = READ_CHUNK_SIZE):
+        self._reader = io.TextIOWrapper(stream, encoding="utf-8-sig")
+        self._chunk_size = chunk_size
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size: int = 0) -> bool:
+        if self.eof:
+            return False
+        chunk = self._reader.read(max(size, self._chunk_size))
+        if not chunk:
+            self.eof = True
+            return False
+        self.text = self.text[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Return the next non-whitespace character without consuming it ('' at EOF)."""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ""
+
+    def decode_value(self) -> Any:
+        """Decode one complete JSON value starting at the next non-whitespace character."""
+        self.peek()
+        needed = self._chunk_size
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+                # A scalar that ends exactly at the window edge may have been cut short
+                if end < len(self.text) or self.eof:
+                    self.pos = end
+                    if self.pos > self._chunk_size:
+                        self.text = self.text[self.pos:]
+                        self.pos = 0
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # Grow geometrically so a large conversation is re-scanned O(log n) times
+            self.fill(needed)
+            needed *= 2
+
+
+class HashingReader(io.BufferedIOBase):
+    """Read-through wrapper that feeds every byte read into a hashlib digest."""
+
+    def __init__(self, raw: IO[bytes], digest):
+        self._raw = raw
+        self.digest = digest
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._raw.read(size)
+        self.digest.update(data)
+        return data
+
+    def read1(self, size: int = -1) -> bytes:
+        data = self._raw.read1(size) if hasattr(self._raw, "read1") else self._raw.read(size)
+        self.digest.update(data)
+        return data
+
+    def tell(self) -> int:
+        return self._raw.tell()
+
+
+def iter_conversations(stream: IO[bytes]) -> Iterator[Any]:
+    """
+    Incrementally decode the top-level array of conversations.json.
+    Yields one conversation at a time; only the current one is held in memory.
+    """
+    buf = _StreamBuffer(stream)
+    head = buf.peek()
+    if head == "":
+        raise json.JSONDecodeError("Expecting value", "", 0)
+    if head != "[":
+        # Not an array of conversations: validate it, but there is nothing to iterate
+        buf.decode_value()
+        return
+    buf.pos += 1
+
+    if buf.peek() == "]":
+        return
+    while True:
+        yield buf.decode_value()
+        sep = buf.peek()
+        if sep == ",":
+            buf.pos += 1
+        elif sep == "]":
+            return
+        else:
+            raise json.JSONDecodeError("Expecting ',' delimiter", buf.text, buf.pos)
+
+
+def extract_prompts(conv: Any) -> Iterator[Tuple[str, float]]:
+    """Yield (prompt, timestamp) for every user message of a single conversation."""
+    # Handle both array and object structures
+    if isinstance(conv, list):
+        # Flat list of messages
+        for item in conv:
+            if isinstance(item, dict) and item.get("role") == "user":
+                text = item.get("content", item.get("text", ""))
+                timestamp = item.get("create_time", item.get("timestamp", 0))
+                if text and isinstance(text, str) and text.strip() and timestamp:
+                    yield text, float(timestamp)
+        return
+
+    if not isinstance(conv, dict):
+        return
+
+    mapping = conv.get("mapping", {})
+
+    for key, value in mapping.items():
+        if not isinstance(value, dict):
+            continue
+
+        message = value.get("message")
+        if not isinstance(message, dict):
+            continue
+
+        # Only process user messages
+        if message.get("author", {}).get("role") != "user":
+            continue
+
+        content = message.get("content")
+        if not isinstance(content, dict):
+            continue
+
+        create_time = message.get("create_time", 0)
+        if not create_time:
+            continue
+
+        timestamp = float(create_time)
+
+        parts = content.get("parts")
+        if isinstance(parts, list):
+            for p in parts:
+                if isinstance(p, str) and p.strip():
+                    yield p, timestamp
+
+
+def conversation_key(conv: Any) -> Tuple[Optional[str], Optional[float]]:
+    """(id, update_time) of a conversation, or (None, None) for layouts without them."""
+    if not isinstance(conv, dict):
+        return None, None
+    conv_id = conv.get("conversation_id") or conv.get("id")
+    update_time = conv.get("update_time")
+    if not isinstance(conv_id, str) or not isinstance(update_time, (int, float)):
+        return None, None
+    return conv_id, float(update_time)
+
+
+def export_user_id(zip_file: ZipFile) -> Optional[str]:
+    """Account id from the user.json member of an export, if it has one."""
+    for info in zip_file.infolist():
+        if info.filename.endswith('user.json'):
+            try:
+                with zip_file.open(info) as f:
+                    user = json.load(f)
+            except (ValueError, UnicodeDecodeError):
+                return None
+            user_id = user.get("id") if isinstance(user, dict) else None
+            return user_id if isinstance(user_id, str) and user_id else None
+    return None
+
+
+class MemberPrompts(NamedTuple):
+    """
+    Prompts of one conversations member as columns: cheap to pickle back from
+    a worker process, and merged by concatenation.
+    """
+    digest: str                     # SHA-256 of the member
+    texts: List[str]
+    timestamps: np.ndarray          # float64, one per text
+    conversation_ids: List[Optional[str]]
+    update_times: List[Optional[float]]  # of each conversation, None when unknown
+    conversation_sizes: np.ndarray  # int64, texts of each conversation
+
+
+def parse_member(
+    stream: IO[bytes], report: Optional[Callable[[int], None]] = None, report_every: int = 200
+) -> MemberPrompts:
+    """
+    Every prompt of a conversations.json byte stream, hashing the stream as it
+    is read. `report(bytes_read)` is called every `report_every` conversations.
+    """
+    reader = HashingReader(stream, hashlib.sha256())
+    texts: List[str] = []
+    timestamps = array("d")
+    conversation_ids = []
+    update_times = []
+    conversation_sizes = array("q")
+    for n, conv in enumerate(iter_conversations(reader), 1):
+        before = len(texts)
+        for text, timestamp in extract_prompts(conv):
+            texts.append(text)
+            timestamps.append(timestamp)
+        conv_id, update_time = conversation_key(conv)
+        conversation_ids.append(conv_id)
+        update_times.append(update_time)
+        conversation_sizes.append(len(texts) - before)
+        if report is not None and n % report_every == 0:
+            report(reader.tell())
+    # Hash whatever trails the array too
+    while reader.read(1 << 16):
+        pass
+    return MemberPrompts(
+        reader.digest.hexdigest(),
+        texts,
+        np.frombuffer(timestamps, dtype=np.float64),
+        conversation_ids,
+        update_times,
+        np.frombuffer(conversation_sizes, dtype=np.int64),
+    )
+
+
+def parse_archive_member(archive_path: str, member: str) -> MemberPrompts:
+    """parse_member on one member of a ZIP on disk; the unit of work of parallel parsing."""
+    with ZipFile(archive_path) as zip_file, zip_file.open(member) as stream:
+        return parse_member(stream)
+
+
+def concat_members(
+    parts: List[MemberPrompts],
+) -> Tuple[List[str], np.ndarray, List[Optional[str]], List[Optional[float]], np.ndarray]:
+    """(texts, timestamps, conversation_ids, update_times, conversation_sizes) of several members, in order."""
+    texts = list(chain.from_iterable(part.texts for part in parts))
+    conversation_ids = list(chain.from_iterable(part.conversation_ids for part in parts))
+    update_times = list(chain.from_iterable(part.update_times for part in parts))
+    timestamps = np.concatenate([part.timestamps for part in parts]) if parts else np.empty(0, np.float64)
+    sizes = np.concatenate([part.conversation_sizes for part in parts]) if parts else np.empty(0, np.int64)
+    return texts, timestamps, conversation_ids, update_times, sizes
+
+
+def iter_prompts(stream: IO[bytes]) -> Iterator[Tuple[str, float]]:
+    """Stream (prompt, timestamp) records out of a conversations.json byte stream."""
+    for conv in iter_conversations(stream):
+        yield from extract_prompts(conv)
@@ -0,0 +1,851 @@
+import hashlib
+import os
+import re
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Hashable, List, NamedTuple, Optional, Sequence, Tuple, Union
+from zipfile import ZipFile, ZipInfo
+
+import numpy as np
+from fastapi import HTTPException
+
+from core.config import (
+    DEFAULT_TARGET_YEAR,
+    DEFAULT_TIMEZONE,
+    MAX_UNCOMPRESSED_BYTES,
+    MAX_COMPRESSION_RATIO,
+    PARSE_WORKERS,
+    TOP_EXACT_MAX_ROWS,
+    TOP_PROMPTS_CAPACITY,
+    TOP_KEYWORDS_CAPACITY,
+    TOPIC_SAMPLE_MIN,
+    TOPIC_SAMPLE_ROUND,
+    TOPIC_SAMPLE_MAX,
+    TOPIC_CI_HALF_WIDTH,
+    TOPIC_SAMPLE_PER_CONVERSATION,
+)
+from schemas.search import WrappedResponse, DistinctiveKeyword, KeywordFrequency, MonthFrequency
+from services.admission import Ticket
+from services.aggregation import (
+    ExportAggregates,
+    LocalTimes,
+    count_rows,
+    to_local_times,
+    heatmap_by_day,
+    classify_early_bird,
+    get_aggregate_store,
+)
+from services.incremental import (
+    ConversationPartial,
+    UserState,
+    build_partials,
+    merge_partials,
+    get_user_state_store,
+)
+from services.keyword_index import get_keyword_index
+from services.metrics import (
+    ANALYSES,
+    ANALYSES_IN_FLIGHT,
+    CACHE_LOOKUPS,
+    EXPORT_PROMPTS,
+    PROMPTS_PARSED,
+    STAGE_SECONDS,
+)
+from services.models import MBTI_MODEL, ModelBundle, get_model_registry
+from services.parser import (
+    MemberPrompts,
+    concat_members,
+    export_user_id,
+    parse_archive_member,
+    parse_member,
+)
+from services.prompt_store import PromptStore, StoredPrompts, get_prompt_store
+from services.result_cache import get_result_cache, result_key
+from services.sampling import conversation_clusters, row_clusters, sample_topics
+from services.text import normalize_prompts
+from services.topics import classify_topics, labels_every_prompt, topic_model_id
+
+# Pipeline stages in execution order, as reported to progress callbacks
+STAGES = ("parse", "normalize", "classify", "aggregate")
+
+# Rows per normalization chunk; progress is reported after each one
+NORMALIZE_CHUNK_SIZE = 5000
+# Parse progress is reported every this many conversations
+PARSE_REPORT_EVERY = 200
+# Prompts per year sent to topic classification, and characters kept of each
+TOPIC_PROMPT_CHARS = 500
+# Members smaller than this are not held to MAX_COMPRESSION_RATIO
+RATIO_CHECK_MIN_BYTES = 1 << 20
+# Conversations members: conversations.json, or the numbered parts of a
+# split export (conversations-000.json, ...), at the root or in a folder
+CONVERSATIONS_MEMBER = re.compile(r"(?:^|/)conversations(?:[-_ ]?(\d+))?\.json$")
+# Split exports smaller than this are parsed in-process; below it, starting
+# the work in other processes costs more than it saves
+PARALLEL_PARSE_MIN_BYTES = 8 << 20
+# Bump when the response changes for the same export and parameters, so
+# cached results from older code are not served
+RESPONSE_FORMAT = 5
+
+ProgressCallback = Callable[[str, float], None]
+# A conversation's id (None when unknown or repeated) and its partial
+UserPartial = Tuple[Optional[str], ConversationPartial]
+
+
+def _noop_progress(stage: str, fraction: float):
+    pass
+
+
+def check_archive(zip_file: ZipFile):
+    """
+    Reject archives whose members would decompress to more than the configured
+    limits, before any of them is read. The declared sizes can be trusted as
+    an upper bound: zipfile stops at the declared size and fails the CRC check
+    if the stream holds more.
+    """
+    members = _conversations_members(zip_file)
+    checked = members + [info for info in zip_file.infolist() if info.filename.endswith("user.json")]
+    for info in checked:
+        if info.file_size > MAX_UNCOMPRESSED_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"{info.filename} exceeds the {MAX_UNCOMPRESSED_BYTES // (1024 * 1024)} MiB uncompressed limit",
+            )
+        if info.file_size >= RATIO_CHECK_MIN_BYTES and info.file_size > MAX_COMPRESSION_RATIO * max(info.compress_size, 1):
+            raise HTTPException(status_code=413, detail=f"{info.filename} has a suspicious compression ratio")
+    if sum(info.file_size for info in members) > MAX_UNCOMPRESSED_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Conversations exceed the {MAX_UNCOMPRESSED_BYTES // (1024 * 1024)} MiB uncompressed limit",
+        )
+
+
+def _member_order(indexed: Tuple[int, ZipInfo]) -> Tuple[int, int]:
+    index, info = indexed
+    number = CONVERSATIONS_MEMBER.search(info.filename).group(1)
+    return (int(number) if number is not None else -1, index)
+
+
+def _conversations_members(zip_file: ZipFile) -> List[ZipInfo]:
+    """
+    The conversations members of an export in conversation order: by part
+    number, then archive order. A member repeated in another folder is read once.
+    """
+    candidates = [
+        (index, info) for index, info in enumerate(zip_file.infolist())
+        if not info.is_dir() and CONVERSATIONS_MEMBER.search(info.filename)
+    ]
+    members = []
+    seen = set()
+    for _, info in sorted(candidates, key=_member_order):
+        if (info.CRC, info.file_size) not in seen:
+            seen.add((info.CRC, info.file_size))
+            members.append(info)
+    return members
+
+
+def conversations_bytes(zip_file: ZipFile) -> int:
+    """Uncompressed size of the conversations members, which tracks the export's prompt count."""
+    return sum(info.file_size for info in _conversations_members(zip_file))
+
+
+def _combined_digest(digests: List[str]) -> str:
+    # A single member keeps its own SHA-256, so ids of unsplit exports stay
+    # what they have always been
+    if len(digests) == 1:
+        return digests[0]
+    combined = hashlib.sha256()
+    for digest in digests:
+        combined.update(bytes.fromhex(digest))
+    return combined.hexdigest()
+
+
+def export_digest(zip_file: ZipFile) -> str:
+    """
+    The export id (SHA-256 of the conversations member, or of the members'
+    digests in a split export) without parsing, so repeat uploads can be
+    answered from the caches straight away.
+    """
+    members = _conversations_members(zip_file)
+    if not members:
+        raise HTTPException(status_code=400, detail="No conversations.json found in ZIP")
+    digests = []
+    with STAGE_SECONDS.time(stage="hash"):
+        for info in members:
+            digest = hashlib.sha256()
+            with zip_file.open(info) as member:
+                while True:
+                    chunk = member.read(1 << 20)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+            digests.append(digest.hexdigest())
+    return _combined_digest(digests)
+
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+def get_parse_pool() -> Optional[ProcessPoolExecutor]:
+    """Process-wide pool for parsing split exports, or None when PARSE_WORKERS is 1."""
+    global _parse_pool
+    if _parse_pool is None and PARSE_WORKERS > 1:
+        with _parse_pool_lock:
+            if _parse_pool is None:
+                import multiprocessing
+
+                # Spawned, not forked: the API process has threads and model
+                # weights that parse workers neither need nor may safely inherit
+                _parse_pool = ProcessPoolExecutor(
+                    max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+                )
+    return _parse_pool
+
+
+def _reset_parse_pool():
+    # The pool's threads and pipes do not survive a fork; each worker starts its own
+    global _parse_pool
+    _parse_pool = None
+
+
+os.register_at_fork(after_in_child=_reset_parse_pool)
+
+
+def _parse_members(zip_file: ZipFile, members: List[ZipInfo], progress: ProgressCallback) -> List[MemberPrompts]:
+    """
+    Parse every member, in a process pool when the export is split into
+    several large enough members and the archive is on disk for the workers
+    to open. Results come back in member order whichever finishes first.
+    """
+    total_bytes = sum(info.file_size for info in members)
+    pool = get_parse_pool() if len(members) > 1 and total_bytes >= PARALLEL_PARSE_MIN_BYTES else None
+    if pool is not None and zip_file.filename:
+        futures = {
+            pool.submit(parse_archive_member, zip_file.filename, info.filename): i
+            for i, info in enumerate(members)
+        }
+        parts: List[Optional[MemberPrompts]] = [None] * len(members)
+        done_bytes = 0
+        for future in as_completed(futures):
+            i = futures[future]
+            parts[i] = future.result()
+            done_bytes += members[i].file_size
+            progress("parse", min(done_bytes / max(total_bytes, 1), 0.99))
+        return parts
+
+    parts = []
+    done_bytes = 0
+    for info in members:
+        def report(position: int, offset: int = done_bytes):
+            if total_bytes:
+                progress("parse", min((offset + position) / total_bytes, 0.99))
+
+        with zip_file.open(info) as member:
+            parts.append(parse_member(member, report, PARSE_REPORT_EVERY))
+        done_bytes += info.file_size
+    return parts
+
+
+class ParsedExport(NamedTuple):
+    export_id: str
+    texts: List[str]                       # prompts, in file order
+    timestamps: np.ndarray                 # float64, one per text
+    conversation_ids: List[Optional[str]]
+    update_times: List[Optional[float]]
+    conversation_sizes: np.ndarray         # int64, texts of each conversation
+
+
+def parse_export(zip_file: ZipFile, progress: ProgressCallback = _noop_progress) -> ParsedExport:
+    """
+    Every prompt of an export and its timestamp, as columns, with the
+    conversation each came from. The members of a split export are parsed
+    concurrently.
+    """
+    progress("parse", 0.0)
+    members = _conversations_members(zip_file)
+    with STAGE_SECONDS.time(stage="parse"):
+        parts = _parse_members(zip_file, members, progress)
+        texts, timestamps, conversation_ids, update_times, sizes = concat_members(parts)
+    if not conversation_ids:
+        raise HTTPException(status_code=400, detail="No conversations.json found in ZIP")
+    progress("parse", 1.0)
+    export_id = _combined_digest([part.digest for part in parts])
+
+    if not texts:
+        raise HTTPException(status_code=400, detail="No user prompts found in conversations")
+
+    PROMPTS_PARSED.inc(len(texts))
+    EXPORT_PROMPTS.observe(len(texts))
+    return ParsedExport(export_id, texts, timestamps, conversation_ids, update_times, sizes)
+
+
+def process_text(df, field, progress: ProgressCallback = _noop_progress):
+    import pandas as pd
+
+    progress("normalize", 0.0)
+    total = len(df)
+    chunks = []
+    with STAGE_SECONDS.time(stage="normalize"):
+        for start in range(0, total, NORMALIZE_CHUNK_SIZE):
+            chunks.append(normalize_prompts(df[field].iloc[start:start + NORMALIZE_CHUNK_SIZE]))
+            progress("normalize", min((start + NORMALIZE_CHUNK_SIZE) / total, 1.0))
+        if chunks:
+            df[field] = pd.concat(chunks)
+    progress("normalize", 1.0)
+    return df
+
+
+def normalize_texts(texts: List[str], progress: ProgressCallback = _noop_progress) -> List[str]:
+    """Normalized text of every prompt, in order."""
+    import pandas as pd
+
+    df = pd.DataFrame({"prompt": texts})
+    return process_text(df, "prompt", progress)["prompt"].tolist()
+
+
+def _classify_sample(texts: List[str]) -> List[str]:
+    with STAGE_SECONDS.time(stage="classify"):
+        topics, _ = classify_topics([p[:TOPIC_PROMPT_CHARS] for p in texts])  # Truncate long prompts
+    return topics
+
+
+def count_years(
+    export_id: str,
+    texts: List[str],
+    normalized,
+    times: LocalTimes,
+    timezone: str,
+    clusters: Sequence[Hashable],
+) -> ExportAggregates:
+    """
+    Counts, keyword and prompt counters, time histograms and the topic
+    sampling frame of every year, in one pass over the rows. `clusters` is the
+    sampling cluster of every row (see row_clusters). Topics are left
+    unlabelled.
+    """
+    return ExportAggregates(export_id, timezone, count_rows(texts, normalized, times, clusters))
+
+
+def classify_years(
+    aggregates: ExportAggregates,
+    texts: List[str],
+    progress: ProgressCallback = _noop_progress,
+    classify: Callable[[List[str]], List[str]] = _classify_sample,
+):
+    """
+    Label a stratified sample of every year's prompts (every prompt, with the
+    distilled student), all years sharing each round's batch, so other years
+    can be answered later without running the model again. `texts` are the
+    rows the aggregates were counted from.
+    """
+    progress("classify", 0.0)
+    years = aggregates.years
+    sampled = sample_topics(
+        {year: agg.topic_sampler for year, agg in years.items()},
+        texts.__getitem__,
+        classify,
+        progress=lambda fraction: progress("classify", fraction),
+        exhaustive=labels_every_prompt(),
+    )
+    for year, agg in years.items():
+        agg.topic_counts, agg.topic_estimate = sampled[year]
+        agg.topic_sampler = None
+    progress("classify", 1.0)
+
+
+def build_aggregates(
+    export_id: str,
+    texts: List[str],
+    timestamps: np.ndarray,
+    conversation_ids: Sequence[Optional[str]],
+    conversation_sizes: Sequence[int],
+    timezone: str,
+    progress: ProgressCallback = _noop_progress,
+    normalized: Optional[List[str]] = None,
+) -> ExportAggregates:
+    """
+    Aggregate every year of an export in one pass: counts, keyword and prompt
+    counters, time histograms and topic labels for each year's sample, drawn
+    by conversation. `normalized` skips normalization when the text is
+    already known.
+    """
+    # Convert Unix to local calendar fields in one vectorized step
+    times = to_local_times(timestamps, timezone)
+
+    if normalized is None:
+        normalized = normalize_texts(texts, progress)
+
+    with STAGE_SECONDS.time(stage="aggregate"):
+        aggregates = count_years(
+            export_id, texts, normalized, times, timezone, row_clusters(conversation_ids, conversation_sizes)
+        )
+    classify_years(aggregates, texts, progress)
+    return aggregates
+
+
+def _user_conversations(
+    prompts: Union[ParsedExport, StoredPrompts], state: UserState
+) -> Tuple[List[Optional[str]], List[Optional[ConversationPartial]]]:
+    """Id of every conversation (None when missing or repeated), and its partial in the state if unchanged."""
+    conversation_ids = []
+    reused = []
+    seen = set()
+    for conv_id, update_time in zip(prompts.conversation_ids, prompts.update_times):
+        # A repeated id is processed again rather than trusted twice
+        if conv_id in seen:
+            conv_id = None
+        seen.add(conv_id)
+        conversation_ids.append(conv_id)
+        reused.append(state.reusable(conv_id, update_time))
+    return conversation_ids, reused
+
+
+def user_partials(
+    prompts: Union[ParsedExport, StoredPrompts],
+    state: UserState,
+    normalized: Optional[List[str]] = None,
+    progress: ProgressCallback = _noop_progress,
+) -> List[UserPartial]:
+    """
+    (id, partial) of every conversation of a parsed or stored export, in file
+    order. Conversations unchanged since the user's state reuse their partial
+    and its topic labels; the rest are built from the export's rows, and only
+    their rows are normalized unless `normalized` is given for every row.
+    """
+    conversation_ids, reused = _user_conversations(prompts, state)
+    sizes = np.asarray(prompts.conversation_sizes, dtype=np.int64)
+    fresh = np.array([partial is None for partial in reused], dtype=bool)
+    rows = np.flatnonzero(np.repeat(fresh, sizes))
+    texts = [prompts.texts[i] for i in rows.tolist()]
+    if normalized is None:
+        fresh_normalized = normalize_texts(texts, progress)
+    else:
+        fresh_normalized = [normalized[i] for i in rows.tolist()]
+    built = iter(build_partials(
+        texts,
+        prompts.timestamps[rows],
+        fresh_normalized,
+        sizes[fresh].tolist(),
+        [update_time for update_time, is_fresh in zip(prompts.update_times, fresh.tolist()) if is_fresh],
+    ))
+
+    CACHE_LOOKUPS.inc(len(reused) - int(fresh.sum()), cache="conversation", result="hit")
+    CACHE_LOOKUPS.inc(int(fresh.sum()), cache="conversation", result="miss")
+    return [
+        (conv_id, partial if partial is not None else next(built))
+        for conv_id, partial in zip(conversation_ids, reused)
+    ]
+
+
+def reuse_normalized(
+    parsed: ParsedExport,
+    state: UserState,
+    prompt_store: PromptStore,
+    progress: ProgressCallback = _noop_progress,
+) -> List[str]:
+    """
+    Normalized text of every row of a parsed export, for its prompts file.
+    Conversations the user's state has unchanged are copied from the prompts
+    file of the user's last export while the prompt store still has it; the
+    rest are normalized.
+    """
+    conversation_ids, reused = _user_conversations(parsed, state)
+    previous = prompt_store.get(state.export_id) if state.export_id else None
+    previous_rows = {}
+    if previous is not None:
+        start = 0
+        for conv_id, update_time, size in zip(
+            previous.conversation_ids, previous.update_times, previous.conversation_sizes.tolist()
+        ):
+            previous_rows[conv_id] = (update_time, start, size)
+            start += size
+
+    normalized: List[Optional[str]] = [None] * len(parsed.texts)
+    missing = []
+    row = 0
+    for conv_id, partial, size in zip(conversation_ids, reused, np.asarray(parsed.conversation_sizes).tolist()):
+        copied = previous_rows.get(conv_id) if partial is not None else None
+        if copied is not None and copied[0] == partial.update_time and copied[2] == size:
+            normalized[row:row + size] = previous.normalized[copied[1]:copied[1] + size]
+        else:
+            missing.extend(range(row, row + size))
+        row += size
+    for i, text in zip(missing, normalize_texts([parsed.texts[i] for i in missing], progress)):
+        normalized[i] = text
+    return normalized
+
+
+def build_aggregates_incremental(
+    export_id: str,
+    texts: List[str],
+    partials: List[UserPartial],
+    state: UserState,
+    timezone: str,
+    progress: ProgressCallback = _noop_progress,
+) -> ExportAggregates:
+    """
+    Aggregate an export from the (id, partial) of its conversations and its
+    rows: topic labels are only computed for sampled prompts the state has
+    no label for. Gives the same aggregates as build_aggregates while counts
+    are exact, and replaces the state's conversations with this export's.
+    """
+    state.replace_conversations(partials)
+    # Conversations without an id of their own are only in this export's totals
+    transient = [partial for conv_id, partial in partials if conv_id is None]
+    for partial in transient:
+        state.add(partial)
+    # Time spent classifying missing labels inside the merge is also
+    # recorded under the "classify" stage
+    progress("classify", 0.0)
+    try:
+        with STAGE_SECONDS.time(stage="merge"):
+            aggregates = merge_partials(
+                export_id, timezone, state, [partial for _, partial in partials],
+                conversation_clusters([conv_id for conv_id, _ in partials], [p.size for _, p in partials]),
+                texts,
+                _classify_sample,
+                exhaustive=labels_every_prompt(),
+            )
+    finally:
+        for partial in transient:
+            state.add(partial, -1)
+    progress("classify", 1.0)
+    state.export_id = export_id
+    return aggregates
+
+
+def get_mbti_model() -> Optional[ModelBundle]:
+    """The MBTI bundle, or None when it is missing or cannot build its features."""
+    bundle = get_model_registry().get(MBTI_MODEL)
+    return bundle if bundle is not None and bundle.has_features else None
+
+
+def predict_year_mbti(aggregates: ExportAggregates):
+    """
+    Run the MBTI model over every year's keywords in one batch. Without a
+    model that can build its features (or for years with no keywords) the
+    heuristic answers instead.
+    """
+    bundle = get_mbti_model()
+    years = [agg for agg in aggregates.years.values() if agg.keyword_counter]
+    if bundle is None or not years:
+        return
+    with STAGE_SECONDS.time(stage="mbti"):
+        predictions = bundle.predict([agg.keyword_counter for agg in years])
+    for agg, prediction in zip(years, predictions):
+        agg.mbti = prediction
+    aggregates.mbti_model_version = bundle.version
+
+
+def wrapped_response(aggregates: ExportAggregates, year: int) -> WrappedResponse:
+    """Build the wrapped response of one year from stored aggregates."""
+    agg = aggregates.year(year)
+
+    # Most common topic, with its share estimated from the stratified sample
+    estimate = agg.topic_estimate
+    if estimate is not None:
+        top_topic = estimate.topic
+        top_topic_percentage = round(estimate.share * 100)
+        topic_interval = (round(estimate.low * 100), round(estimate.high * 100))
+        topic_sample_complete = estimate.complete
+    else:
+        top_topic = "General Knowledge"
+        top_topic_percentage = 0
+        topic_interval = (None, None)
+        topic_sample_complete = None
+
+    # Top 5 searches (original prompts before processing)
+    top_searches = [prompt for prompt, _ in agg.top_prompts]
+
+    # Top 8 keywords from processed text
+    top_keywords = [
+        KeywordFrequency(keyword=kw, frequency=count)
+        for kw, count in agg.keyword_counter.most_common(8)
+    ]
+    # ...and the 8 most distinctive ones against the global corpus
+    keyword_index = get_keyword_index()
+    distinctive_keywords = [
+        DistinctiveKeyword(keyword=kw, frequency=count, score=score)
+        for kw, count, score in keyword_index.distinctive(agg.keyword_counter.items(), 8)
+    ] if keyword_index is not None else []
+
+    searches_by_month = [
+        MonthFrequency(month_number=m, frequency=int(agg.month[m - 1]))
+        for m in range(1, 13)
+    ]
+    hour = agg.hour
+
+    # MBTI from the model when it ran, else from keyword patterns
+    if agg.mbti is not None:
+        mbti, mbti_confidence, mbti_model_version = agg.mbti.label, agg.mbti.confidence, aggregates.mbti_model_version
+    else:
+        mbti, mbti_confidence, mbti_model_version = infer_mbti(agg.keyword_counter), None, None
+
+    return WrappedResponse(
+        total_searches_past_year=agg.total,
+        top_topic=top_topic[:100] if len(top_topic) > 100 else top_topic,  # Truncate if too long
+        top_topic_percentage=top_topic_percentage,
+        top_topic_percentage_low=topic_interval[0],
+        top_topic_percentage_high=topic_interval[1],
+        topic_sample_size=sum(agg.topic_counts.values()),
+        topic_sample_complete=topic_sample_complete,
+        top_searches=top_searches,
+        top_keywords=top_keywords,
+        distinctive_keywords=distinctive_keywords,
+        unique_keywords=len(agg.keyword_counter),  # a lower bound once the summary has evicted
+        searches_by_month=searches_by_month,
+        searches_by_hour=hour.tolist(),
+        heatmap_data=heatmap_by_day(agg.heatmap),
+        early_bird_night_owl=classify_early_bird(hour),
+        mbti=mbti,
+        mbti_confidence=mbti_confidence,
+        mbti_model_version=mbti_model_version,
+        export_id=aggregates.export_id,
+        year=year,
+        timezone=aggregates.timezone,
+        available_years=sorted(aggregates.years),
+    )
+
+
+def analyze_export(
+    zip_file: ZipFile,
+    year: int = DEFAULT_TARGET_YEAR,
+    timezone: str = DEFAULT_TIMEZONE,
+    progress: Optional[ProgressCallback] = None,
+    admit: Optional[Callable[[], Optional[Ticket]]] = None,
+    export_id: Optional[str] = None,
+) -> WrappedResponse:
+    """
+    Run the full wrapped analysis over an opened export archive.
+    Aggregates for every year are stored, so other years of the same export
+    can be served by `stored_response` without parsing or inference.
+    Re-uploads from the same account only normalize and classify conversations
+    that changed.
+    `progress(stage, fraction)` is called as each of STAGES advances.
+    `admit` is called for an admission ticket only when no cached response
+    or stored aggregates answer the request, and the export is parsed and
+    analyzed once the ticket is granted. `export_id` saves hashing an export
+    the caller has already hashed.
+    """
+    progress = progress or _noop_progress
+    with ANALYSES_IN_FLIGHT.track_in_progress():
+        try:
+            response = _analyze_export(zip_file, year, timezone, progress, admit, export_id)
+        except Exception:
+            ANALYSES.inc(outcome="error")
+            raise
+    ANALYSES.inc(outcome="ok")
+    return response
+
+
+def analysis_params(year: int, timezone: str) -> dict:
+    """Everything besides the export itself that the response depends on."""
+    bundle = get_mbti_model()
+    keyword_index = get_keyword_index()
+    return {
+        "year": year,
+        "timezone": timezone,
+        "topic_model": topic_model_id(),
+        "mbti_model": bundle.version if bundle is not None else None,
+        "topic_sampling": [
+            TOPIC_SAMPLE_MIN, TOPIC_SAMPLE_ROUND, TOPIC_SAMPLE_MAX, TOPIC_CI_HALF_WIDTH, TOPIC_SAMPLE_PER_CONVERSATION
+        ],
+        "top_exact_max_rows": TOP_EXACT_MAX_ROWS,
+        "top_prompts_capacity": TOP_PROMPTS_CAPACITY,
+        "top_keywords_capacity": TOP_KEYWORDS_CAPACITY,
+        "keyword_index": keyword_index.version if keyword_index is not None else None,
+        "format": RESPONSE_FORMAT,
+    }
+
+
+def is_cached(export_id: str, year: int, timezone: str) -> bool:
+    """
+    Whether the result cache or stored aggregates would answer an analysis
+    without building it. The lookups are neither counted nor refreshed.
+    """
+    result_cache = get_result_cache()
+    if result_cache is not None and result_key(export_id, **analysis_params(year, timezone)) in result_cache:
+        return True
+    return (export_id, timezone) in get_aggregate_store()
+
+
+def _analyze_export(
+    zip_file: ZipFile,
+    year: int,
+    timezone: str,
+    progress: ProgressCallback,
+    admit: Optional[Callable[[], Optional[Ticket]]],
+    export_id: Optional[str],
+) -> WrappedResponse:
+    check_archive(zip_file)
+    # Repeat uploads of the same export are answered from the result cache,
+    # or from stored aggregates, once conversations.json has been hashed
+    export_id = export_id or export_digest(zip_file)
+    result_cache = get_result_cache()
+    cache_key = result_key(export_id, **analysis_params(year, timezone)) if result_cache is not None else None
+    if result_cache is not None:
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            for stage in STAGES:
+                progress(stage, 1.0)
+            return WrappedResponse.model_validate_json(cached)
+
+    store = get_aggregate_store()
+    aggregates = store.get(export_id, timezone)
+    if aggregates is None:
+        admission = admit() if admit is not None else None
+        try:
+            if admission is not None:
+                admission.wait()
+            aggregates = _build_export_aggregates(zip_file, export_id, timezone, progress)
+        finally:
+            if admission is not None:
+                admission.release()
+        # Topics cut short by the time budget are reported, not kept: the
+        # labels already made are cached, so a retry finishes the same sample
+        if aggregates.topics_complete:
+            store.put(aggregates)
+
+    progress("aggregate", 0.0)
+    with STAGE_SECONDS.time(stage="response"):
+        response = wrapped_response(aggregates, year)
+    progress("aggregate", 1.0)
+    if result_cache is not None and aggregates.topics_complete:
+        result_cache.put(cache_key, response.model_dump_json())
+    return response
+
+
+def _build_export_aggregates(
+    zip_file: ZipFile, export_id: str, timezone: str, progress: ProgressCallback
+) -> ExportAggregates:
+    # Exports that carry an account id are processed incrementally against
+    # the partial results stored from that user's previous upload
+    user_id = export_user_id(zip_file)
+    state_store = get_user_state_store() if user_id else None
+    # The prompt store keeps this export parsed and normalized for analyses
+    # in other timezones, or after the user state has moved on
+    prompt_store = get_prompt_store()
+    stored = prompt_store.get(export_id) if prompt_store is not None else None
+    if stored is not None:
+        for stage in ("parse", "normalize"):
+            progress(stage, 1.0)
+    if state_store is None:
+        if stored is not None:
+            aggregates = build_aggregates(
+                export_id, stored.texts, stored.timestamps, stored.conversation_ids, stored.conversation_sizes,
+                timezone, progress, stored.normalized,
+            )
+        else:
+            parsed = parse_export(zip_file, progress)
+            normalized = normalize_texts(parsed.texts, progress)
+            if prompt_store is not None:
+                prompt_store.put(
+                    export_id, parsed.texts, parsed.timestamps, parsed.conversation_ids, parsed.update_times,
+                    parsed.conversation_sizes, normalized,
+                )
+            aggregates = build_aggregates(
+                export_id, parsed.texts, parsed.timestamps, parsed.conversation_ids, parsed.conversation_sizes,
+                timezone, progress, normalized,
+            )
+        predict_year_mbti(aggregates)
+    else:
+        topic_model = topic_model_id()
+        state = state_store.get(user_id) or UserState(user_id, topic_model)
+        state.use_topic_model(topic_model)
+        if stored is not None:
+            prompts = stored
+            partials = user_partials(stored, state, stored.normalized)
+        else:
+            # Parsed like any export (split exports in the parse pool), then
+            # diffed against the state so only changed conversations are normalized
+            prompts = parse_export(zip_file, progress)
+            normalized = None
+            if prompt_store is not None:
+                normalized = reuse_normalized(prompts, state, prompt_store, progress)
+                prompt_store.put(
+                    export_id, prompts.texts, prompts.timestamps, prompts.conversation_ids, prompts.update_times,
+                    prompts.conversation_sizes, normalized,
+                )
+            partials = user_partials(prompts, state, normalized, progress)
+        aggregates = build_aggregates_incremental(export_id, prompts.texts, partials, state, timezone, progress)
+        predict_year_mbti(aggregates)
+        state_store.put(state)
+    return aggregates
+
+
+def stored_response(
+    export_id: str, year: int, timezone: str, admit: Optional[Callable[[int], Optional[Ticket]]] = None
+) -> Optional[WrappedResponse]:
+    """
+    Answer from previously built aggregates, or None if the export is unknown.
+    The aggregate store is per worker process, so on a miss the aggregates are
+    rebuilt from the prompt store, which every worker shares on disk. With
+    `admit`, a rebuild first takes an admission ticket for the stored prompts'
+    size in bytes, as an upload of the export would.
+    """
+    store = get_aggregate_store()
+    aggregates = store.get(export_id, timezone)
+    if aggregates is None:
+        prompt_store = get_prompt_store()
+        stored = prompt_store.get(export_id) if prompt_store is not None else None
+        if stored is None:
+            return None
+        admission = admit(sum(map(len, stored.texts))) if admit is not None else None
+        try:
+            if admission is not None:
+                admission.wait()
+            aggregates = build_aggregates(
+                export_id, stored.texts, stored.timestamps, stored.conversation_ids, stored.conversation_sizes,
+                timezone, _noop_progress, stored.normalized,
+            )
+            predict_year_mbti(aggregates)
+        finally:
+            if admission is not None:
+                admission.release()
+        if aggregates.topics_complete:
+            store.put(aggregates)
+    return wrapped_response(aggregates, year)
+
+
+def infer_mbti(keyword_counter: Counter) -> str:
+    """
+    Infer MBTI type based on keyword patterns.
+    Simple heuristic based on common word patterns.
+    """
+    total = sum(keyword_counter.values())
+    if total == 0:
+        return "INTP"  # Default
+
+    # E vs I: social/people words vs technical/analysis words
+    e_words = {'people', 'social', 'team', 'communicate', 'party', 'friends', 'share'}
+    i_words = {'analyze', 'think', 'code', 'algorithm', 'study', 'research', 'alone'}
+
+    e_score = sum(keyword_counter[w] for w in e_words)
+    i_score = sum(keyword_counter[w] for w in i_words)
+    ei = 'E' if e_score > i_score else 'I'
+
+    # N vs S: abstract/future vs concrete/present
+    n_words = {'future', 'innovation', 'theory', 'concept', 'imagine', 'possibility', 'idea'}
+    s_words = {'practical', 'detail', 'fact', 'current', 'real', 'specific', 'actual'}
+
+    n_score = sum(keyword_counter[w] for w in n_words)
+    s_score = sum(keyword_counter[w] for w in s_words)
+    ns = 'N' if n_score > s_score else 'S'
+
+    # T vs F: logic/analysis vs emotion/values
+    t_words = {'logic', 'analyze', 'reason', 'objective', 'efficient', 'system', 'solve'}
+    f_words = {'feel', 'value', 'empathy', 'harmony', 'personal', 'care', 'emotion'}
+
+    t_score = sum(keyword_counter[w] for w in t_words)
+    f_score = sum(keyword_counter[w] for w in f_words)
+    tf = 'T' if t_score > f_score else 'F'
+
+    # J vs P: structured/planned vs flexible/spontaneous
+    j_words = {'plan', 'schedule', 'organize', 'structure', 'deadline', 'complete', 'finish'}
+    p_words = {'explore', 'flexible', 'spontaneous', 'adapt', 'open', 'option', 'discover'}
+
+    j_score = sum(keyword_counter[w] for w in j_words)
+    p_score = sum(keyword_counter[w] for w in p_words)
+    jp = 'J' if j_score > p_score else 'P'
+
+    return f"{ei}{ns}{tf}{jp}"
@@ -0,0 +1,243 @@
+"""
+Columnar store of parsed exports, shared by the API and the notebooks.
+
+One Arrow IPC file per export with the columns
+
+    prompt           original prompt text
+    timestamp        Unix seconds (float64)
+    conversation_id  dictionary-encoded conversation id ("" when missing)
+    update_time      the conversation's update time (NaN when missing)
+    position         index of the prompt within its conversation (int32)
+    normalized       lemmatized, stopword-free text the keyword counts use
+
+and the export id of the ZIP they were parsed from in the "export_id"
+metadata, so a file and its export count as the same source. Files are
+written uncompressed, so readers memory-map them: opening one is zero-copy
+and only the projected columns are ever paged in. pyarrow is optional;
+without it the API parses every upload as before.
+
+Build a file from an export ZIP, then read it anywhere (run from BE/):
+    python -m services.prompt_store ~/Downloads/export.zip --out ../Model/prompts.arrow
+
+    from services.prompt_store import read_prompts
+    df = read_prompts("prompts.arrow", columns=["prompt", "timestamp"]).to_pandas()
+"""
+import logging
+import os
+import tempfile
+import threading
+from typing import List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from core.config import PROMPT_STORE_DIR, PROMPT_STORE_MAX_ENTRIES
+
+logger = logging.getLogger("wrapped.prompt_store")
+
+COLUMNS = ("prompt", "timestamp", "conversation_id", "update_time", "position", "normalized")
+# Bump when the columns change; files of another format are rebuilt
+STORE_FORMAT = b"2"
+
+
+class StoredPrompts(NamedTuple):
+    texts: List[str]                       # prompts, in file order
+    timestamps: np.ndarray                 # float64, one per text
+    conversation_ids: List[Optional[str]]  # of each conversation with prompts
+    update_times: List[Optional[float]]
+    conversation_sizes: np.ndarray         # int64, texts of each conversation
+    normalized: List[str]
+
+
+def pyarrow_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def write_prompts(
+    path: str,
+    texts: Sequence[str],
+    timestamps: np.ndarray,
+    conversation_ids: Sequence[Optional[str]],
+    update_times: Sequence[Optional[float]],
+    conversation_sizes: Sequence[int],
+    normalized: Sequence[str],
+    export_id: Optional[str] = None,
+):
+    """Write one export's prompts to `path` atomically."""
+    import pyarrow as pa
+
+    sizes = np.asarray(conversation_sizes, dtype=np.int64)
+    starts = np.cumsum(sizes) - sizes
+    positions = np.arange(len(texts), dtype=np.int64) - np.repeat(starts, sizes)
+    conversation_index = np.repeat(np.arange(len(sizes), dtype=np.int32), sizes)
+
+    table = pa.table({
+        "prompt": pa.array(texts, pa.string()),
+        "timestamp": pa.array(np.asarray(timestamps, dtype=np.float64)),
+        "conversation_id": pa.DictionaryArray.from_arrays(
+            pa.array(conversation_index, pa.int32()),
+            pa.array([conv_id or "" for conv_id in conversation_ids], pa.string()),
+        ),
+        "update_time": pa.array(np.repeat(
+            np.array([np.nan if t is None else t for t in update_times], dtype=np.float64), sizes
+        )),
+        "position": pa.array(positions.astype(np.int32)),
+        "normalized": pa.array(list(normalized), pa.string()),
+    }).replace_schema_metadata({"format": STORE_FORMAT, **({"export_id": export_id} if export_id else {})})
+
+    directory = os.path.dirname(path) or "."
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    os.close(fd)
+    try:
+        with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def read_prompts(path: str, columns: Optional[Sequence[str]] = None):
+    """Memory-map a prompts file as a pyarrow Table, reading only `columns`."""
+    import pyarrow as pa
+
+    reader = pa.ipc.open_file(pa.memory_map(path, "r"))
+    table = reader.read_all()
+    if (table.schema.metadata or {}).get(b"format") != STORE_FORMAT:
+        raise ValueError(f"{path} is not a prompts file of format {STORE_FORMAT.decode()}")
+    return table.select(list(columns)) if columns else table
+
+
+def prompts_export_id(path: str) -> Optional[str]:
+    """Export id recorded in a prompts file, or None for files written without one."""
+    import pyarrow as pa
+
+    metadata = pa.ipc.open_file(pa.memory_map(path, "r")).schema.metadata or {}
+    if metadata.get(b"format") != STORE_FORMAT:
+        raise ValueError(f"{path} is not a prompts file of format {STORE_FORMAT.decode()}")
+    export_id = metadata.get(b"export_id")
+    return export_id.decode() if export_id else None
+
+
+def stored_prompts(table) -> StoredPrompts:
+    """Rows of a prompts table in the shape the pipeline takes."""
+    positions = table.column("position").to_numpy()
+    starts = np.flatnonzero(positions == 0)
+    sizes = np.diff(np.append(starts, len(positions)))
+    conversation_ids = [conv_id or None for conv_id in table.column("conversation_id").take(starts).to_pylist()]
+    update_times = [None if np.isnan(t) else t for t in table.column("update_time").to_numpy()[starts].tolist()]
+    return StoredPrompts(
+        table.column("prompt").to_pylist(),
+        table.column("timestamp").to_numpy(),
+        conversation_ids,
+        update_times,
+        sizes,
+        table.column("normalized").to_pylist(),
+    )
+
+
+class PromptStore:
+    """
+    Prompts files of recently analyzed exports, one per export id, under
+    `directory`. Reads refresh a file's mtime; past `max_entries` files the
+    least recently used are removed.
+    """
+
+    def __init__(self, directory: str, max_entries: int = PROMPT_STORE_MAX_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, export_id: str) -> str:
+        return os.path.join(self.directory, f"{export_id}.arrow")
+
+    def get(self, export_id: str) -> Optional[StoredPrompts]:
+        path = self._path(export_id)
+        try:
+            prompts = stored_prompts(read_prompts(path, COLUMNS))
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("Ignoring unreadable prompts file %s: %s", path, e)
+            return None
+        return prompts
+
+    def put(self, export_id: str, texts, timestamps, conversation_ids, update_times, conversation_sizes, normalized):
+        write_prompts(
+            self._path(export_id), texts, timestamps, conversation_ids, update_times, conversation_sizes, normalized,
+            export_id,
+        )
+        with self._lock:
+            paths = [entry.path for entry in os.scandir(self.directory) if entry.name.endswith(".arrow")]
+            if len(paths) > self.max_entries:
+                paths.sort(key=lambda p: os.stat(p).st_mtime)
+                for path in paths[:len(paths) - self.max_entries]:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+
+_prompt_store = None
+_prompt_store_lock = threading.Lock()
+
+def get_prompt_store() -> Optional[PromptStore]:
+    """Process-wide store, or None when PROMPT_STORE_DIR is empty or pyarrow is missing."""
+    global _prompt_store
+    if _prompt_store is None and PROMPT_STORE_DIR:
+        with _prompt_store_lock:
+            if _prompt_store is None:
+                if not pyarrow_available():
+                    logger.info("pyarrow is not installed; the prompt store is disabled")
+                    _prompt_store = False
+                else:
+                    _prompt_store = PromptStore(PROMPT_STORE_DIR)
+    return _prompt_store or None
+
+
+def _reset_prompt_store():
+    # Recreated in each worker, so its lock is never inherited held
+    global _prompt_store
+    _prompt_store = None
+
+
+os.register_at_fork(after_in_child=_reset_prompt_store)
+
+
+def main():
+    import argparse
+    import json
+    import time
+    from zipfile import ZipFile
+
+    from services.pipeline import parse_export, normalize_texts
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("export", help="ChatGPT data export ZIP")
+    parser.add_argument("--out", required=True, help="Path of the .arrow file to write")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with ZipFile(args.export) as zip_file:
+        parsed = parse_export(zip_file)
+    normalized = normalize_texts(parsed.texts)
+    write_prompts(
+        args.out, parsed.texts, parsed.timestamps, parsed.conversation_ids, parsed.update_times,
+        parsed.conversation_sizes, normalized, parsed.export_id,
+    )
+    print(json.dumps({
+        "export_id": parsed.export_id,
+        "prompts": len(parsed.texts),
+        "conversations": len(parsed.conversation_sizes),
+        "bytes": os.path.getsize(args.out),
+        "seconds": round(time.perf_counter() - start, 2),
+    }))
+
+
+if __name__ == "__main__":
+    main()
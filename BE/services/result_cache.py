@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from core.config import RESULT_CACHE_PATH, RESULT_CACHE_TTL_SECONDS, RESULT_CACHE_MAX_ENTRIES
+from services.metrics import CACHE_LOOKUPS
+
+
+def result_key(export_id: str, **params) -> str:
+    """Hash of the conversations.json digest and every parameter that shapes the response."""
+    payload = json.dumps({"export_id": export_id, **params}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Disk-backed cache of serialized WrappedResponses in a local SQLite file.
+
+    Rows expire `ttl` seconds after they were stored. When the row count
+    exceeds `max_entries`, the least recently used tenth is evicted.
+    """
+
+    def __init__(self, path: str, ttl: int = RESULT_CACHE_TTL_SECONDS, max_entries: int = RESULT_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+
+    def get(self, key: str) -> Optional[str]:
+        """The stored response JSON, or None if missing or expired."""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT response, created FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] < now - self.ttl:
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                row = None
+            if row is not None:
+                self._conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (now, key))
+        CACHE_LOOKUPS.inc(cache="result", result="hit" if row is not None else "miss")
+        return row[0] if row is not None else None
+
+    def __contains__(self, key: str) -> bool:
+        """Whether `get` would hit, without counting the lookup or refreshing the row."""
+        with self._lock:
+            row = self._conn.execute("SELECT created FROM results WHERE key = ?", (key,)).fetchone()
+        return row is not None and row[0] >= time.time() - self.ttl
+
+    def put(self, key: str, response: str):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, response, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
+            )
+            self._conn.execute("DELETE FROM results WHERE created < ?", (now - self.ttl,))
+            count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            if count > self.max_entries:
+                excess = count - int(self.max_entries * 0.9)
+                self._conn.execute(
+                    "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+def get_result_cache() -> Optional[ResultCache]:
+    global _result_cache
+    if _result_cache is None and RESULT_CACHE_PATH:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = ResultCache(RESULT_CACHE_PATH)
+    return _result_cache
+
+
+def _reset_result_cache():
+    # SQLite connections must not cross a fork; each worker opens its own
+    global _result_cache
+    _result_cache = None
+
+
+os.register_at_fork(after_in_child=_reset_result_cache)
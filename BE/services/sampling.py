@@ -0,0 +1,442 @@
+"""
+Stratified, two-stage cluster sampling of prompts for topic classification.
+
+Each year's prompts are split into month strata, and each month into
+clusters: the conversations its prompts come from. Within a month,
+conversations are drawn in an order fixed by a hash of their id, and from
+each drawn conversation up to TOPIC_SAMPLE_PER_CONVERSATION prompts, in an
+order fixed by a hash of their text. Both orders are uniformly random
+permutations that do not depend on where anything sits in the file, so every
+sample is a two-stage random sample of its month. Once every conversation
+of a month is drawn, further draws take the next prompts of each in turn.
+Trivial prompts ("yes", "go on") are dropped and repeated prompts are counted
+once, in the conversation they first appear in. The frame holds a 128-bit
+digest and the row of each distinct prompt, never its text; the texts of the
+prompts drawn are looked up by row.
+
+Prompts are labelled in rounds, with the sample allocated to months in
+proportion to their size. After each round, the top topic's share is
+estimated with the stratified ratio estimator and a 95% interval.
+With N_c prompts in conversation c, n_c of them labelled and p_c the share
+labelled with the topic, k of a month's K conversations drawn and N_h of its
+prompts:
+
+    R_h   = sum_c N_c p_c / sum_c N_c
+    v_h   = [K^2 (1 - k/K) s_e^2 / k + (K/k) sum_c N_c^2 (1 - n_c/N_c) s_c^2 / n_c] / N_h^2
+    share = sum_h W_h R_h
+    var   = sum_h W_h^2 max(v_h, a_h)
+
+where s_e^2 is the variance of N_c (p_c - R_h) over drawn conversations and
+s_c^2 that of the labels within one. Prompts of a conversation tend to share
+a topic, so the first term is what widens the interval over a simple random
+sample. A month's variance is floored by a_h, the binomial variance of its
+n_h labels at the Agresti-Coull adjusted share (x_h + z^2/2) / (n_h + z^2),
+with the finite population correction: a month whose sample is all one topic
+otherwise reports no uncertainty at all, and the interval closes too early.
+The interval is a Wilson interval at the effective sample size
+share (1 - share) / var, with Student's t for the design's degrees of
+freedom (conversations drawn less one per month) in place of the normal
+quantile, so it stays inside [0, 1] and does not collapse at high shares.
+
+Sampling stops once the interval is within ±TOPIC_CI_HALF_WIDTH, every
+prompt is labelled or TOPIC_SAMPLE_MAX is reached, so the sample depends only
+on the prompts and their labels, never on how fast the model runs: a full
+analysis and an incremental one label the same prompts. A model cheap enough
+to label every prompt skips the sample: every prompt is labelled in one call
+and the share is exact.
+
+TOPIC_SAMPLE_BUDGET_SECONDS is only a safety limit against a stalled model.
+A run that hits it stops early and marks its estimates incomplete, so callers
+can report that and not keep the result; labels it did get are kept by the
+caller and a later run continues to the same sample.
+"""
+import hashlib
+import logging
+import math
+import re
+import time
+from collections import Counter
+from operator import attrgetter
+from typing import Callable, Dict, Hashable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from core.config import (
+    TOPIC_SAMPLE_MIN,
+    TOPIC_SAMPLE_ROUND,
+    TOPIC_SAMPLE_MAX,
+    TOPIC_CI_HALF_WIDTH,
+    TOPIC_SAMPLE_BUDGET_SECONDS,
+    TOPIC_SAMPLE_PER_CONVERSATION,
+)
+from services.metrics import TOPIC_SAMPLES_TRUNCATED
+
+logger = logging.getLogger("wrapped.sampling")
+
+# Prompts with this many words or fewer carry no topic
+TRIVIAL_MAX_WORDS = 2
+Z_95 = 1.96
+
+_WORD = re.compile(r"\w+")
+
+
+def sample_key(text: str) -> Optional[str]:
+    """Deduplication key of a prompt, or None if it is too trivial to sample."""
+    words = _WORD.findall(text.lower())
+    if len(words) <= TRIVIAL_MAX_WORDS:
+        return None
+    return " ".join(words)
+
+
+def sample_digest(text: str) -> Optional[bytes]:
+    """128-bit digest of a prompt's sample_key, or None if it is too trivial to sample."""
+    key = sample_key(text)
+    if key is None:
+        return None
+    return hashlib.blake2b(key.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+class TopicEstimate(NamedTuple):
+    topic: str
+    share: float        # estimated share of the year's distinct, non-trivial prompts
+    low: float          # 95% interval on the share
+    high: float
+    sample_size: int    # prompts labelled
+    population: int     # distinct, non-trivial prompts of the year
+    complete: bool = True  # False when the time budget stopped sampling before its stop rule
+
+
+class _Candidate(NamedTuple):
+    digest: bytes     # sample_digest of the prompt; its draw order within the conversation
+    row: int          # where the caller can look the text up
+    source: Hashable  # whatever the caller wants labels written back to
+
+
+def conversation_clusters(conversation_ids: Sequence[Optional[str]], conversation_sizes: Sequence[int]) -> List[str]:
+    """
+    Sampling cluster of each conversation, in file order, given the prompt
+    count of each: its id, or the row of its first prompt when the id is
+    missing or repeated. Rows, unlike positions, are the same in stored
+    prompts, which leave out conversations without any.
+    """
+    clusters = []
+    seen = set()
+    row = 0
+    for conv_id, size in zip(conversation_ids, conversation_sizes):
+        clusters.append(f"\0{row}" if conv_id is None or conv_id in seen else conv_id)
+        seen.add(conv_id)
+        row += size
+    return clusters
+
+
+def row_clusters(conversation_ids: Sequence[Optional[str]], conversation_sizes: Sequence[int]) -> List[str]:
+    """Sampling cluster of every row of conversations with `conversation_sizes` prompts each."""
+    return [
+        cluster
+        for cluster, size in zip(conversation_clusters(conversation_ids, conversation_sizes), conversation_sizes)
+        for _ in range(size)
+    ]
+
+
+def _cluster_order(cluster: Hashable) -> Tuple[bytes, str]:
+    key = str(cluster)
+    return hashlib.blake2b(key.encode("utf-8", "surrogatepass"), digest_size=8).digest(), key
+
+
+_by_digest = attrgetter("digest")
+
+
+class TopicSampler:
+    """Sampling frame of one year: distinct non-trivial prompts by month and conversation."""
+
+    def __init__(self):
+        self._strata: Dict[int, Dict[Hashable, List[_Candidate]]] = {}
+        self._seen = set()
+
+    def add(self, digest: Optional[bytes], month: int, row: int, cluster: Hashable, source: Hashable = None):
+        """Offer a prompt by its sample_digest (None for a trivial one), in file order."""
+        if digest is None or digest in self._seen:
+            return
+        self._seen.add(digest)
+        self._strata.setdefault(month, {}).setdefault(cluster, []).append(_Candidate(digest, row, source))
+
+    def candidates(self) -> Iterator[_Candidate]:
+        """Every candidate, in no particular order."""
+        for clusters in self._strata.values():
+            for candidates in clusters.values():
+                yield from candidates
+
+    def strata(self) -> Dict[int, List[List[_Candidate]]]:
+        """Conversations of each month, each a list of candidates, in the order they are drawn."""
+        return {
+            month: [sorted(clusters[key], key=_by_digest) for key in sorted(clusters, key=_cluster_order)]
+            for month, clusters in sorted(self._strata.items())
+        }
+
+
+def _t_quantile(df: int) -> float:
+    """97.5% quantile of Student's t with `df` degrees of freedom (Cornish-Fisher expansion)."""
+    z = Z_95
+    return z + (z ** 3 + z) / (4 * df) + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+
+
+def _wilson_interval(share: float, variance: float, n: int, df: int) -> Tuple[float, float]:
+    """95% Wilson interval on a share estimated with `variance` from `n` prompts in `df` degrees of freedom."""
+    if variance <= 0:
+        return share, share
+    # Effective sample size: what a simple random sample would need for this variance
+    n_eff = min(share * (1 - share) / variance, n) if 0 < share < 1 else n
+    t = _t_quantile(max(df, 1))
+    center = (share + t * t / (2 * n_eff)) / (1 + t * t / n_eff)
+    half = t / (1 + t * t / n_eff) * math.sqrt(share * (1 - share) / n_eff + t * t / (4 * n_eff ** 2))
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+class _YearSample:
+    def __init__(self, sampler: TopicSampler, per_cluster: int):
+        self.strata = sampler.strata()
+        self.per_cluster = per_cluster
+        self.sizes = {month: sum(map(len, clusters)) for month, clusters in self.strata.items()}
+        self.population = sum(self.sizes.values())
+        self.taken = {month: 0 for month in self.strata}
+        self.cursor = {month: (0, 0) for month in self.strata}  # (next conversation, pass over the month)
+        # label counts of each conversation
+        self.labels: Dict[int, List[Counter]] = {month: [Counter() for _ in clusters] for month, clusters in self.strata.items()}
+        self.estimate: Optional[TopicEstimate] = None
+
+    @property
+    def n(self) -> int:
+        return sum(self.taken.values())
+
+    def _draw_unit(self, month: int) -> List[Tuple[int, _Candidate]]:
+        """The next prompts of a month: up to per_cluster from its next conversation with any left."""
+        clusters = self.strata[month]
+        index, turn = self.cursor[month]
+        while True:
+            unit = clusters[index][turn * self.per_cluster:(turn + 1) * self.per_cluster]
+            drawn = index
+            index += 1
+            if index == len(clusters):
+                index, turn = 0, turn + 1
+            if unit:
+                self.cursor[month] = (index, turn)
+                self.taken[month] += len(unit)
+                return [(drawn, candidate) for candidate in unit]
+
+    def draw(self, target: int) -> List[Tuple[int, int, _Candidate]]:
+        """
+        Grow the sample to at least `target`, a conversation at a time, keeping
+        each month near its proportional share. Returns (month, conversation,
+        candidate) of every prompt drawn.
+        """
+        target = min(target, self.population)
+        drawn = []
+        while self.n < target:
+            # Month furthest below its proportional allocation; ties go to the larger one
+            month = max(
+                (m for m in self.strata if self.taken[m] < self.sizes[m]),
+                key=lambda m: (target * self.sizes[m] / self.population - self.taken[m], self.sizes[m]),
+            )
+            drawn.extend((month, cluster, candidate) for cluster, candidate in self._draw_unit(month))
+        return drawn
+
+    def _month_ratios(self, month: int) -> Tuple[List[Tuple[int, int, Counter]], Counter]:
+        """(N_c, n_c, labels) of the month's drawn conversations, and R_h of every label."""
+        drawn = [
+            (len(self.strata[month][c]), sum(labels.values()), labels)
+            for c, labels in enumerate(self.labels[month]) if labels
+        ]
+        ratios = Counter()
+        weight = sum(size for size, _, _ in drawn)
+        for size, labelled, labels in drawn:
+            for label, count in labels.items():
+                ratios[label] += size * count / labelled
+        return drawn, Counter({label: total / weight for label, total in ratios.items()})
+
+    def _month_variance(self, month: int, drawn: List[Tuple[int, int, Counter]], topic: str, ratio: float) -> float:
+        size, total = self.sizes[month], len(self.strata[month])
+        k = len(drawn)
+        # Label variance within each conversation; one with a single prompt
+        # labelled gets the month's pooled variance
+        spread = {}
+        for c, (cluster_size, labelled, labels) in enumerate(drawn):
+            if labelled > 1:
+                p = labels[topic] / labelled
+                spread[c] = p * (1 - p) * labelled / (labelled - 1)
+        df = sum(drawn[c][1] - 1 for c in spread)
+        pooled = sum(s2 * (drawn[c][1] - 1) for c, s2 in spread.items()) / df if df else ratio * (1 - ratio)
+        within = sum(
+            cluster_size ** 2 * (1 - labelled / cluster_size) * spread.get(c, pooled) / labelled
+            for c, (cluster_size, labelled, _) in enumerate(drawn)
+        )
+        variance = total / k * within
+        if k > 1:
+            residuals = sum(
+                (cluster_size * (labels[topic] / labelled - ratio)) ** 2 for cluster_size, labelled, labels in drawn
+            )
+            variance += total ** 2 * (1 - k / total) * residuals / (k - 1) / k
+        variance /= size ** 2
+
+        # Agresti-Coull floor
+        n_h = self.taken[month]
+        adjusted = (sum(labels[topic] for _, _, labels in drawn) + Z_95 ** 2 / 2) / (n_h + Z_95 ** 2)
+        floor = (1 - n_h / size) * adjusted * (1 - adjusted) / (n_h + Z_95 ** 2)
+        return max(variance, floor)
+
+    def _degrees_of_freedom(self, month: int) -> int:
+        """Conversations drawn less one, or prompts less conversations once every conversation is drawn."""
+        drawn = sum(1 for labels in self.labels[month] if labels)
+        if drawn < len(self.strata[month]):
+            return drawn - 1
+        return self.taken[month] - drawn
+
+    def update_estimate(self):
+        sampled = [m for m in self.strata if self.taken[m]]
+        if not sampled:
+            return
+        weight_total = sum(self.sizes[m] for m in sampled)
+        months = {m: self._month_ratios(m) for m in sampled}
+        shares = Counter()
+        for m, (_, ratios) in months.items():
+            for label, ratio in ratios.items():
+                shares[label] += self.sizes[m] / weight_total * ratio
+        # Ties go to the label seen first, as Counter.most_common does
+        topic, share = shares.most_common(1)[0]
+
+        variance = sum(
+            (self.sizes[m] / weight_total) ** 2 * self._month_variance(m, drawn, topic, ratios[topic])
+            for m, (drawn, ratios) in months.items()
+        )
+        low, high = _wilson_interval(share, variance, self.n, sum(self._degrees_of_freedom(m) for m in months))
+        self.estimate = TopicEstimate(topic, share, low, high, self.n, self.population)
+
+    def done(self, half_width: float, min_samples: int, max_samples: int) -> bool:
+        if self.n >= self.population or self.n >= max_samples:
+            return True
+        if self.estimate is None or self.n < min(min_samples, self.population):
+            return False
+        return (self.estimate.high - self.estimate.low) / 2 <= half_width
+
+
+class SampledTopics(NamedTuple):
+    label_counts: Counter  # prompts labelled with each topic
+    estimate: Optional[TopicEstimate]
+
+
+def sample_topics(
+    samplers: Dict[int, TopicSampler],
+    text_of: Callable[[int], str],
+    classify: Callable[[List[str]], List[str]],
+    known: Optional[Callable[[bytes, Hashable], Optional[str]]] = None,
+    on_label: Optional[Callable[[bytes, Hashable, str], None]] = None,
+    progress: Optional[Callable[[float], None]] = None,
+    min_samples: int = TOPIC_SAMPLE_MIN,
+    round_size: int = TOPIC_SAMPLE_ROUND,
+    max_samples: int = TOPIC_SAMPLE_MAX,
+    half_width: float = TOPIC_CI_HALF_WIDTH,
+    budget_seconds: Optional[float] = None,
+    exhaustive: bool = False,
+    per_conversation: int = TOPIC_SAMPLE_PER_CONVERSATION,
+) -> Dict[int, SampledTopics]:
+    """
+    Label a sample of every year's prompts, all years sharing one `classify`
+    call per round; `text_of(row)` is the text of a candidate's row.
+    `known(digest, source)` may return a label from an earlier run, so the
+    prompt is not classified again; `on_label(digest, source, label)` is
+    called for every newly classified prompt. `exhaustive` labels every
+    prompt, ignoring the sample limits and the budget. `per_conversation`
+    prompts are drawn from a conversation at a time. Years still sampling
+    when `budget_seconds` (default TOPIC_SAMPLE_BUDGET_SECONDS) run out get an
+    estimate marked incomplete.
+    """
+    if exhaustive:
+        return _label_every_prompt(samplers, text_of, classify, known, on_label, progress)
+    if budget_seconds is None:
+        budget_seconds = TOPIC_SAMPLE_BUDGET_SECONDS
+    start = time.perf_counter()
+    years = {year: _YearSample(sampler, per_conversation) for year, sampler in samplers.items()}
+    active = [year for year, sample in years.items() if sample.population]
+    # Progress is the share of the largest possible sample labelled so far
+    planned = sum(min(years[year].population, max_samples) for year in active)
+
+    while active:
+        batch = []
+        for year in active:
+            sample = years[year]
+            target = min_samples if sample.n == 0 else sample.n + round_size
+            for month, cluster, candidate in sample.draw(min(target, max_samples)):
+                label = known(candidate.digest, candidate.source) if known else None
+                batch.append((year, month, cluster, candidate, label))
+
+        missing = [candidate for _, _, _, candidate, label in batch if label is None]
+        if missing:
+            fresh = iter(classify([text_of(candidate.row) for candidate in missing]))
+        for year, month, cluster, candidate, label in batch:
+            if label is None:
+                label = next(fresh)
+                if on_label:
+                    on_label(candidate.digest, candidate.source, label)
+            years[year].labels[month][cluster][label] += 1
+
+        for year in active:
+            years[year].update_estimate()
+        active = [year for year in active if not years[year].done(half_width, min_samples, max_samples)]
+        if progress:
+            labelled = sum(min(sample.n, max_samples) for sample in years.values())
+            progress(min(labelled / planned, 0.99) if active else 1.0)
+        if active and time.perf_counter() - start >= budget_seconds:
+            TOPIC_SAMPLES_TRUNCATED.inc(len(active))
+            logger.warning(
+                "Topic sampling stopped after %.1fs with %d year(s) short of the stop rule",
+                time.perf_counter() - start, len(active),
+            )
+            break
+
+    results = {}
+    for year, sample in years.items():
+        estimate = sample.estimate
+        if estimate is not None and year in active:
+            estimate = estimate._replace(complete=False)
+        label_counts = Counter()
+        for clusters in sample.labels.values():
+            for labels in clusters:
+                label_counts.update(labels)
+        results[year] = SampledTopics(label_counts, estimate)
+    return results
+
+
+def _label_every_prompt(
+    samplers: Dict[int, TopicSampler],
+    text_of: Callable[[int], str],
+    classify: Callable[[List[str]], List[str]],
+    known: Optional[Callable[[bytes, Hashable], Optional[str]]],
+    on_label: Optional[Callable[[bytes, Hashable, str], None]],
+    progress: Optional[Callable[[float], None]],
+) -> Dict[int, SampledTopics]:
+    """Exhaustive sample_topics: every prompt labelled in one call, and the exact share of the top topic."""
+    batch = []
+    for year, sampler in samplers.items():
+        for candidate in sampler.candidates():
+            batch.append((year, candidate, known(candidate.digest, candidate.source) if known else None))
+    missing = [candidate for _, candidate, label in batch if label is None]
+    if missing:
+        fresh = iter(classify([text_of(candidate.row) for candidate in missing]))
+
+    label_counts = {year: Counter() for year in samplers}
+    for year, candidate, label in batch:
+        if label is None:
+            label = next(fresh)
+            if on_label:
+                on_label(candidate.digest, candidate.source, label)
+        label_counts[year][label] += 1
+    if progress:
+        progress(1.0)
+
+    results = {}
+    for year, counts in label_counts.items():
+        estimate = None
+        if counts:
+            population = sum(counts.values())
+            topic, count = counts.most_common(1)[0]
+            share = count / population
+            estimate = TopicEstimate(topic, share, share, share, population, population)
+        results[year] = SampledTopics(counts, estimate)
+    return results
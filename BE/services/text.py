@@ -0,0 +1,174 @@
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Iterable, Optional
+
+from core.config import LEMMA_CACHE_SIZE, LEMMA_CACHE_WARMUP_FILE
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Compiled once instead of inside every row loop
+URL_PATTERN = re.compile(r'https?://[a-zA-Z0-9./-]*/[a-zA-Z0-9?=_.]*[_0-9.a-zA-Z/-]*')    #to match url links present in the post
+# Digits, non-word characters and underscores all become a space and adjacent
+# runs collapse into one, which is what the separate digit / \W+ / [_+] / \s+
+# substitutions of the original per-row passes add up to
+NON_WORD_PATTERN = re.compile(r'[\W_0-9]+')
+
+
+@lru_cache(maxsize=1)
+def ensure_nltk_data():
+    """Download the NLTK corpora the pipeline needs, only if they are missing."""
+    import nltk
+
+    for resource, path in (("stopwords", "corpora/stopwords"), ("wordnet", "corpora/wordnet")):
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            nltk.download(resource, quiet=True)
+
+
+@lru_cache(maxsize=1)
+def get_stopwords() -> frozenset:
+    """English stopwords as a set so membership checks are O(1)."""
+    from nltk.corpus import stopwords
+
+    ensure_nltk_data()
+
+    return frozenset(stopwords.words("english"))
+
+
+class LemmaCache:
+    """
+    Process-wide token -> lemma memo with LRU eviction.
+
+    Pre-warmed entries live in a separate pinned dict that is never evicted or
+    written after warmup, so when it is filled before workers fork its pages
+    stay shared between them. Everything else goes through a bounded LRU.
+    """
+
+    def __init__(self, max_size: int = LEMMA_CACHE_SIZE):
+        from nltk.stem import WordNetLemmatizer
+
+        ensure_nltk_data()
+        self.max_size = max_size
+        self._lemmatizer = WordNetLemmatizer()
+        self._pinned: Dict[str, str] = {}
+        self._lru: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token: str) -> str:
+        lemma = self._pinned.get(token)
+        if lemma is not None:
+            with self._lock:
+                self.hits += 1
+            return lemma
+
+        with self._lock:
+            lemma = self._lru.get(token)
+            if lemma is not None:
+                self._lru.move_to_end(token)
+                self.hits += 1
+                return lemma
+            self.misses += 1
+
+        lemma = self._lemmatizer.lemmatize(token)
+        if self.max_size <= 0:
+            return lemma
+        with self._lock:
+            self._lru[token] = lemma
+            if len(self._lru) > self.max_size:
+                self._lru.popitem(last=False)
+                self.evictions += 1
+        return lemma
+
+    def warm(self, tokens: Iterable[str], limit: Optional[int] = None) -> int:
+        """Pin the lemmas of `tokens` (most frequent first); returns the number pinned."""
+        limit = self.max_size if limit is None else limit
+        pinned = dict(self._pinned)
+        for token in tokens:
+            if len(pinned) >= limit:
+                break
+            if token and token not in pinned:
+                pinned[token] = self._lemmatizer.lemmatize(token)
+        self._pinned = pinned
+        return len(pinned)
+
+    def warm_from_file(self, path: str, limit: Optional[int] = None) -> int:
+        """Pre-warm from a frequency list: one token per line, optionally followed by its count."""
+        with open(path, encoding="utf-8") as f:
+            tokens = (line.split()[0] for line in f if line.strip())
+            return self.warm(tokens, limit)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "size": len(self._lru),
+                "pinned": len(self._pinned),
+                "max_size": self.max_size,
+            }
+
+
+_lemma_cache = None
+_lemma_cache_lock = threading.Lock()
+
+def get_lemma_cache() -> LemmaCache:
+    global _lemma_cache
+    if _lemma_cache is None:
+        with _lemma_cache_lock:
+            if _lemma_cache is None:
+                cache = LemmaCache()
+                if LEMMA_CACHE_WARMUP_FILE:
+                    cache.warm_from_file(LEMMA_CACHE_WARMUP_FILE)
+                _lemma_cache = cache
+    return _lemma_cache
+
+
+def lemma_cache_stats() -> Optional[dict]:
+    """Stats of the shared lemma cache, or None if nothing has created it yet."""
+    cache = _lemma_cache
+    return cache.stats() if cache is not None else None
+
+
+def normalize_prompts(texts: "pd.Series") -> "pd.Series":
+    """
+    Normalize a column of prompts in one fused pass.
+    Lowercases, strips URLs, digits and punctuation, collapses whitespace,
+    removes stopwords and lemmatizes. Output matches the original
+    row-by-row `process_text` token for token.
+    """
+    import pandas as pd
+
+    cleaned = (
+        texts.str.lower()
+        .str.replace(URL_PATTERN, ' ', regex=True)
+        .str.replace(NON_WORD_PATTERN, ' ', regex=True)
+    )
+
+    remove_words = get_stopwords()
+    lemma_cache = get_lemma_cache()
+    # Batch-local view so the shared cache is hit once per distinct token
+    lemmas = {}
+
+    normalized = []
+    for text in cleaned:
+        tokens = []
+        for w in text.split(' '):
+            if w in remove_words:
+                continue
+            lemma = lemmas.get(w)
+            if lemma is None:
+                lemma = lemmas[w] = lemma_cache.get(w)
+            tokens.append(lemma)
+        normalized.append(" ".join(tokens))
+
+    return pd.Series(normalized, index=texts.index, dtype=object)
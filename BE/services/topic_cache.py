@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Tuple
+
+from core.config import TOPIC_CACHE_MAX_ENTRIES
+
+# SQLite's default limit on bound parameters is 999
+_CHUNK = 500
+
+
+def cache_namespace(labels: List[str], hypothesis_template: str, model: str) -> str:
+    """Fingerprint of everything that affects a prediction besides the prompt itself."""
+    payload = json.dumps(
+        {"labels": list(labels), "hypothesis_template": hypothesis_template, "model": model},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def normalize_key_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+class TopicCache:
+    """
+    Disk-backed prompt -> (label, confidence) cache in a local SQLite file.
+
+    Rows are keyed by a hash of the whitespace-normalized prompt and the
+    namespace (label set, hypothesis template, model), so changing the labels
+    or the model invalidates it, while several namespaces (e.g. the API's
+    engine and the distillation teacher) share one file without clobbering
+    each other. Rows of namespaces no longer in use are never read again and
+    age out: when the row count exceeds `max_entries`, the least recently used
+    tenth is evicted.
+    """
+
+    def __init__(self, path: str, namespace: str, max_entries: int = TOPIC_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS topic_cache ("
+                "key TEXT PRIMARY KEY, label TEXT NOT NULL, confidence REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS topic_cache_last_used ON topic_cache (last_used)")
+
+    def key(self, text: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(self.namespace.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(normalize_key_text(text).encode("utf-8"))
+        return digest.hexdigest()
+
+    def get_many(self, texts: Iterable[str]) -> Dict[str, Tuple[str, float]]:
+        """Return {text: (label, confidence)} for the texts that are cached."""
+        keys = {}
+        for text in texts:
+            keys.setdefault(self.key(text), []).append(text)
+
+        found = {}
+        now = time.time()
+        with self._lock, self._conn:
+            key_list = list(keys)
+            for start in range(0, len(key_list), _CHUNK):
+                chunk = key_list[start:start + _CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, label, confidence FROM topic_cache WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, label, confidence in rows:
+                    for text in keys[key]:
+                        found[text] = (label, confidence)
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE topic_cache SET last_used = ? WHERE key = ?", [(now, row[0]) for row in rows]
+                    )
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, str, float]]):
+        """Store (text, label, confidence) triples and evict if over capacity."""
+        now = time.time()
+        rows = [(self.key(text), str(label), float(confidence), now) for text, label, confidence in items]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO topic_cache (key, label, confidence, last_used) VALUES (?, ?, ?, ?)", rows
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM topic_cache").fetchone()[0]
+            if count > self.max_entries:
+                excess = count - int(self.max_entries * 0.9)
+                self._conn.execute(
+                    "DELETE FROM topic_cache WHERE key IN "
+                    "(SELECT key FROM topic_cache ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM topic_cache").fetchone()[0]
@@ -0,0 +1,281 @@
+import logging
+import os
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from core.config import (
+    TOPIC_ENGINE,
+    TOPIC_MODEL,
+    TOPIC_BATCH_SIZE,
+    TOPIC_NUM_THREADS,
+    TOPIC_QUANTIZE,
+    TOPIC_MAX_LENGTH,
+    TOPIC_CACHE_PATH,
+    TOPIC_STUDENT_PATH,
+)
+from services.metrics import CACHE_LOOKUPS, PROMPTS_CLASSIFIED
+from services.models import TOPIC_STUDENT_MODEL, ModelBundle, get_model_registry
+from services.topic_cache import TopicCache, cache_namespace
+
+logger = logging.getLogger("wrapped.topics")
+
+TOPIC_LABELS = [
+    "Technology",
+    "Data Analysis",
+    "Natural Language Processing",
+    "Education",
+    "Personal Development",
+    "Literature and Books",
+    "Finance and Economics",
+    "Programming",
+    "Philosophy",
+    "General Knowledge"
+]
+HYPOTHESIS_TEMPLATE = "This prompt is about {label}."
+
+# Initialize topic classification model (singleton pattern)
+_topic_classifier = None
+_topic_task = None
+# Guards model loading so warmup and a concurrent first request load it only once
+_model_lock = threading.Lock()
+
+def get_topic_classifier():
+    global _topic_classifier, _topic_task
+    if _topic_classifier is None:
+        with _model_lock:
+            if _topic_classifier is None:
+                # Heavy imports are deferred so importing the API stays fast
+                from a2t.base import EntailmentClassifier
+                from a2t.tasks import TopicClassificationTask
+
+                _topic_task = TopicClassificationTask(
+                    name="Prompt Topic Classification",
+                    labels=TOPIC_LABELS,
+                    hypothesis_template=HYPOTHESIS_TEMPLATE
+                )
+                _topic_classifier = EntailmentClassifier(
+                    'roberta-large-mnli',
+                    use_cuda=False,
+                    half=False
+                )
+    return _topic_classifier, _topic_task
+
+
+class TopicInferenceEngine:
+    """
+    CPU-only batched zero-shot topic classifier.
+
+    Scores every (prompt, hypothesis) pair with an NLI model the same way
+    `EntailmentClassifier` does (entailment logit per label, softmax across
+    labels), but sorts pairs by token length and runs them in fixed-size
+    micro-batches padded only to the longest pair in the batch, instead of one
+    forward pass per prompt.
+    """
+
+    def __init__(
+        self,
+        model_name: str = TOPIC_MODEL,
+        labels: List[str] = TOPIC_LABELS,
+        hypothesis_template: str = HYPOTHESIS_TEMPLATE,
+        batch_size: int = TOPIC_BATCH_SIZE,
+        num_threads: int = TOPIC_NUM_THREADS,
+        quantize: bool = TOPIC_QUANTIZE,
+        max_length: int = TOPIC_MAX_LENGTH,
+    ):
+        import torch
+        from transformers import AutoConfig, AutoModelForSequenceClassification, AutoTokenizer
+
+        if num_threads > 0:
+            torch.set_num_threads(num_threads)
+
+        self.model_name = model_name
+        self.labels = list(labels)
+        self.hypotheses = [hypothesis_template.format(label=label) for label in self.labels]
+        self.batch_size = max(1, batch_size)
+        self.max_length = max_length
+        self.quantized = quantize
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForSequenceClassification.from_pretrained(model_name)
+        model = model.to(torch.device("cpu")).eval()
+        if quantize:
+            # Dynamic int8 on the Linear layers, which dominate transformer CPU time
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model
+
+        config = AutoConfig.from_pretrained(model_name)
+        label2id = {k.lower(): v for k, v in config.label2id.items()}
+        if "entailment" not in label2id:
+            raise ValueError(f"Model {model_name} has no ENTAILMENT label in its label2id config")
+        self.ent_pos = int(label2id["entailment"])
+
+    def entailment_scores(self, texts: List[str]) -> np.ndarray:
+        """Raw entailment logits, shape (len(texts), len(labels))."""
+        import torch
+
+        n_labels = len(self.labels)
+        sep = self.tokenizer.sep_token
+        # Same premise/hypothesis layout as a2t's generate_premise_hypotheses_pairs
+        pairs = [f"{text} {sep} {hypothesis}" for text in texts for hypothesis in self.hypotheses]
+        scores = np.zeros(len(pairs), dtype=np.float32)
+        if not pairs:
+            return scores.reshape(0, n_labels)
+
+        encoded = self.tokenizer(pairs, truncation=True, max_length=self.max_length)["input_ids"]
+        order = sorted(range(len(encoded)), key=lambda i: len(encoded[i]))
+
+        with torch.inference_mode():
+            for start in range(0, len(order), self.batch_size):
+                idx = order[start:start + self.batch_size]
+                batch = self.tokenizer.pad(
+                    {"input_ids": [encoded[i] for i in idx]},
+                    padding="longest",
+                    return_tensors="pt",
+                )
+                logits = self.model(**batch).logits
+                scores[idx] = logits[:, self.ent_pos].float().numpy()
+
+        return scores.reshape(len(texts), n_labels)
+
+    def classify(self, texts: List[str]) -> Tuple[List[str], List[float]]:
+        """Return the top label and its confidence for every text."""
+        if not texts:
+            return [], []
+        scores = self.entailment_scores(texts)
+        scores = scores - scores.max(axis=-1, keepdims=True)
+        probs = np.exp(scores) / np.exp(scores).sum(axis=-1, keepdims=True)
+        best = probs.argmax(axis=-1)
+        labels = [self.labels[i] for i in best]
+        confidences = probs[np.arange(len(texts)), best].tolist()
+        return labels, confidences
+
+
+_topic_engine = None
+
+def get_topic_engine() -> TopicInferenceEngine:
+    global _topic_engine
+    if _topic_engine is None:
+        with _model_lock:
+            if _topic_engine is None:
+                _topic_engine = TopicInferenceEngine()
+    return _topic_engine
+
+
+def classify_with_a2t(texts: List[str]) -> Tuple[List[str], List[float]]:
+    """Reference path: one EntailmentClassifier forward pass per prompt."""
+    from a2t.tasks import TopicClassificationFeatures
+
+    classifier, task = get_topic_classifier()
+    topic_features = [TopicClassificationFeatures(context=text, label=None) for text in texts]
+    results = classifier(
+        task=task,
+        features=topic_features,
+        return_labels=True,
+        return_confidences=True
+    )
+    labels = [r[0] if isinstance(r, tuple) else r for r in results]
+    confidences = [float(r[1]) if isinstance(r, tuple) else 0.0 for r in results]
+    return labels, confidences
+
+
+_student_fallback_logged = False
+
+def get_topic_student() -> Optional[ModelBundle]:
+    """The distilled student, when TOPIC_ENGINE is "distilled" and its bundle loads."""
+    global _student_fallback_logged
+    if TOPIC_ENGINE != "distilled":
+        return None
+    student = get_model_registry().get(TOPIC_STUDENT_MODEL)
+    if student is None and not _student_fallback_logged:
+        _student_fallback_logged = True
+        logger.error(
+            'TOPIC_ENGINE is "distilled" but no topic student loaded (TOPIC_STUDENT_PATH=%s); '
+            "sampling the batched zero-shot teacher instead",
+            TOPIC_STUDENT_PATH,
+        )
+    return student
+
+
+def labels_every_prompt() -> bool:
+    """True when the model is cheap enough to label every prompt instead of a sample."""
+    return get_topic_student() is not None
+
+
+def teacher_model_id(engine: str = TOPIC_ENGINE) -> str:
+    """Identifies the zero-shot model configuration of `engine`."""
+    if engine == "a2t":
+        return "a2t:roberta-large-mnli"
+    return f"batched:{TOPIC_MODEL}" + (":int8" if TOPIC_QUANTIZE else "")
+
+
+def topic_model_id() -> str:
+    """Identifies the model configuration that produced a prediction."""
+    student = get_topic_student()
+    if student is not None:
+        return f"distilled:{student.version}"
+    return teacher_model_id()
+
+
+_topic_cache = None
+
+def get_topic_cache():
+    global _topic_cache
+    if _topic_cache is None and TOPIC_CACHE_PATH:
+        _topic_cache = TopicCache(
+            TOPIC_CACHE_PATH,
+            cache_namespace(TOPIC_LABELS, HYPOTHESIS_TEMPLATE, teacher_model_id()),
+        )
+    return _topic_cache
+
+
+def _reset_topic_cache():
+    # SQLite connections must not cross a fork; each worker opens its own
+    global _topic_cache
+    _topic_cache = None
+
+os.register_at_fork(after_in_child=_reset_topic_cache)
+
+
+def run_teacher(texts: List[str], engine: str = TOPIC_ENGINE) -> Tuple[List[str], List[float]]:
+    """Classify with a zero-shot teacher, bypassing the cache."""
+    if engine == "a2t":
+        return classify_with_a2t(texts)
+    return get_topic_engine().classify(texts)
+
+
+def classify_topics(texts: List[str]) -> Tuple[List[str], List[float]]:
+    """
+    Classify prompts with the engine selected by TOPIC_ENGINE ("distilled",
+    "batched" or "a2t"). The student answers directly; zero-shot predictions
+    are looked up in the persistent topic cache first, and only distinct cache
+    misses are sent to the model.
+    """
+    if not texts:
+        return [], []
+    student = get_topic_student()
+    if student is not None:
+        # Faster than the cache lookup would be
+        PROMPTS_CLASSIFIED.inc(len(texts))
+        return student.predict_texts(texts)
+    cache = get_topic_cache()
+    if cache is None:
+        PROMPTS_CLASSIFIED.inc(len(texts))
+        return run_teacher(texts)
+
+    known = cache.get_many(texts)
+    misses = list(dict.fromkeys(text for text in texts if text not in known))
+    hits = sum(text in known for text in texts)
+    CACHE_LOOKUPS.inc(hits, cache="topic", result="hit")
+    CACHE_LOOKUPS.inc(len(texts) - hits, cache="topic", result="miss")
+    if misses:
+        PROMPTS_CLASSIFIED.inc(len(misses))
+        labels, confidences = run_teacher(misses)
+        fresh = list(zip(misses, labels, confidences))
+        cache.put_many(fresh)
+        known.update((text, (label, confidence)) for text, label, confidence in fresh)
+
+    labels = [known[text][0] for text in texts]
+    confidences = [known[text][1] for text in texts]
+    return labels, confidences
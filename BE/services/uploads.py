@@ -0,0 +1,161 @@
+"""
+Uploaded export archives on disk.
+
+Uploads are parsed out of the request body as it arrives and written to a
+temporary file a chunk at a time, so a request never holds the whole archive
+in memory or on disk twice, and the archive is then read back through a
+read-only memory map. The size limit is enforced while receiving.
+"""
+import mmap
+import os
+import tempfile
+from contextlib import contextmanager, suppress
+from typing import Iterator, Tuple
+from zipfile import ZipFile
+
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+
+from core.config import MAX_UPLOAD_BYTES, UPLOAD_CHUNK_SIZE, UPLOAD_SPOOL_DIR
+from services.metrics import UPLOAD_BYTES
+
+
+class _MappedFile:
+    """
+    File-like view of an mmap for ZipFile (mmap only grew `seekable` in Python
+    3.13). `name` becomes the ZipFile's filename, so parse workers can open it.
+    """
+
+    def __init__(self, buffer: mmap.mmap, name: str):
+        self._buffer = buffer
+        self.name = name
+        self.read = buffer.read
+        self.tell = buffer.tell
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        # Files raise OSError on a seek before the start, which ZipFile expects
+        # from archives shorter than their end record; mmap raises ValueError
+        try:
+            return self._buffer.seek(offset, whence)
+        except ValueError as e:
+            raise OSError(str(e)) from e
+
+    def seekable(self) -> bool:
+        return True
+
+    def close(self):
+        self._buffer.close()
+
+
+async def receive_upload(
+    request: Request, field: str = "file", max_bytes: int = MAX_UPLOAD_BYTES, chunk_size: int = UPLOAD_CHUNK_SIZE
+) -> Tuple[str, str]:
+    """
+    Stream the `field` file of a multipart/form-data request body into a new
+    temporary file, and return its path and the client's file name. The body
+    is parsed as it arrives, so the file is written once and never spooled
+    elsewhere first. The caller owns the file and removes it with
+    `remove_upload`. Raises 400 without such a file and 413 as soon as it
+    grows past `max_bytes`.
+    """
+    from python_multipart.exceptions import MultipartParseError
+    from python_multipart.multipart import MultipartParser, parse_options_header
+
+    content_type, params = parse_options_header(request.headers.get("content-type"))
+    if content_type != b"multipart/form-data" or not params.get(b"boundary"):
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+
+    target = field.encode()
+    headers = {}
+    header = {"field": bytearray(), "value": bytearray()}
+    part = {"in_file": False, "filename": None, "size": 0}
+    pending = bytearray()
+
+    def on_part_begin():
+        headers.clear()
+
+    def on_header_field(data, start, end):
+        header["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        header["value"] += data[start:end]
+
+    def on_header_end():
+        headers[bytes(header["field"]).lower()] = bytes(header["value"])
+        header["field"].clear()
+        header["value"].clear()
+
+    def on_headers_finished():
+        _, options = parse_options_header(headers.get(b"content-disposition"))
+        # The first file of the field is the upload; anything else is skipped
+        if options.get(b"name") == target and b"filename" in options and part["filename"] is None:
+            part["in_file"] = True
+            part["filename"] = options[b"filename"].decode("utf-8", "replace")
+
+    def on_part_data(data, start, end):
+        if part["in_file"]:
+            pending.extend(data[start:end])
+            part["size"] += end - start
+
+    def on_part_end():
+        part["in_file"] = False
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    fd, path = tempfile.mkstemp(prefix="upload-", suffix=".zip", dir=UPLOAD_SPOOL_DIR)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            async for chunk in request.stream():
+                try:
+                    parser.write(chunk)
+                except MultipartParseError:
+                    raise HTTPException(status_code=400, detail="Malformed multipart body")
+                if part["size"] > max_bytes:
+                    raise HTTPException(
+                        status_code=413, detail=f"Upload exceeds the {max_bytes // (1024 * 1024)} MiB limit"
+                    )
+                # Disk writes go to the threadpool in chunk_size batches, off the event loop
+                if len(pending) >= chunk_size:
+                    data = bytes(pending)
+                    pending.clear()
+                    await run_in_threadpool(out.write, data)
+            parser.finalize()
+            if pending:
+                await run_in_threadpool(out.write, bytes(pending))
+        if part["filename"] is None:
+            raise HTTPException(status_code=400, detail=f"No file in the '{field}' form field")
+    except BaseException:
+        remove_upload(path)
+        raise
+    UPLOAD_BYTES.observe(part["size"])
+    return path, part["filename"]
+
+
+def remove_upload(path: str):
+    with suppress(FileNotFoundError):
+        os.remove(path)
+
+
+@contextmanager
+def open_export(path: str) -> Iterator[ZipFile]:
+    """Open a ZIP on disk, memory-mapped where the platform allows it."""
+    with open(path, "rb") as f:
+        try:
+            mapped = _MappedFile(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), path)
+        except (ValueError, OSError):
+            # Empty files cannot be mapped; ZipFile reports them as bad archives
+            mapped = None
+        try:
+            with ZipFile(mapped if mapped is not None else f) as zip_file:
+                yield zip_file
+        finally:
+            if mapped is not None:
+                mapped.close()
@@ -0,0 +1,115 @@
+import threading
+import time
+import traceback
+from typing import Dict
+
+from core.config import TOPIC_ENGINE
+
+_state = {"ready": False, "started": False, "error": None}
+_timings: Dict[str, float] = {}
+_lock = threading.Lock()
+
+
+def _load_corpora():
+    from services.text import get_stopwords, get_lemma_cache
+
+    get_stopwords()
+    # WordNet loads lazily on the first lemmatize call
+    get_lemma_cache().get("warmup")
+
+
+def _load_pandas():
+    import pandas  # noqa: F401
+
+
+def _load_topic_model():
+    from services.topics import get_topic_classifier, get_topic_engine, get_topic_student
+
+    if get_topic_student() is not None:
+        return
+    if TOPIC_ENGINE == "a2t":
+        get_topic_classifier()
+    else:
+        get_topic_engine()
+
+
+def _open_topic_cache():
+    from services.topics import get_topic_cache, get_topic_student
+
+    if get_topic_student() is None:
+        get_topic_cache()
+
+
+def _load_mbti_model():
+    from services.models import MBTI_MODEL, get_model_registry
+
+    get_model_registry().get(MBTI_MODEL)
+
+
+def _load_keyword_index():
+    from services.keyword_index import get_keyword_index
+
+    get_keyword_index()
+
+
+# Warmup steps in order; each is timed separately
+WARMUP_STEPS = (
+    ("pandas", _load_pandas),
+    ("corpora", _load_corpora),
+    ("topic_model", _load_topic_model),
+    ("topic_cache", _open_topic_cache),
+    ("mbti_model", _load_mbti_model),
+    ("keyword_index", _load_keyword_index),
+)
+# Steps that open SQLite connections, which must not cross a fork
+PER_PROCESS_STEPS = frozenset({"topic_cache"})
+
+
+def warm_up(before_fork: bool = False) -> Dict[str, float]:
+    """
+    Load every heavy module and model the pipeline needs. Idempotent and
+    thread-safe; returns per-step seconds. Readiness flips once it succeeds.
+    `before_fork` skips the PER_PROCESS_STEPS, which each forked worker then
+    runs lazily on first use.
+    """
+    with _lock:
+        if _state["ready"]:
+            return dict(_timings)
+        _state["started"] = True
+        _state["error"] = None
+        try:
+            for name, step in WARMUP_STEPS:
+                if before_fork and name in PER_PROCESS_STEPS:
+                    continue
+                start = time.perf_counter()
+                step()
+                _timings[name] = round(time.perf_counter() - start, 3)
+        except Exception as e:
+            _state["error"] = f"{type(e).__name__}: {e}"
+            traceback.print_exc()
+            raise
+        _state["ready"] = True
+        return dict(_timings)
+
+
+def mark_ready():
+    """Report ready without warming up (models then load on first request)."""
+    _state["ready"] = True
+
+
+def is_ready() -> bool:
+    return _state["ready"]
+
+
+def readiness() -> dict:
+    from services.keyword_index import keyword_index_info
+    from services.models import get_model_registry
+
+    return {
+        "ready": _state["ready"],
+        "warming_up": _state["started"] and not _state["ready"] and _state["error"] is None,
+        "error": _state["error"],
+        "warmup_seconds": dict(_timings),
+        "models": get_model_registry().versions(),
+        "keyword_index": keyword_index_info(),
+    }
@@ -0,0 +1,47 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Tests import the app's packages the way the server does, from BE/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+FALLBACK_STOPWORDS = ["i", "me", "a", "an", "the", "is", "are", "and", "to", "of", "in", "for", "s", "t", "don", "it"]
+
+
+class _FallbackLemmatizer:
+    def lemmatize(self, word):
+        return word[:-1] if len(word) > 3 and word.endswith("s") else word
+
+
+def _nltk_data():
+    try:
+        import nltk
+
+        nltk.data.find("corpora/stopwords")
+        nltk.data.find("corpora/wordnet")
+    except (ImportError, LookupError):
+        return None
+    from nltk.corpus import stopwords
+    from nltk.stem import WordNetLemmatizer
+
+    return stopwords.words("english"), WordNetLemmatizer()
+
+
+class _Lemmas:
+    def __init__(self, lemmatizer):
+        self._lemmatizer = lemmatizer
+
+    def get(self, token):
+        return self._lemmatizer.lemmatize(token)
+
+
+@pytest.fixture
+def nlp(monkeypatch):
+    """Text normalization with the NLTK corpora when installed, else a fixed stand-in."""
+    import services.text as text
+
+    remove_words, lemmatizer = _nltk_data() or (FALLBACK_STOPWORDS, _FallbackLemmatizer())
+    monkeypatch.setattr(text, "get_stopwords", lambda: frozenset(remove_words))
+    monkeypatch.setattr(text, "get_lemma_cache", lambda: _Lemmas(lemmatizer))
+    return remove_words, lemmatizer
@@ -0,0 +1,43 @@
+"""
+Reserved admission tickets hold room in the queue but are only granted once
+waited on, in the order they are waited on.
+"""
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from services.admission import AdmissionController
+
+
+def test_reserved_tickets_join_the_queue_when_waited_on():
+    controller = AdmissionController(capacity=1, queue_capacity=2)
+    first = controller.reserve(1)
+    second = controller.reserve(1)
+    # Both count against the queue, so a third analysis is refused
+    with pytest.raises(HTTPException) as refused:
+        controller.enqueue(1)
+    assert refused.value.status_code == 429
+    assert first.granted_at is None and second.granted_at is None
+
+    # The second job's worker starts first and is not held up by the first
+    second.wait()
+    assert second.granted_at is not None
+    waiter = threading.Thread(target=first.wait)
+    waiter.start()
+    waiter.join(0.2)
+    assert waiter.is_alive()
+    second.release()
+    waiter.join(5)
+    assert not waiter.is_alive() and first.granted_at is not None
+    first.release()
+    assert controller.stats()["running_cost"] == 0 and controller.stats()["reserved_cost"] == 0
+
+
+def test_released_reservation_frees_its_room():
+    controller = AdmissionController(capacity=1, queue_capacity=2)
+    held = [controller.reserve(1), controller.reserve(1)]
+    held[0].release()
+    held[0].release()
+    held.append(controller.enqueue(1))
+    assert controller.stats()["reserved_cost"] == 1
@@ -0,0 +1,34 @@
+"""
+Space-Saving summaries never report more than an item's true count, and rank
+ties the same way whatever order the stream came in.
+"""
+import random
+from collections import Counter
+
+from services.heavy_hitters import SpaceSaving, prompt_counter
+
+
+def test_summary_reports_guaranteed_counts():
+    rng = random.Random(0)
+    stream = [f"p{min(int(rng.paretovariate(1.2)), 500)}" for _ in range(20000)]
+    summary = SpaceSaving(50)
+    summary.update(stream)
+    assert not summary.exact
+    truth = Counter(stream)
+    for item, count in summary.most_common(10):
+        assert count <= truth[item]
+
+
+def test_ties_do_not_depend_on_stream_order():
+    stream = ["b", "a", "c", "a", "b", "c", "d"]
+    ranked = []
+    for order in (stream, stream[::-1]):
+        counter = SpaceSaving()
+        counter.update(order)
+        ranked.append(counter.most_common())
+    assert ranked[0] == ranked[1] == [("a", 2), ("b", 2), ("c", 2), ("d", 1)]
+
+
+def test_years_below_the_row_threshold_count_exactly():
+    assert prompt_counter(1000).capacity is None
+    assert prompt_counter(10 ** 9).capacity is not None
@@ -0,0 +1,169 @@
+"""
+Incremental analysis against a user's stored state gives the same responses
+as analyzing every export from scratch, in every timezone, including when the
+sampling time budget cuts the first analyses short. The topic model is
+replaced by a deterministic labelling of the text.
+"""
+import copy
+import io
+import json
+import os
+import random
+import time
+import types
+import zipfile
+import zlib
+
+import pytest
+
+import services.pipeline as pipeline
+import services.sampling as sampling
+from benchmarks.synthetic_export import ExportGenerator
+from services.aggregation import AggregateStore
+from services.incremental import UserState, UserStateStore
+from services.prompt_store import PromptStore
+
+LABELS = ["Programming", "Education", "Finance and Economics", "Philosophy", "General Knowledge"]
+TIMEZONES = ("Asia/Singapore", "America/New_York")
+
+
+def fake_labels(texts):
+    # Skewed, so the top topic's interval needs more than one round
+    return [LABELS[min(zlib.crc32(text.encode("utf-8")) % 9, len(LABELS) - 1)] for text in texts]
+
+
+@pytest.fixture(autouse=True)
+def offline_pipeline(monkeypatch, nlp):
+    monkeypatch.setattr(pipeline, "classify_topics", lambda texts: (fake_labels(texts), [1.0] * len(texts)))
+    monkeypatch.setattr(pipeline, "labels_every_prompt", lambda: False)
+    monkeypatch.setattr(pipeline, "topic_model_id", lambda: "fake")
+    monkeypatch.setattr(pipeline, "predict_year_mbti", lambda aggregates: None)
+    monkeypatch.setattr(pipeline, "get_keyword_index", lambda: None)
+
+
+def export_zip(conversations, user_id="user-1"):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        zf.writestr("conversations.json", json.dumps(conversations))
+        zf.writestr("user.json", json.dumps({"id": user_id}))
+    return zipfile.ZipFile(io.BytesIO(buffer.getvalue()))
+
+
+def revise(conversations, seed):
+    """The next export of the same account: some edits, some deletions, new conversations."""
+    rng = random.Random(seed)
+    revised = []
+    for conv in copy.deepcopy(conversations):
+        roll = rng.random()
+        if roll < 0.1:
+            continue
+        if roll < 0.25:
+            for node in conv["mapping"].values():
+                message = node["message"]
+                if message and message["author"]["role"] == "user":
+                    message["content"]["parts"] = [f"rewritten prompt about topic {rng.random()}"]
+                    break
+            conv["update_time"] += 3600
+        revised.append(conv)
+    return revised + list(ExportGenerator(150, seed))
+
+
+def responses(conversations, timezone, state_store, prompt_store=None):
+    zip_file = export_zip(conversations)
+    export_id = pipeline.export_digest(zip_file)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(pipeline, "get_user_state_store", lambda: state_store)
+        mp.setattr(pipeline, "get_prompt_store", lambda: prompt_store)
+        aggregates = pipeline._build_export_aggregates(zip_file, export_id, timezone, pipeline._noop_progress)
+    years = sorted(aggregates.years) + [1999]
+    return aggregates, {year: pipeline.wrapped_response(aggregates, year).model_dump() for year in years}
+
+
+@pytest.mark.parametrize("with_prompt_store", [False, True])
+def test_incremental_matches_full_recomputation(tmp_path, with_prompt_store):
+    store = UserStateStore(str(tmp_path / "state"))
+    prompt_store = None
+    if with_prompt_store:
+        pytest.importorskip("pyarrow")
+        # Later analyses of an export, incremental or not, read it from here
+        prompt_store = PromptStore(str(tmp_path / "prompts"))
+    first = conversations = list(ExportGenerator(1500, 0))
+    for revision in range(3):
+        for timezone in TIMEZONES:
+            _, incremental = responses(conversations, timezone, store, prompt_store)
+            _, full = responses(conversations, timezone, None, prompt_store)
+            assert incremental == full
+        conversations = revise(conversations, revision + 1)
+    # Both timezones share the user's one state file
+    assert len(os.listdir(tmp_path / "state")) == 1
+
+    # An older export again, against the state the later ones left
+    _, incremental = responses(first, TIMEZONES[0], store, prompt_store)
+    _, full = responses(first, TIMEZONES[0], None)
+    assert incremental == full
+
+
+def test_stored_response_rebuilds_from_prompt_store(tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    prompt_store = PromptStore(str(tmp_path))
+    aggregates, full = responses(list(ExportGenerator(1500, 0)), TIMEZONES[0], None, prompt_store)
+
+    # Another worker: its own empty aggregate store, the same prompt files
+    monkeypatch.setattr(pipeline, "get_aggregate_store", lambda: AggregateStore())
+    monkeypatch.setattr(pipeline, "get_prompt_store", lambda: prompt_store)
+    for year, response in full.items():
+        assert pipeline.stored_response(aggregates.export_id, year, TIMEZONES[0]).model_dump() == response
+    assert pipeline.stored_response("unknown", 2024, TIMEZONES[0]) is None
+
+
+def test_budget_cut_samples_converge_to_full_recomputation(tmp_path, monkeypatch):
+    full = {timezone: responses(list(ExportGenerator(1500, 0)), timezone, None)[1] for timezone in TIMEZONES}
+
+    # Every model call takes 0.3 s of a fake clock, past the 0.2 s budget,
+    # so each analysis labels one round more than the last before it stops
+    clock = [0.0]
+
+    def slow_classify(texts):
+        clock[0] += 0.3
+        return fake_labels(texts), [1.0] * len(texts)
+
+    monkeypatch.setattr(pipeline, "classify_topics", slow_classify)
+    monkeypatch.setattr(sampling, "time", types.SimpleNamespace(perf_counter=lambda: clock[0]))
+    monkeypatch.setattr(sampling, "TOPIC_SAMPLE_BUDGET_SECONDS", 0.2)
+
+    store = UserStateStore(str(tmp_path))
+    for timezone in TIMEZONES:
+        runs = []
+        for _ in range(20):
+            aggregates, incremental = responses(list(ExportGenerator(1500, 0)), timezone, store)
+            runs.append(aggregates.topics_complete)
+            if aggregates.topics_complete:
+                break
+        # Cut short and flagged as such, then continued from the stored labels;
+        # the second timezone reuses the first one's labels
+        assert runs[-1] and (timezone != TIMEZONES[0] or not runs[0])
+        assert incremental == full[timezone]
+
+
+def test_user_state_keeps_no_prompt_text(tmp_path):
+    store = UserStateStore(str(tmp_path))
+    conversations = list(ExportGenerator(300, 0))
+    responses(conversations, TIMEZONES[0], store)
+    responses(revise(conversations, 1), TIMEZONES[0], store)
+    with open(os.path.join(tmp_path, os.listdir(tmp_path)[0]), "rb") as f:
+        assert b"rewritten prompt about topic" not in f.read()
+
+
+def test_user_state_store_retention(tmp_path):
+    store = UserStateStore(str(tmp_path), max_entries=2, ttl_seconds=3600)
+    for i, user in enumerate(("a", "b", "c")):
+        store.put(UserState(user, "fake"))
+        os.utime(store._path(user), (time.time() - 10 + i, time.time() - 10 + i))
+    # Past max_entries the least recently used state is removed
+    assert store.get("a") is None
+    assert store.get("b") is not None and store.get("c") is not None
+
+    old = time.time() - 7200
+    os.utime(store._path("b"), (old, old))
+    assert store.get("b") is None
+    assert not os.path.exists(store._path("b"))
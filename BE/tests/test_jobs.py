@@ -0,0 +1,40 @@
+"""
+A job run by one worker process can be polled from another through the
+shared job store.
+"""
+import threading
+import zipfile
+
+from fastapi import HTTPException
+
+import services.jobs as jobs
+from services.jobs import JobManager, JobStore
+
+
+def test_job_is_visible_to_other_workers(tmp_path, monkeypatch):
+    started, finish = threading.Event(), threading.Event()
+
+    def analyze(zip_file, year, timezone, progress, admit, export_id):
+        progress("parse", 1.0)
+        started.set()
+        finish.wait(5)
+        raise HTTPException(status_code=422, detail="No prompts")
+
+    monkeypatch.setattr(jobs, "analyze_export", analyze)
+    zip_path = str(tmp_path / "export.zip")
+    with zipfile.ZipFile(zip_path, "w") as zf:
+        zf.writestr("conversations.json", "[]")
+
+    running = JobManager(workers=1, store=JobStore(str(tmp_path / "jobs.sqlite3")))
+    other = JobManager(workers=1, store=JobStore(str(tmp_path / "jobs.sqlite3")))
+    job = running.submit(zip_path, 2025, "UTC")
+    assert started.wait(5)
+
+    seen = other.get(job.id)
+    assert seen.stored and seen.status == "running" and seen.stages["parse"] == 1.0
+    finish.set()
+    running._executor.shutdown(wait=True)
+
+    seen = other.get(job.id)
+    assert seen.snapshot() == job.snapshot() and seen.snapshot()["error"] == "No prompts"
+    assert other.get("unknown") is None
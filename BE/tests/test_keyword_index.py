@@ -0,0 +1,31 @@
+"""
+An export and the prompts file written from it are the same keyword index
+source.
+"""
+import json
+import zipfile
+
+import pytest
+
+from benchmarks.synthetic_export import ExportGenerator
+from services.keyword_index import source_id
+from services.pipeline import export_digest
+
+
+def test_prompts_file_is_keyed_on_its_export(tmp_path):
+    pytest.importorskip("pyarrow")
+    from services.prompt_store import PromptStore, write_prompts
+
+    zip_path = str(tmp_path / "export.zip")
+    with zipfile.ZipFile(zip_path, "w") as zf:
+        zf.writestr("conversations.json", json.dumps(list(ExportGenerator(20, 0))))
+    with zipfile.ZipFile(zip_path) as zf:
+        export_id = export_digest(zf)
+
+    store = PromptStore(str(tmp_path / "prompts"))
+    store.put(export_id, ["hello world"], [0.0], ["c"], [0.0], [1], ["hello world"])
+    assert source_id(zip_path) == source_id(store._path(export_id)) == export_id
+
+    # Files written without an export id fall back to their content
+    write_prompts(str(tmp_path / "old.arrow"), ["hello world"], [0.0], ["c"], [0.0], [1], ["hello world"])
+    assert len(source_id(str(tmp_path / "old.arrow"))) == 64
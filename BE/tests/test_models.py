@@ -0,0 +1,52 @@
+"""
+An MBTI bundle builds its features from the training vocabulary it ships
+with; one without a vocabulary makes no predictions.
+"""
+from collections import Counter
+
+import numpy as np
+import pytest
+
+joblib = pytest.importorskip("joblib")
+sklearn_text = pytest.importorskip("sklearn.feature_extraction.text")
+sklearn_dummy = pytest.importorskip("sklearn.dummy")
+
+import services.pipeline as pipeline
+from services.aggregation import ExportAggregates, YearAggregate
+from services.models import MBTI_MODEL, ModelBundle, ModelRegistry
+
+DOCUMENTS = ["code python loop loop", "feel care people friends", "theory idea idea future code"]
+
+
+def save_bundle(path, **extra):
+    vectorizer = sklearn_text.TfidfVectorizer().fit(DOCUMENTS)
+    model = sklearn_dummy.DummyClassifier().fit(vectorizer.transform(DOCUMENTS), [0, 1, 1])
+    joblib.dump({"model": model, "classes": ["INTJ", "ENFP"], **extra}, path)
+    return vectorizer
+
+
+def test_vocabulary_features_match_the_fitted_vectorizer(tmp_path):
+    vectorizer = save_bundle(tmp_path / "bundle.pkl")
+    vocabulary = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+    save_bundle(tmp_path / "bundle.pkl", vocabulary=vocabulary, idf=vectorizer.idf_)
+    bundle = ModelBundle(MBTI_MODEL, str(tmp_path / "bundle.pkl"))
+
+    document = "idea code idea unseen"
+    expected = vectorizer.transform([document]).toarray()[0]
+    assert np.allclose(bundle.features(Counter(document.split())), expected, atol=1e-6)
+
+
+def test_bundle_without_vocabulary_makes_no_prediction(tmp_path, monkeypatch):
+    save_bundle(tmp_path / "bundle.pkl")
+    bundle = ModelBundle(MBTI_MODEL, str(tmp_path / "bundle.pkl"))
+    assert not bundle.has_features
+    registry = ModelRegistry({})
+    registry._bundles[MBTI_MODEL] = bundle
+    monkeypatch.setattr(pipeline, "get_model_registry", lambda: registry)
+
+    agg = YearAggregate(2025)
+    agg.keyword_counter.update(["code", "idea"])
+    aggregates = ExportAggregates("export", "UTC", {2025: agg})
+    pipeline.predict_year_mbti(aggregates)
+    assert agg.mbti is None and aggregates.mbti_model_version is None
+    assert pipeline.analysis_params(2025, "UTC")["mbti_model"] is None
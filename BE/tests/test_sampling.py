@@ -0,0 +1,49 @@
+"""
+The topic sample is drawn by conversation, and its interval keeps a floor
+when every prompt sampled has the same topic.
+"""
+import hashlib
+
+import pytest
+
+from services.sampling import TopicSampler, conversation_clusters, sample_topics
+
+
+def digest(row):
+    return hashlib.blake2b(str(row).encode(), digest_size=16).digest()
+
+
+def frame(conversations, month=1):
+    """Sampler and row texts of `conversations` lists of labels, all in one month."""
+    sampler = TopicSampler()
+    texts = []
+    for cluster, labels in enumerate(conversations):
+        for label in labels:
+            sampler.add(digest(len(texts)), month, len(texts), cluster)
+            texts.append(label)
+    return sampler, texts
+
+
+def test_interval_does_not_collapse_when_the_sample_is_one_topic():
+    sampler, texts = frame([["Programming"] * 10] * 100)
+    estimate = sample_topics({2025: sampler}, texts.__getitem__, list, min_samples=40, max_samples=40)[2025].estimate
+    assert estimate.share == pytest.approx(1.0) and estimate.sample_size == 40
+    assert estimate.low < 0.95 and estimate.high == 1.0
+
+
+def test_sample_takes_a_few_prompts_from_each_conversation():
+    sampler, texts = frame([[f"c{c}"] * 10 for c in range(100)])
+    labels = sample_topics(
+        {2025: sampler}, texts.__getitem__, list, min_samples=40, max_samples=40, per_conversation=2
+    )[2025].label_counts
+    assert len(labels) == 20 and set(labels.values()) == {2}
+
+
+def test_exhaustive_sample_is_exact():
+    sampler, texts = frame([["Programming"] * 3, ["Education"] * 1])
+    estimate = sample_topics({2025: sampler}, texts.__getitem__, list, exhaustive=True)[2025].estimate
+    assert (estimate.share, estimate.low, estimate.high) == (0.75, 0.75, 0.75)
+
+
+def test_conversations_without_a_unique_id_cluster_by_first_row():
+    assert conversation_clusters(["a", None, "a", "b"], [2, 1, 3, 1]) == ["a", "\0" "2", "\0" "3", "b"]
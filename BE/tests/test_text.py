@@ -0,0 +1,90 @@
+"""
+Parity of the fused `normalize_prompts` with the original row-by-row
+`process_text` (baseline search.py), which is kept here verbatim as the
+reference. Uses the NLTK corpora when installed, otherwise a fixed stopword
+list and a toy lemmatizer; the regex passes are what is under test.
+"""
+import random
+import re
+
+import pandas as pd
+
+import services.text as text
+
+
+def reference_process_text(df, field, remove_words, lemmatizer):
+    df[field] = df[field].str.lower()
+
+    for i in range(len(df)):
+        post_temp = df._get_value(i, field)
+        pattern = re.compile(r'https?://[a-zA-Z0-9./-]*/[a-zA-Z0-9?=_.]*[_0-9.a-zA-Z/-]*')
+        post_temp = re.sub(pattern, ' ', post_temp)
+        df._set_value(i, field, post_temp)
+
+    for i in range(len(df)):
+        post_temp = df._get_value(i, field)
+        pattern = re.compile(r'[0-9]')
+        post_temp = re.sub(pattern, ' ', post_temp)
+        pattern = re.compile(r'\W+')
+        post_temp = re.sub(pattern, ' ', post_temp)
+        pattern = re.compile(r'[_+]')
+        post_temp = re.sub(pattern, ' ', post_temp)
+        df._set_value(i, field, post_temp)
+
+    for i in range(len(df)):
+        post_temp = df._get_value(i, field)
+        pattern = re.compile(r'\s+')
+        post_temp = re.sub(pattern, ' ', post_temp)
+        df._set_value(i, field, post_temp)
+
+    for i in range(df.shape[0]):
+        post_temp = df._get_value(i, field)
+        post_temp = " ".join([w for w in post_temp.split(' ') if w not in remove_words])
+        df._set_value(i, field, post_temp)
+
+    for i in range(df.shape[0]):
+        post_temp = df._get_value(i, field)
+        post_temp = " ".join([lemmatizer.lemmatize(w) for w in post_temp.split(' ')])
+        df._set_value(i, field, post_temp)
+
+    return df
+
+
+PIECES = [
+    "Hello", "WORLD", "the", "is", "cats", "running", "don't", "it's", "I", "a",
+    "https://example.com/path?q=1_2", "http://x.io/a/b.c", "https://", "www.site.org",
+    "123", "4.5", "x2", "snake_case", "a+b", "C++", "e-mail", "naïve", "Straße", "日本語", "ÉCOLE",
+    "!!!", "...", "?", "(x)", "#tag", "@user", "$100", "50%", "--", "_", "__init__", "٣", "½",
+    " ", "  ", "\t", "\n", "\r\n", " ", " ", "",
+]
+
+
+def random_prompt(rng: random.Random) -> str:
+    parts = [rng.choice(PIECES) for _ in range(rng.randint(0, 12))]
+    return "".join(part + rng.choice(["", " ", "  ", "\n", ",", "/"]) for part in parts)
+
+
+def assert_parity(prompts, nlp):
+    remove_words, lemmatizer = nlp
+    expected = reference_process_text(pd.DataFrame({"prompt": prompts}), "prompt", remove_words, lemmatizer)
+    actual = text.normalize_prompts(pd.Series(prompts))
+    mismatches = [
+        (prompt, want, got)
+        for prompt, want, got in zip(prompts, expected["prompt"], actual)
+        if want != got
+    ]
+    assert not mismatches, mismatches[:5]
+
+
+def test_normalize_prompts_matches_process_text_on_edge_cases(nlp):
+    assert_parity(PIECES + [" ".join(PIECES), "".join(PIECES), "the the the", "   leading and trailing   "], nlp)
+
+
+def test_normalize_prompts_matches_process_text_on_random_prompts(nlp):
+    rng = random.Random(0)
+    assert_parity([random_prompt(rng) for _ in range(5000)], nlp)
+
+
+def test_normalize_prompts_keeps_the_index(nlp):
+    prompts = pd.Series(["Cats and dogs", "https://a.b/c d"], index=[7, 3])
+    assert text.normalize_prompts(prompts).index.tolist() == [7, 3]